@@ -0,0 +1,434 @@
+# -*- coding: utf-8 -*-
+"""
+Log statistics for sed log maker
+
+Works out facies proportions, thickness by facies and grain size, fining and
+coarsening trends and facies transition counts from the same integer-coded
+units drawLog uses, without going back to the CSVs. Totals are built up with
+one pass of NumPy counting per chunk, so logs can be added a chunk or a file
+at a time and the totals of separate runs merged, e.g.
+
+    stats = analytics.LogStats()
+    stats.addFile('examples/test_long.csv')
+    stats.addLog(lg)                  # a drawings.Log with data set
+    stats.proportions()               # one row per facies
+    stats.transitions(self_transitions = False, probabilities = True)
+
+or from the command line, writing each table to a CSV:
+
+    python analytics.py "logs/*.csv" --config campaign.json --out stats
+"""
+
+import argparse
+import glob
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+import drawings as dr
+import backends
+import ingest
+
+# Direction of grain size change up through a unit. Grain size codes run from
+# finest to coarsest; units with no grain size at their base have no trend
+TRENDS = ('fining', 'coarsening', 'constant', 'none')
+
+#%% Accumulation
+
+class LogStats:
+    '''
+    Running totals of the units of one or more logs.
+
+    Parameters
+    ----------
+    gs_codes : pd.Series, optional
+        Grain size codes, as created with grainsize(). The default is None,
+        which uses grainsize().
+    fcodes, fcolors : pd.Series, optional
+        Facies lookup, as created with faciesList(). The default is None,
+        which uses faciesList(). Colours are only used by draw().
+    nachar : str, optional
+        String specifying what blank cells contain. The default is 'NaN'.
+
+    Attributes
+    ----------
+    logs : int
+        Number of logs added.
+    units : np.ndarray
+        Number of units of each facies and base grain size, shape
+        (len(fcodes), len(gs_codes)).
+    thickness : np.ndarray
+        Thickness (in m) of each facies and base grain size.
+    trend_units, trend_thickness : np.ndarray
+        Number and thickness of units of each facies with each trend in
+        TRENDS, shape (len(fcodes), len(TRENDS)).
+    transition_counts : np.ndarray
+        Number of times each facies (rows) is followed by each facies
+        (columns) going up a log.
+    '''
+    def __init__(self, gs_codes = None, fcodes = None, fcolors = None, nachar = 'NaN'):
+        if gs_codes is None:
+            gs_codes, _ = dr.grainsize()
+        if fcodes is None:
+            fcodes, fcolors = dr.faciesList()
+        self.gs_codes = np.asarray(gs_codes)
+        self.fcodes = np.asarray(fcodes)
+        self.fcolors = None if fcolors is None else np.asarray(fcolors, dtype=object)
+        self.nachar = nachar
+        nf, ng = len(self.fcodes), len(self.gs_codes)
+        self.logs = 0
+        self.units = np.zeros((nf, ng), dtype=np.int64)
+        self.thickness = np.zeros((nf, ng))
+        self.trend_units = np.zeros((nf, len(TRENDS)), dtype=np.int64)
+        self.trend_thickness = np.zeros((nf, len(TRENDS)))
+        self.transition_counts = np.zeros((nf, nf), dtype=np.int64)
+        # Facies of the last unit added, to carry transitions over chunks
+        self._last = -1
+
+    def __repr__(self):
+        return f'LogStats({self.logs} logs, {self.units.sum()} units, {self.thickness.sum():.2f} m)'
+
+    def add(self, thickness, base_idx, top_idx, fac_idx, new_log = True):
+        '''
+        Adds a run of units, given as positions in the lookups (as in
+        ValidatedLog). Units with a facies or base grain size missing from the
+        lookups (-1) are left out.
+
+        Parameters
+        ----------
+        thickness : array-like
+            Thickness (in m) of each unit.
+        base_idx, top_idx, fac_idx : array-like
+            Position of each unit's grain size at base and top in gs_codes and
+            its facies in fcodes. A top_idx of -1 means constant grain size.
+        new_log : bool, optional
+            Whether the units start a new log. Pass False for the second and
+            later chunks of a log so transitions across chunk boundaries are
+            counted. The default is True.
+
+        Returns
+        -------
+        self : LogStats
+            So that calls can be chained.
+
+        '''
+        thickness = np.asarray(thickness, dtype=float)
+        base_idx = np.asarray(base_idx, dtype=np.intp)
+        top_idx = np.asarray(top_idx, dtype=np.intp)
+        fac_idx = np.asarray(fac_idx, dtype=np.intp)
+        top_idx = np.where(top_idx < 0, base_idx, top_idx)
+        nf, ng = len(self.fcodes), len(self.gs_codes)
+        if new_log is True:
+            self.logs += 1
+            self._last = -1
+
+        ok = (fac_idx >= 0) & (base_idx >= 0) & (top_idx >= 0) & ~np.isnan(thickness)
+        f, b, t, th = fac_idx[ok], base_idx[ok], top_idx[ok], thickness[ok]
+        cell = f * ng + b
+        self.units += np.bincount(cell, minlength = nf * ng).reshape(nf, ng)
+        self.thickness += np.bincount(cell, weights = th, minlength = nf * ng).reshape(nf, ng)
+
+        trend = np.where(t < b, 0, np.where(t > b, 1, 2))
+        trend[self.gs_codes[b] == self.nachar] = 3
+        cell = f * len(TRENDS) + trend
+        self.trend_units += np.bincount(cell, minlength = nf * len(TRENDS)).reshape(nf, len(TRENDS))
+        self.trend_thickness += np.bincount(cell, weights = th, minlength = nf * len(TRENDS)).reshape(nf, len(TRENDS))
+
+        # Transitions between each unit and the next, including the last unit
+        # of the previous chunk
+        seq = np.concatenate(([self._last], f)) if self._last >= 0 else f
+        if len(seq) > 1:
+            pairs = seq[:-1] * nf + seq[1:]
+            self.transition_counts += np.bincount(pairs, minlength = nf * nf).reshape(nf, nf)
+        if len(f) > 0:
+            self._last = f[-1]
+        return self
+
+    def addValidated(self, validated, thickness = None, new_log = True):
+        '''
+        Adds a log checked with validateLog() or validateUnits(). thickness is
+        needed if it was not checked along with the log.
+
+        '''
+        if(validated.matches(self.gs_codes, self.fcodes) is False):
+            raise ValueError('validated was checked against different grain size or facies codes to these statistics.')
+        if thickness is None:
+            thickness = validated.thickness
+        if thickness is None:
+            raise ValueError('No thicknesses to add. Validate the log with its thicknesses or pass thickness.')
+        return self.add(thickness, validated.base_idx, validated.top_idx, validated.fac_idx, new_log)
+
+    def addLog(self, lg):
+        '''
+        Adds a drawings.Log (with data set), a logfile.StoredLog or a
+        ValidatedLog holding thicknesses.
+
+        '''
+        if isinstance(lg, dr.ValidatedLog):
+            return self.addValidated(lg)
+        if isinstance(lg, dr.Log):
+            if lg._data is None:
+                raise ValueError('No log to add. Call setData() first.')
+            validated = lg._validated
+        else:
+            validated = lg.validated()
+        return self.addValidated(validated, np.diff(np.asarray(lg.elevations, dtype=float)))
+
+    def addFile(self, path, chunksize = 100000, columns = None):
+        '''
+        Adds a log CSV (in the format of the example files) a chunk at a time,
+        or a binary log file written by logfile.py.
+
+        Parameters
+        ----------
+        path : str
+            Path to the file.
+        chunksize : int, optional
+            Number of units read at once. The default is 100000.
+        columns : dict, optional
+            Names of the thickness, gs_base, gs_top and facies columns if they
+            differ from those in ingest.DEFAULT_COLUMNS. The default is None.
+
+        '''
+        if path.endswith('.npz'):
+            import logfile
+            return self.addLog(logfile.loadLog(path))
+        names = ingest._names(columns)
+        new_log = True
+        for chunk in ingest.readChunks(path, chunksize, names):
+            validated = dr.validateUnits(chunk[names['gs_base']], chunk[names['gs_top']], chunk[names['facies']],
+                                         self.gs_codes, self.fcodes, thickness = chunk[names['thickness']],
+                                         nachar = self.nachar, index = chunk.index)
+            validated.raiseErrors()
+            self.addValidated(validated, new_log = new_log)
+            new_log = False
+        return self
+
+    def merge(self, other):
+        '''
+        Adds the totals of another LogStats with the same lookups, e.g. one
+        built in another process.
+
+        '''
+        if((np.array_equal(self.gs_codes, other.gs_codes) and np.array_equal(self.fcodes, other.fcodes)) is False):
+            raise ValueError('Statistics with different grain size or facies codes cannot be merged.')
+        self.logs += other.logs
+        self.units += other.units
+        self.thickness += other.thickness
+        self.trend_units += other.trend_units
+        self.trend_thickness += other.trend_thickness
+        self.transition_counts += other.transition_counts
+        return self
+
+    #%% Tables
+
+    def proportions(self):
+        '''
+        Returns the number of units and thickness of each facies present,
+        with each as a fraction of the total.
+
+        Returns
+        -------
+        table : pd.DataFrame
+            Columns facies, units, thickness, unit_fraction and
+            thickness_fraction.
+
+        '''
+        units = self.units.sum(axis = 1)
+        thickness = self.thickness.sum(axis = 1)
+        present = units > 0
+        return pd.DataFrame({'facies': self.fcodes[present],
+                             'units': units[present],
+                             'thickness': thickness[present],
+                             'unit_fraction': units[present]/max(units.sum(), 1),
+                             'thickness_fraction': thickness[present]/(thickness.sum() or 1)})
+
+    def grainSizes(self):
+        '''
+        Returns the number of units and thickness of each facies at each
+        grain size (at the base of the unit), with cumulative thickness up
+        the grain sizes of each facies.
+
+        Returns
+        -------
+        table : pd.DataFrame
+            Columns facies, grain_size, units, thickness and
+            cumulative_thickness.
+
+        '''
+        f, g = np.nonzero(self.units)
+        cumulative = np.cumsum(self.thickness, axis = 1)
+        return pd.DataFrame({'facies': self.fcodes[f],
+                             'grain_size': self.gs_codes[g],
+                             'units': self.units[f, g],
+                             'thickness': self.thickness[f, g],
+                             'cumulative_thickness': cumulative[f, g]})
+
+    def trends(self):
+        '''
+        Returns the number of units and thickness of each facies that fine
+        upwards, coarsen upwards or keep a constant grain size (see TRENDS).
+
+        Returns
+        -------
+        table : pd.DataFrame
+            Columns facies, trend, units and thickness.
+
+        '''
+        f, t = np.nonzero(self.trend_units)
+        return pd.DataFrame({'facies': self.fcodes[f],
+                             'trend': np.asarray(TRENDS)[t],
+                             'units': self.trend_units[f, t],
+                             'thickness': self.trend_thickness[f, t]})
+
+    def transitions(self, self_transitions = True, probabilities = False):
+        '''
+        Returns the facies transition matrix, for Markov chain analysis.
+        Only facies present are included.
+
+        Parameters
+        ----------
+        self_transitions : bool, optional
+            Count units followed by a unit of the same facies. Set to False
+            for an embedded Markov chain. The default is True.
+        probabilities : bool, optional
+            Divide each row by its total, giving the probability of each
+            facies following the facies of that row. The default is False.
+
+        Returns
+        -------
+        matrix : pd.DataFrame
+            Transitions from the facies of each row (index 'from') to the
+            facies of each column ('to').
+
+        '''
+        present = self.units.sum(axis = 1) > 0
+        counts = self.transition_counts[np.ix_(present, present)]
+        if self_transitions is False:
+            counts = counts - np.diag(np.diag(counts))
+        if probabilities is True:
+            totals = counts.sum(axis = 1, keepdims = True)
+            counts = np.divide(counts, totals, out = np.zeros(counts.shape), where = totals > 0)
+        codes = self.fcodes[present]
+        return pd.DataFrame(counts,
+                            index = pd.Index(codes, name = 'from'),
+                            columns = pd.Index(codes, name = 'to'))
+
+    #%% Drawing
+
+    def draw(self, canv, x = None, y = None, width = 150):
+        '''
+        Draws a summary panel, with a bar for the share of the total thickness
+        taken up by each facies and the share of fining, coarsening and
+        constant units, e.g. beside a log drawn on the same canvas.
+
+        Parameters
+        ----------
+        canv : drawSvg object or render backend
+            Canvas to draw on.
+        x, y : float, optional
+            Top left corner (in pt) of the panel. The default is None, which
+            puts it in the top right corner of the canvas.
+        width : float, optional
+            Width (in pt) of the panel. The default is 150.
+
+        Returns
+        -------
+        d : drawSvg object or render backend
+            The canvas with the panel drawn on.
+
+        '''
+        if self.fcolors is None:
+            raise ValueError('No facies colours to draw with. Pass fcolors when making the statistics.')
+        d = backends.asBackend(canv)
+        if x is None:
+            x = d.width - width - 5
+        if y is None:
+            y = d.height - 5
+        row = 12
+        bar = width - 75
+
+        d.text('Facies (% of thickness)', 10, x, y - row)
+        table = self.proportions()
+        colors = self.fcolors[dr.codeIndex(table.facies.to_numpy(), self.fcodes)]
+        y -= 2 * row
+        for code, share, color in zip(table.facies, table.thickness_fraction, colors):
+            d.text(f'{code}', 8, x, y)
+            d.rect(x + 40, y - 1, max(bar * share, 0.5), 8, fill = color, stroke_width = 0.5)
+            d.text(f'{share*100:.1f}', 8, x + 40 + bar * share + 3, y)
+            y -= row
+
+        y -= row
+        d.text('Trends (% of units)', 10, x, y)
+        y -= row
+        units = self.trend_units.sum(axis = 0)
+        for name, n in zip(TRENDS[:3], units[:3]):
+            d.text(f'{name}: {n} ({n/max(units.sum(), 1)*100:.1f})', 8, x, y)
+            y -= row
+        return d.result()
+
+def _fileStats(path, gs_codes, fcodes, fcolors, nachar, chunksize, columns):
+    return LogStats(gs_codes, fcodes, fcolors, nachar).addFile(path, chunksize, columns)
+
+def logStats(paths, gs_codes = None, fcodes = None, fcolors = None, nachar = 'NaN',
+             chunksize = 100000, columns = None, jobs = 1):
+    '''
+    Adds up the statistics of several log files, reading them in separate
+    processes if jobs is not 1. Arguments are as for LogStats and
+    LogStats.addFile().
+
+    Returns
+    -------
+    stats : LogStats
+        Totals over every file.
+
+    '''
+    stats = LogStats(gs_codes, fcodes, fcolors, nachar)
+    if jobs == 1:
+        for path in paths:
+            stats.addFile(path, chunksize, columns)
+        return stats
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers = jobs) as pool:
+        futures = [pool.submit(_fileStats, path, stats.gs_codes, stats.fcodes, stats.fcolors,
+                               nachar, chunksize, columns)
+                   for path in paths]
+        for f in futures:
+            stats.merge(f.result())
+    return stats
+
+#%% Command line
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog = 'analytics',
+                                     description = 'Work out facies and grain size statistics over log files.')
+    parser.add_argument('inputs', nargs = '+', help = 'CSV or binary log files, or glob patterns')
+    parser.add_argument('-o', '--out', default = '.', help = 'Output directory (default: current directory)')
+    parser.add_argument('-c', '--config', help = 'JSON config file (as for sedlog.py) giving lookups')
+    parser.add_argument('-j', '--jobs', type = int, default = None, help = 'Worker processes (default: all cores)')
+    args = parser.parse_args(argv)
+
+    import sedlog
+    config = sedlog.loadConfig(args.config)
+    gs_codes, _, fcodes, fcolors = sedlog.lookups(config)
+    columns = {'thickness': config['thickness'], 'gs_base': config['gs_base'],
+               'gs_top': config['gs_top'], 'facies': config['facies_col']}
+    paths = sorted({p for pattern in args.inputs for p in glob.glob(pattern, recursive = True)})
+    if not paths:
+        parser.error('No input files matched.')
+    stats = logStats(paths, gs_codes, fcodes, fcolors, config['nachar'],
+                     chunksize = config['chunksize'] or 100000, columns = columns, jobs = args.jobs)
+    os.makedirs(args.out, exist_ok = True)
+    tables = {'proportions': stats.proportions(),
+              'grain_sizes': stats.grainSizes(),
+              'trends': stats.trends(),
+              'transitions': stats.transitions()}
+    for name, table in tables.items():
+        table.to_csv(os.path.join(args.out, f'{name}.csv'), index = name == 'transitions')
+    print(f'{stats!r} -> {args.out}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
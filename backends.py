@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+"""
+Render backends for sed log maker
+
+drawLog and drawKey only ever draw through the handful of methods below, so
+the same drawing code can either build a drawSvg object tree (DrawSvgBackend)
+or write SVG straight to a file as it goes (SvgStream).
+"""
+
+import io
+import numpy as np
+import lazy
+# Only DrawSvgBackend needs drawSvg, so it is imported on first use
+draw = lazy.LazyModule('drawSvg', 'drawsvg')
+
+def escape(text):
+    '''
+    Escapes &, < and > in text, as xml.sax.saxutils.escape does (which takes
+    longer to import than the rest of this module).
+
+    '''
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+def asBackend(canv):
+    '''
+    Returns canv unchanged if it is already a render backend, otherwise wraps
+    a drawSvg.Drawing in a DrawSvgBackend.
+
+    '''
+    if hasattr(canv, 'polygon') and hasattr(canv, 'result'):
+        return canv
+    return DrawSvgBackend(canv)
+
+class DrawSvgBackend:
+    '''
+    Compatibility backend which appends drawSvg objects to a drawSvg.Drawing.
+    Use result() to get the Drawing back for saving.
+    '''
+    def __init__(self, drawing):
+        self.drawing = drawing
+        self.width = drawing.width
+        self.height = drawing.height
+        self.styles = {}
+        self.clips = {}
+
+    def defineStyles(self, fills, stroke = 'black', stroke_width = 0.5):
+        '''
+        Registers one polygon style per fill colour. Styles are referred to by
+        their position in fills.
+
+        '''
+        self.styles = {i: {'fill': f, 'stroke': stroke, 'stroke_width': stroke_width}
+                       for i, f in enumerate(fills)}
+        # Named clip paths belong to the log being drawn
+        self.clips = {}
+
+    def clipRect(self, x1, y1, x2, y2, name = None):
+        '''
+        Returns a rectangular clip path. Clip paths given a name are only
+        built once and shared by every later call with the same name.
+
+        '''
+        if name in self.clips:
+            return self.clips[name]
+        clip = draw.ClipPath()
+        clip.append(draw.Lines(x1, y1,
+                               x2, y1,
+                               x2, y2,
+                               x1, y2))
+        if name is not None:
+            self.clips[name] = clip
+        return clip
+
+    def polygon(self, coords, style, clip = None):
+        self.drawing.append(draw.Lines(*coords,
+                                       close = True,
+                                       **self.styles[style],
+                                       clip_path = clip))
+
+    def lines(self, coords, stroke_width = 0.5):
+        self.drawing.append(draw.Lines(*coords,
+                                       fill = 'none',
+                                       stroke = 'black',
+                                       stroke_width = stroke_width))
+
+    def rect(self, x, y, width, height, fill, stroke_width = 1):
+        self.drawing.append(draw.Rectangle(x, y, width, height,
+                                           fill = fill,
+                                           stroke_width = stroke_width,
+                                           stroke = 'black'))
+
+    def text(self, text, size, x, y, text_anchor = None):
+        if text_anchor is None:
+            self.drawing.append(draw.Text(text, size, x = x, y = y))
+        else:
+            self.drawing.append(draw.Text(text, size, x, y, text_anchor = text_anchor))
+
+    def pathText(self, text, size, x1, y1, x2, y2):
+        p = draw.Line(x1, y1, x2, y2,
+                      stroke_width = 0, fill = 'none')
+        self.drawing.append(draw.Text(text, size,
+                                      path = p, valign = 'middle', text_anchor = 'start'))
+
+    def result(self):
+        return self.drawing
+
+class SvgStream:
+    '''
+    Streaming backend which writes every element to a file as soon as it is
+    drawn, so memory use does not grow with the length of the log. Polygon
+    styles are written once as CSS classes rather than repeated on every unit.
+    Coordinates match those written by drawSvg 1.9.
+
+    Parameters
+    ----------
+    out : str or file-like
+        Path to write the SVG to, or an open text stream.
+    width : float
+        Width of canvas in pt.
+    height : float
+        Height of canvas in pt.
+    precision : int, optional
+        Number of decimal places to round coordinates to. Setting this also
+        turns on compact output: horizontal labels are written as plain text
+        rather than text on a path, and plain lines share a CSS class. With
+        precision = 2, examples/test_long.csv at 1:250 with facies labels
+        comes out about 2.3 times smaller (163 kB to 72 kB), but no longer
+        matches drawSvg exactly. The default is None, which writes full
+        precision.
+
+    Call close() (or use as a context manager) to finish the file.
+
+    Drawing between beginFragment() and endFragment() is also returned as a
+    self-contained string (with ids unique to the fragment), which can be
+    written again later with writeFragment(). drawLog uses this to reuse units
+    from a cache.FragmentCache.
+
+    Use detached() to draw part of a canvas somewhere else, e.g. in another
+    process, and writeFragment() to add the result.
+    '''
+    def __init__(self, out, width, height, precision = None):
+        if out is None:
+            self.file = io.StringIO()
+            self._owned = False
+        elif isinstance(out, str):
+            self.file = open(out, 'w', encoding = 'utf-8')
+            self._owned = True
+        else:
+            self.file = out
+            self._owned = False
+        self.width = width
+        self.height = height
+        self.precision = precision
+        self._ids = 0
+        self._idprefix = 'd'
+        self._styles = 0
+        self._outer = None
+        self._clips = set()
+        self.prefix = 'f'
+        self._header = out is not None
+        if self._header is False:
+            return
+        self.file.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                        '<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink"\n'
+                        f'     width="{width}" height="{height}" viewBox="0 {-height} {width} {height}">\n')
+        if precision is not None:
+            self.file.write('<style type="text/css"><![CDATA[\n'
+                            '.ln { fill: none; stroke: black; stroke-width: 0.5; }\n'
+                            ']]></style>\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @classmethod
+    def detached(cls, width, height, prefix, ids, precision = None):
+        '''
+        Returns a stream with no SVG header that draws into a string, for
+        drawing part of a canvas separately. prefix must be the prefix of the
+        canvas the part belongs to (after its defineStyles call) and ids a
+        prefix for element ids unique within that canvas. Get the text with
+        getvalue().
+
+        '''
+        d = cls(None, width, height, precision)
+        d.prefix = prefix
+        d._idprefix = ids
+        return d
+
+    def getvalue(self):
+        return self.file.getvalue()
+
+    def _id(self):
+        self._ids += 1
+        return f'{self._idprefix}{self._ids - 1}'
+
+    def beginFragment(self, key):
+        self._outer = (self.file, self._ids, self._idprefix)
+        self.file = io.StringIO()
+        self._ids = 0
+        self._idprefix = f'u{key[:16]}-'
+
+    def endFragment(self):
+        text = self.file.getvalue()
+        self.file, self._ids, self._idprefix = self._outer
+        self._outer = None
+        self.file.write(text)
+        return text
+
+    def writeFragment(self, text):
+        self.file.write(text)
+
+    def _num(self, v):
+        if self.precision is not None:
+            # Shortest form of the rounded number, e.g. 40 rather than 40.00
+            v = f'{float(v):.{self.precision}f}'
+            if '.' in v:
+                v = v.rstrip('0').rstrip('.')
+            return '0' if v == '-0' else v
+        # Write numbers the way drawSvg does, ints without a decimal point
+        return str(int(v)) if isinstance(v, (int, np.integer)) else str(float(v))
+
+    def _path(self, coords, close = False):
+        pts = [f'{self._num(coords[i])},{self._num(-coords[i+1])}' for i in range(0, len(coords), 2)]
+        d = 'M' + ' L'.join(pts)
+        if close:
+            d += ' Z'
+        return d
+
+    def defineStyles(self, fills, stroke = 'black', stroke_width = 0.5):
+        # Each call gets its own class prefix so several logs can share a file
+        self.prefix = f'f{self._styles}-' if self._styles else 'f'
+        self._styles += 1
+        rules = '\n'.join(f'.{self.prefix}{i} {{ fill: {f}; stroke: {stroke}; stroke-width: {stroke_width}; }}'
+                          for i, f in enumerate(fills))
+        self.file.write(f'<style type="text/css"><![CDATA[\n{rules}\n]]></style>\n')
+
+    def clipRect(self, x1, y1, x2, y2, name = None):
+        # Named clip paths are written once and referred to by name after that
+        if name is None:
+            cid = self._id()
+        else:
+            cid = f'{self.prefix}{name}'
+            if cid in self._clips:
+                return cid
+            self._clips.add(cid)
+        self.file.write(f'<clipPath id="{cid}">\n'
+                        f'<path d="{self._path((x1, y1, x2, y1, x2, y2, x1, y2))}" />\n'
+                        '</clipPath>\n')
+        return cid
+
+    def polygon(self, coords, style, clip = None):
+        clip = '' if clip is None else f' clip-path="url(#{clip})"'
+        if((self.precision is not None) and (len(coords) == 8)
+           and (coords[1] == coords[3]) and (coords[5] == coords[7]) and (coords[0] == coords[6])):
+            # Units have flat tops and bases, so write them with horizontal moves
+            x1, y1, x2, _, x3, y2 = coords[:6]
+            d = f'M{self._num(x1)},{self._num(-y1)} H{self._num(x2)} L{self._num(x3)},{self._num(-y2)} H{self._num(x1)} Z'
+        else:
+            d = self._path(coords, close = True)
+        self.file.write(f'<path d="{d}" class="{self.prefix}{style}"{clip} />\n')
+
+    def lines(self, coords, stroke_width = 0.5):
+        if self.precision is not None:
+            width = '' if stroke_width == 0.5 else f' stroke-width="{stroke_width}"'
+            self.file.write(f'<path d="{self._path(coords)}" class="ln"{width} />\n')
+            return
+        self.file.write(f'<path d="{self._path(coords)}" fill="none" stroke="black" stroke-width="{stroke_width}" />\n')
+
+    def rect(self, x, y, width, height, fill, stroke_width = 1):
+        self.file.write(f'<rect x="{self._num(x)}" y="{self._num(-(y + height))}" '
+                        f'width="{self._num(width)}" height="{self._num(height)}" '
+                        f'fill="{fill}" stroke-width="{stroke_width}" stroke="black" />\n')
+
+    def text(self, text, size, x, y, text_anchor = None):
+        anchor = '' if text_anchor is None else f' text-anchor="{text_anchor}"'
+        self.file.write(f'<text x="{self._num(x)}" y="{self._num(-y)}" font-size="{size}"{anchor} dy="0em">{escape(str(text))}</text>\n')
+
+    def pathText(self, text, size, x1, y1, x2, y2):
+        if((self.precision is not None) and (y1 == y2)):
+            # Horizontal text needs no path to run along
+            self.file.write(f'<text x="{self._num(x1)}" y="{self._num(-y1)}" font-size="{size}" dy="0.4em">{escape(str(text))}</text>\n')
+            return
+        pid = self._id()
+        self.file.write('<defs>\n'
+                        f'<path d="{self._path((x1, y1, x2, y2))}" stroke-width="0" fill="none" id="{pid}" />\n'
+                        '</defs>\n'
+                        f'<text font-size="{size}" text-anchor="start"><textPath xlink:href="#{pid}" startOffset="0">\n'
+                        f'<tspan dy="0.4em">{escape(str(text))}</tspan>\n'
+                        '</textPath></text>\n')
+
+    def result(self):
+        return self
+
+    def close(self):
+        if((self.file is None) or (self._header is False)):
+            return
+        self.file.write('</svg>\n')
+        if self._owned:
+            self.file.close()
+        self.file = None
@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for sed log maker
+
+Generates synthetic logs in the same layout as examples/test_long.csv and times
+elevs, drawLog, saveSvg and drawKey on them separately, recording wall time,
+peak memory and output size. Results are written as JSON so runs on different
+commits can be compared. For example:
+
+    python benchmark.py --sizes 100 1000 10000 --out before.json
+    python benchmark.py --sizes 100 1000 10000 --out after.json --compare before.json
+
+Logs of 10^5 units and above take minutes per case with the drawSvg canvas.
+Add --write-csv DIR to keep the generated logs, and --imports to also time
+importing each module in a fresh interpreter.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import drawings as dr
+import scales
+
+# Facies and grain sizes drawn from for each mix of synthetic log
+MIXES = {'varied': (None, None),                                          # All default codes
+         'fluvial': (['sm', 'sh', 'sp', 'st', 'sr', 'fsl', 'fcm', 'gcm'],
+                     ['cl', 'si', 'vf', 'f', 'm', 'c', 'vc', 'gr']),
+         'uniform': (['sm'], ['m'])}
+
+#%% Synthetic logs
+
+def syntheticLog(n, mix = 'varied', split = 0.05, seed = 0,
+                 vscale = 250, colheight = 747):
+    '''
+    Generates a random log with the columns of examples/test_long.csv.
+
+    Parameters
+    ----------
+    n : int
+        Number of units.
+    mix : str, optional
+        Facies and grain sizes to draw from, one of the keys of MIXES. The
+        default is 'varied'.
+    split : float, optional
+        Fraction of units thick enough to run over the top of a column (one
+        to three columns thick). The default is 0.05.
+    seed : int, optional
+        Seed for the random numbers, so the same log can be made again. The
+        default is 0.
+    vscale : int, optional
+        Vertical scale the log will be drawn at, used to size thick units. The
+        default is 250.
+    colheight : float, optional
+        Height (in pt) of the columns the log will be drawn in. The default is
+        747, a full letter page.
+
+    Returns
+    -------
+    log : pd.DataFrame
+        Synthetic log.
+
+    '''
+    rng = np.random.default_rng(seed)
+    fcodes, gs_codes = MIXES[mix]
+    if fcodes is None:
+        fcodes = list(dr.faciesList()[0][2:])
+    if gs_codes is None:
+        gs_codes = list(dr.grainsize()[0][1:])
+
+    col_m = scales.Scale(vscale).toMetres(colheight)
+    thick = rng.random(n) < split
+    thickness = np.where(thick,
+                         rng.uniform(1, 3, n) * col_m,
+                         rng.uniform(0.1, 3, n))
+    gs_base = rng.choice(gs_codes, n)
+    # Most units have no top grain size, as in the examples
+    gs_top = np.where(rng.random(n) < 0.3, rng.choice(gs_codes, n), '')
+    labels = np.where(rng.random(n) < 0.5,
+                      np.char.add('u', np.arange(1, n + 1).astype(str)), '')
+    return pd.DataFrame({'unit': np.arange(1, n + 1),
+                         'thickness': np.round(thickness, 2),
+                         'code': rng.choice(fcodes, n),
+                         'gs_base': gs_base,
+                         'gs_top': gs_top,
+                         'labels': labels})
+
+#%% Measurement
+
+def measure(fn, memory = True):
+    '''
+    Runs fn once for its wall time and, if memory is True, again under
+    tracemalloc for its peak memory (tracing slows it down too much to time
+    the same run).
+
+    Returns
+    -------
+    result, seconds, peak_bytes
+        Return value of fn, wall time and peak memory allocated (None if not
+        measured).
+
+    '''
+    start = time.perf_counter()
+    result = fn()
+    secs = time.perf_counter() - start
+    peak = None
+    if memory is True:
+        tracemalloc.start()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, secs, peak
+
+def benchCase(log, labels = 'facies', vscale = 250, memory = True, tmp = None):
+    '''
+    Times each phase of drawing one log.
+
+    Returns
+    -------
+    rows : list of dict
+        One record per phase with its time, peak memory and output size.
+
+    '''
+    gs_codes, gs_widths = dr.grainsize()
+    fcodes, fcolors = dr.faciesList()
+    if(labels == 'array'):
+        labels = log['labels'].replace('', 'NaN')
+    log = log.replace('', 'NaN')
+    rows = []
+
+    def record(phase, secs, peak, out_bytes = None):
+        rows.append({'phase': phase, 'seconds': secs, 'peak_bytes': peak, 'out_bytes': out_bytes})
+
+    elevations, secs, peak = measure(lambda: dr.elevs(log['thickness']), memory)
+    record('elevs', secs, peak)
+
+    def drawn():
+        return dr.drawLog(elevations, vscale, log['gs_base'], log['gs_top'], log['code'],
+                          gs_codes, gs_widths, fcodes, fcolors, dr.canvas(),
+                          labels = labels)
+    d, secs, peak = measure(drawn, memory)
+    record('drawLog', secs, peak)
+
+    path = os.path.join(tmp, 'log.svg')
+    _, secs, peak = measure(lambda: d.saveSvg(path), memory)
+    record('saveSvg', secs, peak, os.path.getsize(path))
+
+    key_path = os.path.join(tmp, 'key.svg')
+    _, secs, peak = measure(lambda: dr.drawKey(fcodes, fcolors, custom_rows = 'default').saveSvg(key_path), memory)
+    record('drawKey', secs, peak, os.path.getsize(key_path))
+    return rows
+
+# Modules timed by --imports, and the slow dependencies they might load
+IMPORTS = ['scales', 'layout', 'backends', 'drawings', 'sedlog', 'preview']
+HEAVY = ['numpy', 'pandas', 'drawSvg', 'drawsvg']
+
+def importTime(module, repeat = 5):
+    '''
+    Times importing a module in a fresh Python process, as a worker process
+    or the command line tools would. Takes the quickest of repeat runs.
+
+    Returns
+    -------
+    seconds : float
+        Time taken by the import statement.
+    loaded : list of str
+        Slow dependencies (from HEAVY) that the import loaded.
+
+    '''
+    code = ('import sys, time; t = time.perf_counter(); '
+            f'import {module}; t = time.perf_counter() - t; '
+            f'print(t, *[m for m in {HEAVY!r} if m in sys.modules])')
+    best = None
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-W', 'ignore', '-c', code],
+                             capture_output = True, text = True, check = True,
+                             cwd = os.path.dirname(os.path.abspath(__file__))).stdout.split()
+        if((best is None) or (float(out[0]) < best[0])):
+            best = (float(out[0]), out[1:])
+    return best
+
+def gitCommit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              capture_output = True, text = True, check = True,
+                              cwd = os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline):
+    '''
+    Prints the change in time and output size of every case also in baseline.
+
+    '''
+    def caseKey(r):
+        return (r['n'], r['mix'], r['split'], r['labels'], r['phase'])
+    old = {caseKey(r): r for r in baseline['results']}
+    print(f'\nCompared with {baseline.get("commit")} ({baseline.get("date")}):')
+    for r in results:
+        o = old.get(caseKey(r))
+        if o is None:
+            continue
+        ratio = r['seconds']/o['seconds'] if o['seconds'] else float('nan')
+        size = '' if not o['out_bytes'] else f'  size x{r["out_bytes"]/o["out_bytes"]:.2f}'
+        print(f'{r["phase"]:8} n={r["n"]:<8} {r["mix"]:8} split={r["split"]:<5} {str(r["labels"]):8}'
+              f' time x{ratio:.2f}{size}')
+
+#%% Command line
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog = 'benchmark',
+                                     description = 'Time sed log drawing on synthetic logs.')
+    parser.add_argument('--sizes', nargs = '+', type = int, default = [100, 1000, 10000],
+                        help = 'Numbers of units (default: 100 1000 10000)')
+    parser.add_argument('--mixes', nargs = '+', default = ['varied'], choices = list(MIXES),
+                        help = 'Facies and grain size mixes (default: varied)')
+    parser.add_argument('--splits', nargs = '+', type = float, default = [0.05],
+                        help = 'Fractions of units spanning columns (default: 0.05)')
+    parser.add_argument('--labels', nargs = '+', default = ['facies', 'numbers', 'array'],
+                        choices = ['facies', 'numbers', 'array', 'none'],
+                        help = 'Label modes (default: facies numbers array)')
+    parser.add_argument('--vscale', type = int, default = 250, help = 'Vertical scale (default: 250)')
+    parser.add_argument('--no-memory', action = 'store_true', help = 'Skip the peak memory runs')
+    parser.add_argument('--out', default = 'benchmark.json', help = 'Results file (default: benchmark.json)')
+    parser.add_argument('--compare', help = 'Earlier results file to compare against')
+    parser.add_argument('--write-csv', metavar = 'DIR', help = 'Also save the synthetic logs as CSVs')
+    parser.add_argument('--imports', action = 'store_true', help = 'Also time importing each module')
+    args = parser.parse_args(argv)
+
+    results = []
+    if args.imports is True:
+        for module in IMPORTS:
+            secs, loaded = importTime(module)
+            print(f'import {module:10} {secs:10.4f} s  loads {", ".join(loaded) or "nothing slow"}')
+            results.append({'phase': f'import {module}', 'seconds': secs, 'peak_bytes': None,
+                            'out_bytes': None, 'n': 0, 'mix': '', 'split': 0, 'labels': ''})
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.sizes:
+            for mix in args.mixes:
+                for split in args.splits:
+                    log = syntheticLog(n, mix, split, vscale = args.vscale)
+                    if args.write_csv is not None:
+                        os.makedirs(args.write_csv, exist_ok = True)
+                        log.to_csv(os.path.join(args.write_csv, f'synthetic_{n}_{mix}_{split}.csv'), index = False)
+                    for labels in args.labels:
+                        rows = benchCase(log, None if labels == 'none' else labels,
+                                         args.vscale, not args.no_memory, tmp)
+                        for r in rows:
+                            r.update(n = n, mix = mix, split = split, labels = labels)
+                            peak = '' if r['peak_bytes'] is None else f'{r["peak_bytes"]/2**20:9.2f} MB'
+                            size = '' if r['out_bytes'] is None else f'{r["out_bytes"]/2**10:10.1f} kB'
+                            print(f'{r["phase"]:8} n={n:<8} {mix:8} split={split:<5} {labels:8}'
+                                  f'{r["seconds"]:10.4f} s {peak} {size}')
+                        results.extend(rows)
+
+    report = {'commit': gitCommit(),
+              'date': datetime.now(timezone.utc).isoformat(timespec = 'seconds'),
+              'python': platform.python_version(),
+              'platform': platform.platform(),
+              'vscale': args.vscale,
+              'results': results}
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent = 1)
+    print(f'\nResults written to {args.out}')
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
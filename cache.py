@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk cache of rendered log fragments for sed log maker
+
+Each unit of a log drawn onto a streaming canvas is written as a self-contained
+SVG fragment. FragmentCache keeps those fragments between runs, keyed on a hash
+of everything that went into drawing the unit (its data, position and the
+render parameters), so re-rendering a log after editing it only redraws the
+units that actually changed. Editing one unit therefore only misses the cache
+from that unit upward, as the units below keep their positions.
+"""
+
+import hashlib
+import os
+import sqlite3
+import time
+
+class FragmentCache:
+    '''
+    Size-bounded, least recently used store of SVG fragments.
+
+    Parameters
+    ----------
+    path : str
+        Path to the cache file. Created if it does not exist.
+    max_bytes : int, optional
+        Maximum total size of fragments kept. Least recently used fragments are
+        evicted once this is exceeded. The default is 64 MB.
+
+    Attributes
+    ----------
+    hits, misses : int
+        Number of fragments found and not found since the cache was opened.
+    '''
+    def __init__(self, path, max_bytes = 64 * 2**20):
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok = True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.db = sqlite3.connect(path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS fragments ('
+                        'key TEXT PRIMARY KEY, fragment TEXT, size INTEGER, used REAL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS fragments_used ON fragments (used)')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def key(*items):
+        '''
+        Hashes any mix of strings, numbers, bytes and NumPy arrays into a
+        cache key.
+
+        '''
+        h = hashlib.sha1()
+        for item in items:
+            if hasattr(item, 'tobytes'):
+                item = item.tobytes()
+            elif not isinstance(item, bytes):
+                item = repr(item).encode()
+            h.update(len(item).to_bytes(8, 'little'))
+            h.update(item)
+        return h.hexdigest()
+
+    def getMany(self, keys):
+        '''
+        Looks up many keys at once.
+
+        Returns
+        -------
+        found : dict
+            Fragment for every key present in the cache.
+
+        '''
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        # Stay under SQLite's limit on query parameters
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            marks = ','.join('?' * len(batch))
+            rows = self.db.execute(f'SELECT key, fragment FROM fragments WHERE key IN ({marks})', batch)
+            found.update(rows.fetchall())
+        if found:
+            now = time.time()
+            self.db.executemany('UPDATE fragments SET used = ? WHERE key = ?',
+                                ((now, k) for k in found))
+            self.db.commit()
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def putMany(self, fragments):
+        '''
+        Stores a dict of key: fragment, then evicts the least recently used
+        fragments if the cache has grown past max_bytes.
+
+        '''
+        now = time.time()
+        self.db.executemany('INSERT OR REPLACE INTO fragments VALUES (?, ?, ?, ?)',
+                            ((k, f, len(f), now) for k, f in fragments.items()))
+        self.db.commit()
+        self._evict()
+
+    def _evict(self):
+        total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM fragments').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        stale = []
+        for key, size in self.db.execute('SELECT key, size FROM fragments ORDER BY used'):
+            stale.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self.db.executemany('DELETE FROM fragments WHERE key = ?', stale)
+        self.db.commit()
+
+    def stats(self):
+        '''
+        Returns hit and miss counts along with the current size of the cache.
+
+        '''
+        entries, size = self.db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM fragments').fetchone()
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'entries': entries,
+                'bytes': size}
+
+    def clear(self):
+        self.db.execute('DELETE FROM fragments')
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
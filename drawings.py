@@ -7,32 +7,31 @@ Created on Wed Aug 11 11:54:34 2021
 Functions for sed log maker
 """
 
-import pandas as pd
 import numpy as np
-try:
-    import drawSvg as draw
-except:
-    import drawsvg as draw
+import functools
+import os
+import time
 import warnings
-from importlib.metadata import version
+import layout
+import backends
+import lazy
+import profiling
+import scales
+# Only imported once they are needed, as they take far longer to import than
+# everything else here
+pd = lazy.LazyModule('pandas')
+draw = lazy.LazyModule('drawSvg', 'drawsvg')
+ingest = lazy.LazyModule('ingest')
 
 #%% Basic supporting functions
 
 def convert(measurement, in_unit:str, out_unit:str):
-    units = {'pt':1,
-             'mm':2.8346456692913,
-             'in':1/72}
-
-    if in_unit not in units.keys():
-        raise ValueError(f'Given input unit ({in_unit}) not supported! Please choose one of: {units.keys()}.')
-    if out_unit not in units.keys():
-        raise ValueError(f'Given input unit ({out_unit}) not supported! Please choose one of: {units.keys()}.')
-    
-    value_in_pt = measurement * units[in_unit]
-
-    output_value = value_in_pt * 1/(units[out_unit])
+    '''
+    Converts a measurement (or array of them) between 'pt', 'mm' and 'in'.
+    See scales.convert().
 
-    return output_value
+    '''
+    return scales.convert(measurement, in_unit, out_unit)
 
 def greater(x,y):
     '''
@@ -44,8 +43,22 @@ def greater(x,y):
     else:
         return y
 
+@functools.lru_cache(maxsize = None)
+def _drawSvgVersion():
+    # Package metadata is only read once per process
+    from importlib.metadata import version, PackageNotFoundError
+    for name in ('drawSvg', 'drawsvg'):
+        try:
+            return version(name)
+        except PackageNotFoundError:
+            pass
+    return None
+
 def verify_version():
-    ver = version('drawSvg')
+    ver = _drawSvgVersion()
+    if ver is None:
+        print('drawSvg is not installed. Install version 1.9 to draw logs.')
+        return
     print(f'Current drawSvg version = {ver}')
     ver = ver.rsplit('.',maxsplit=1)[0]
     ver = float(ver)
@@ -182,7 +195,347 @@ def faciesList(codes = None, colors = None):
     fcolors = pd.Series(fcolors)
     return fcodes, fcolors
 
-def elevs(thicknesses):
+def codeIndex(values, codes):
+    '''
+    Maps every value onto the position of its first match in a list of codes.
+    The lookup table is built once, so the cost is one dict lookup per value
+    (or one per category if values is categorical) rather than a scan of the
+    codes for every unit.
+
+    Parameters
+    ----------
+    values : array-like
+        Codes to look up, e.g. the grain size or facies column of a log.
+    codes : array-like
+        Lookup list of codes, e.g. as created with grainsize() or faciesList().
+
+    Returns
+    -------
+    idx : np.ndarray
+        Integer array with the position in codes of each value, or -1 where
+        the value is not present in codes.
+
+    '''
+    lookup = {}
+    for i, c in enumerate(np.asarray(codes)):
+        lookup.setdefault(c, i)
+
+    # Categorical input only needs its categories looking up
+    cat = getattr(values, 'cat', values)
+    if(hasattr(cat, 'categories') and hasattr(cat, 'codes')):
+        cat_idx = np.array([lookup.get(c, -1) for c in cat.categories] + [-1])
+        return cat_idx[np.asarray(cat.codes)]
+
+    values = np.asarray(values, dtype=object)
+    idx = np.fromiter((lookup.get(v, -1) for v in values), dtype=np.intp, count=len(values))
+    return idx
+
+def unitLookup(grain_base, grain_top, facies,
+               gs_codes, gs_widths, fcodes, fcolors,
+               nachar = 'NaN'):
+    '''
+    Resolves the grain sizes and facies of every unit into drawing widths and
+    fill colours in one pass.
+
+    Parameters
+    ----------
+    grain_base : array-like
+        Grain size at the base of each unit.
+    grain_top : array-like
+        Grain size at the top of each unit, containing nachar for units with
+        constant grain size.
+    facies : array-like
+        Facies code of each unit.
+    gs_codes, gs_widths : pd.Series
+        Grain size lookup, as created with grainsize().
+    fcodes, fcolors : pd.Series
+        Facies lookup, as created with faciesList().
+    nachar : str, optional
+        String specifying what blank cells contain. The default is 'NaN'.
+
+    Returns
+    -------
+    base_w : np.ndarray
+        Width (in pt) of each unit at its base.
+    top_w : np.ndarray
+        Width (in pt) of each unit at its top.
+    fill : np.ndarray
+        Hex colour of each unit.
+    fac_idx : np.ndarray
+        Position of each unit's facies in fcodes.
+
+    '''
+    v = validateUnits(grain_base, grain_top, facies, gs_codes, fcodes, nachar = nachar)
+    v.raiseErrors()
+    return v.lookup(gs_widths, fcolors)
+
+def _isna(values):
+    '''
+    Returns True for each blank (None or NaN) cell of an array. pandas is
+    only used, to catch its own missing values, if it is already loaded.
+
+    '''
+    values = np.asarray(values, dtype=object)
+    if pd.loaded:
+        return np.asarray(pd.isna(values), dtype=bool)
+    return np.array([(v is None) or (v != v) for v in values.ravel()], dtype=bool).reshape(values.shape)
+
+def _resolveCodes(values, codes, nachar = 'NaN'):
+    '''
+    Looks up values in codes, reading blank cells as nachar. Categorical
+    values are resolved per category without expanding them.
+
+    Returns
+    -------
+    idx : np.ndarray
+        Position of each value in codes, or -1.
+    blank : np.ndarray
+        True where the value is nachar or blank.
+    values : np.ndarray or pd.Categorical
+        Values in a form that can be indexed by row position.
+
+    '''
+    values = getattr(values, 'array', values)
+    if(hasattr(values, 'categories') and hasattr(values, 'codes')):
+        # Blank cells have category code -1, i.e. the extra slot at the end
+        cats = np.append(np.asarray(values.categories, dtype=object), nachar)
+        cat_codes = np.asarray(values.codes)
+        return codeIndex(cats, codes)[cat_codes], (cats == nachar)[cat_codes], values
+    values = np.asarray(values, dtype=object)
+    values = np.where(_isna(values), nachar, values)
+    return codeIndex(values, codes), values == nachar, values
+
+class ValidatedLog:
+    '''
+    Log data that has been through validateLog() or validateUnits(), with the
+    position of every grain size and facies in the lookup lists resolved.
+    Passing one to drawLog as validated skips its own checks.
+
+    Attributes
+    ----------
+    grain_base, grain_top, facies : np.ndarray or pd.Categorical
+        Codes as provided, with blank cells as nachar.
+    base_idx, top_idx, fac_idx : np.ndarray
+        Position of each code in gs_codes or fcodes (-1 where not present).
+        Units without a top grain size use their base grain size in top_idx.
+    thickness : np.ndarray or None
+        Unit thicknesses, if checked.
+    labels : np.ndarray or None
+        Unit labels, if checked.
+    gs_codes, fcodes : np.ndarray
+        Lookup lists the codes were checked against.
+    report : pd.DataFrame
+        One row per problem found, with columns row, column, value, level
+        ('error' or 'warning') and problem. Empty if nothing was found. Only
+        built (importing pandas) when first used.
+    '''
+    def __init__(self, grain_base, grain_top, facies,
+                 base_idx, top_idx, fac_idx,
+                 thickness, labels, gs_codes, fcodes, report = None):
+        self.grain_base = grain_base
+        self.grain_top = grain_top
+        self.facies = facies
+        self.base_idx = base_idx
+        self.top_idx = top_idx
+        self.fac_idx = fac_idx
+        self.thickness = thickness
+        self.labels = labels
+        self.gs_codes = gs_codes
+        self.fcodes = fcodes
+        # Problems are kept as (column, rows, values, level, problem) groups
+        # until report is asked for. A DataFrame report is used as given
+        self._report = None
+        if report is None:
+            self._problems = []
+        elif isinstance(report, list):
+            self._problems = report
+        else:
+            self._report = report
+            self._problems = [(column, list(g.row), list(g.value), level, problem)
+                              for (column, problem, level), g in report.groupby(['column', 'problem', 'level'], sort = False)]
+
+    def __len__(self):
+        return len(self.facies)
+
+    def __str__(self):
+        count = sum(len(rows) for _, rows, _, _, _ in self._problems)
+        if count == 0:
+            return f'Validated log of {len(self)} units: no problems found.'
+        lines = [f'Validated log of {len(self)} units: {count} problems found.']
+        for column, rows, values, level, problem in self._problems:
+            lines.append(f'{level.capitalize()} in {column}: {problem}. Values: '
+                         f'{", ".join(str(x) for x in values)} at indexes: {np.asarray(rows).tolist()}')
+        return '\n'.join(lines)
+
+    @property
+    def report(self):
+        if self._report is None:
+            columns = ['row', 'column', 'value', 'level', 'problem']
+            frames = [pd.DataFrame({'row': rows, 'column': column, 'value': values,
+                                    'level': level, 'problem': problem})
+                      for column, rows, values, level, problem in self._problems]
+            self._report = pd.concat(frames, ignore_index = True) if frames else pd.DataFrame(columns = columns)
+        return self._report
+
+    @property
+    def ok(self):
+        '''True if no errors were found. Warnings are allowed.'''
+        return all(level != 'error' for _, _, _, level, _ in self._problems)
+
+    def raiseErrors(self):
+        '''
+        Raises a single ValueError listing every error found, and warns about
+        any warnings.
+
+        '''
+        if self.ok is False:
+            raise ValueError(str(self))
+        if len(self._problems) > 0:
+            warnings.warn(str(self))
+
+    def matches(self, gs_codes, fcodes):
+        '''
+        Checks whether the log was validated against the given lookup lists.
+
+        '''
+        return (np.array_equal(self.gs_codes, np.asarray(gs_codes))
+                and np.array_equal(self.fcodes, np.asarray(fcodes)))
+
+    def lookup(self, gs_widths, fcolors):
+        '''
+        Returns width at base, width at top, fill colour and facies position
+        of each unit, as for unitLookup().
+
+        '''
+        if self.ok is False:
+            raise ValueError(str(self))
+        gs_widths = np.asarray(gs_widths, dtype=float)
+        fcolors = np.asarray(fcolors, dtype=object)
+        return gs_widths[self.base_idx], gs_widths[self.top_idx], fcolors[self.fac_idx], self.fac_idx
+
+def validateUnits(grain_base, grain_top, facies, gs_codes, fcodes,
+                  thickness = None, labels = None,
+                  nachar = 'NaN', max_label_len = None, index = None):
+    '''
+    Checks every unit of a log against the lookup lists in one pass, collecting
+    every problem found rather than stopping at the first.
+
+    Parameters
+    ----------
+    grain_base, grain_top, facies : array-like
+        Grain size at base, grain size at top (nachar or blank for units with
+        constant grain size) and facies code of each unit.
+    gs_codes : pd.Series
+        Grain size codes, as created with grainsize().
+    fcodes : pd.Series
+        Facies codes, as created with faciesList().
+    thickness : array-like, optional
+        Unit thicknesses, which must be numbers >= 0. The default is None.
+    labels : array-like, optional
+        Unit labels. The default is None.
+    nachar : str, optional
+        String specifying what blank cells contain. The default is 'NaN'.
+    max_label_len : int, optional
+        Labels longer than this many characters are reported as warnings.
+        The default is None.
+    index : array-like, optional
+        Row names to use in the report. Defaults to the index of grain_base if
+        it has one, otherwise row positions.
+
+    Returns
+    -------
+    validated : ValidatedLog
+        Resolved codes along with a report of any problems.
+
+    '''
+    if index is None:
+        index = getattr(grain_base, 'index', None)
+    index = np.arange(len(facies)) if index is None else np.asarray(index)
+    gs_codes = np.asarray(gs_codes)
+    fcodes = np.asarray(fcodes)
+    base_idx, _, grain_base = _resolveCodes(grain_base, gs_codes, nachar)
+    top_idx, top_blank, grain_top = _resolveCodes(grain_top, gs_codes, nachar)
+    fac_idx, _, facies = _resolveCodes(facies, fcodes, nachar)
+    # Units without a top grain size keep their base width
+    top_idx = np.where(top_blank, base_idx, top_idx)
+
+    checks = [('gs_base', grain_base, base_idx < 0, 'error', 'grain size not present in list of codes prescribed'),
+              ('gs_top', grain_top, (top_idx < 0) & ~top_blank, 'error', 'grain size not present in list of codes prescribed'),
+              ('facies', facies, fac_idx < 0, 'error', 'facies not present in list of facies codes')]
+    if thickness is not None:
+        thickness = np.asarray(thickness)
+        if thickness.dtype.kind not in 'biuf':
+            thickness = np.asarray(pd.to_numeric(thickness, errors = 'coerce'), dtype=float)
+        thickness = thickness.astype(float, copy = False)
+        checks.append(('thickness', thickness, ~(thickness >= 0), 'error', 'thickness is missing, not a number or negative'))
+    if labels is not None:
+        labels = np.where(_isna(labels), nachar, np.asarray(labels, dtype=object))
+        if(len(labels) != len(facies)):
+            checks.append(('labels', np.array([len(labels)]), np.array([True]), 'error',
+                           f'labels must be of same length as facies ({len(facies)})'))
+        elif max_label_len is not None:
+            lengths = np.fromiter((len(str(l)) for l in labels), dtype=np.intp, count=len(labels))
+            checks.append(('labels', labels, (lengths > max_label_len) & (labels != nachar), 'warning',
+                           f'label longer than {max_label_len} characters'))
+
+    problems = []
+    for column, values, bad, level, problem in checks:
+        rows = np.flatnonzero(bad)
+        if len(rows) > 0:
+            problems.append((column, index[rows] if len(values) == len(index) else rows,
+                             np.asarray(values[rows]), level, problem))
+
+    return ValidatedLog(grain_base, grain_top, facies,
+                        base_idx, top_idx, fac_idx,
+                        thickness, labels, gs_codes, fcodes, problems)
+
+def validateLog(df, gs_codes, fcodes, nachar = 'NaN', labels = None,
+                max_label_len = None, columns = None):
+    '''
+    Checks a log table (in the format of the example files) against the
+    lookup lists. See validateUnits() for details.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Log with one row per unit.
+    gs_codes : pd.Series
+        Grain size codes, as created with grainsize().
+    fcodes : pd.Series
+        Facies codes, as created with faciesList().
+    nachar : str, optional
+        String specifying what blank cells contain. The default is 'NaN'.
+    labels : str, optional
+        Name of the column holding unit labels, if any. The default is None.
+    max_label_len : int, optional
+        Labels longer than this many characters are reported as warnings.
+        The default is None.
+    columns : dict, optional
+        Names of the thickness, gs_base, gs_top and facies columns if they
+        differ from the defaults of 'thickness', 'gs_base', 'gs_top' and 'code'.
+
+    Returns
+    -------
+    validated : ValidatedLog
+        Resolved codes along with a report of any problems. Check validated.ok
+        or call validated.raiseErrors() before drawing.
+
+    '''
+    names = ingest._names(columns)
+    missing = [c for c in names.values() if c not in df.columns]
+    if labels is not None and labels not in df.columns:
+        missing.append(labels)
+    if missing:
+        raise ValueError(f'Columns missing from log: {", ".join(missing)}')
+
+    return validateUnits(df[names['gs_base']], df[names['gs_top']], df[names['facies']],
+                         gs_codes, fcodes,
+                         thickness = df[names['thickness']],
+                         labels = None if labels is None else df[labels],
+                         nachar = nachar, max_label_len = max_label_len,
+                         index = df.index)
+
+def elevs(thicknesses, dtype = np.float64):
     '''
     Converts unit thicknesses into absolute elevations from base of log.
 
@@ -190,6 +543,9 @@ def elevs(thicknesses):
     ----------
     thicknesses : array-like
         Array containing thicknesses of units in log.
+    dtype : np.dtype, optional
+        Type to store elevations as, e.g. np.float32 to halve the memory used
+        by very long logs. The default is np.float64.
 
     Returns
     -------
@@ -201,19 +557,12 @@ def elevs(thicknesses):
         ex = '\n'.join(('Thicknesses data has no length attribute, meaning only one thickness reading was provided.',
               f'Provided thicknesses: {thicknesses}'))
         warnings.warn(ex)
-    if(isinstance(thicknesses, np.ndarray) is False):
-        thicknesses = np.array(thicknesses)
+        thicknesses = [thicknesses]
     
-    elevation = np.zeros(len(thicknesses)+1)
-    x = 0.0
-    for i in range(0,len(thicknesses)):
-        x += thicknesses[i]
-        elevation[i+1] = x
-    
-    elevation = pd.Series(elevation)
+    elevation = pd.Series(scales.elevs(thicknesses, dtype))
     return elevation
 
-def canvas(width = None, height = None, standard = 'letter'):
+def canvas(width = None, height = None, standard = 'letter', out = None, precision = None):
     '''
     Creates a canvas for the drawing, with options for several standard paper
     sizes in both American and European flavours.
@@ -237,22 +586,47 @@ def canvas(width = None, height = None, standard = 'letter'):
             - a3
             - a4
             - a5
+    out : str or file-like, optional
+        If given, returns a streaming canvas which writes the SVG straight to
+        this path or stream as the log is drawn, instead of a drawSvg canvas.
+        Call close() on it once drawing is finished. The default is None.
+    precision : int, optional
+        Streaming canvases only. Rounds coordinates to this many decimal places
+        and writes compact SVG (see backends.SvgStream). The default is None.
 
     Returns
     -------
-    canvas : drawSvg object
-        drawSvg canvas for log to be drawn onto.
+    canvas : drawSvg object or backends.SvgStream
+        Canvas for log to be drawn onto.
+
+    '''
+    cw, ch = pageSize(width, height, standard)
+    
+    # Construct canvas
+    if out is not None:
+        canvas = backends.SvgStream(out, cw, ch, precision = precision)
+    elif precision is not None:
+        raise ValueError('precision can only be set for streaming canvases. Pass out as well.')
+    else:
+        canvas = draw.Drawing(cw, ch, origin = (0,0), displayInline = False)
+    
+    return canvas
 
+def pageSize(width = None, height = None, standard = 'letter'):
     '''
-    sheets = pd.Series(['letter', 'legal', 'tabloid',
-                       'a3', 'a4', 'a5'])
-    if((width is None) and (height is None) and (standard in sheets.values)):
+    Returns the width and height (in pt) of a page, with the same arguments
+    as canvas().
+
+    '''
+    sheets = ['letter', 'legal', 'tabloid',
+              'a3', 'a4', 'a5']
+    if((width is None) and (height is None) and (standard in sheets)):
         stdw = np.array([215.9, 215.9, 279.4,
                          297, 210, 148])
         stdh = np.array([279.4, 355.6, 431.8,
                          420, 297, 210])
-        cw = stdw[sheets[sheets == standard].index[0]]
-        ch = stdh[sheets[sheets == standard].index[0]]
+        cw = stdw[sheets.index(standard)]
+        ch = stdh[sheets.index(standard)]
     elif(isinstance(width,(float,int)) and isinstance(height,(float,int))):
         cw = width
         ch = height
@@ -260,58 +634,833 @@ def canvas(width = None, height = None, standard = 'letter'):
         raise Exception('Incorrect width, height or standard size provided.')
     
     # Convert sizes from mm to pt
-    cw *= 2.8346456692913
-    ch *= 2.8346456692913
-    
-    # Construct drawSvg canvas
-    canvas = draw.Drawing(cw, ch, origin = (0,0), displayInline = False)
+    cw = scales.convert(cw, 'mm', 'pt')
+    ch = scales.convert(ch, 'mm', 'pt')
     
-    return canvas
+    return cw, ch
 
 #%% Drawing functions
 
-def drawKey(fcodes, fcolors,
-            box_size = 40, custom_rows = None,
-            padding = 5):
+def _labelTexts(labels, facies, n, nachar = 'NaN', first = 0):
+    '''
+    Returns the label text for each of n units, or None for unlabelled units.
+    first is the number of the first unit, for numbering runs of units from
+    the middle of a log.
+
+    '''
+    if labels is None:
+        return [None] * n
+    if(isinstance(labels, str) and (labels == 'facies')):
+        return [f'{f}' for f in np.asarray(facies)]
+    if(isinstance(labels, str) and (labels == 'numbers')):
+        return [f'{i}' for i in range(first,first + n)]
+    blank = _isna(labels)
+    return [f'{l}' if ((not b) and (l != nachar)) else None for l, b in zip(labels, blank)]
+
+def _mergedTexts(texts, starts):
+    '''
+    Returns the label texts of units merged by layout.mergeUnits(): the
+    first label among the units merged into each one.
+
+    '''
+    labelled = np.flatnonzero([t is not None for t in texts])
+    if len(labelled) == 0:
+        return [None] * (len(starts) - 1)
+    # First labelled unit at or after the start of each merged unit
+    k = np.minimum(np.searchsorted(labelled, starts[:-1]), len(labelled) - 1)
+    found = (labelled[k] >= starts[:-1]) & (labelled[k] < starts[1:])
+    return [texts[labelled[j]] if f else None for j, f in zip(k, found)]
+
+def presentFacies(fcodes, *facies):
+    '''
+    Finds which facies codes are used by one or more logs, with one lookup
+    per unit (or per category for categorical columns).
+
+    Parameters
+    ----------
+    fcodes : pd.Series
+        Facies codes, as created with faciesList().
+    *facies : array-like
+        Facies column of each log. Integer arrays are read as positions in
+        fcodes (e.g. ValidatedLog.fac_idx).
+
+    Returns
+    -------
+    present : np.ndarray
+        True for each code in fcodes used by any of the logs.
+
+    '''
+    counts = np.zeros(len(fcodes), dtype=np.intp)
+    for f in facies:
+        if(hasattr(f, 'dtype') and (np.asarray(f).dtype.kind in 'iu')):
+            idx = np.asarray(f)
+        else:
+            idx = codeIndex(f, fcodes)
+        counts += np.bincount(idx[idx >= 0], minlength = len(fcodes))
+    return counts > 0
+
+def keyRows(fcodes, max_per_row = 7):
+    '''
+    Works out a row layout for drawKey. Facies whose codes start with the
+    same letter share a row, split by their first two letters if there are
+    more than max_per_row of them (so fine and sandy mudstones get a row
+    each), and runs of facies with a row to themselves are put together.
+
+    Returns
+    -------
+    rows : list of int
+        Number of facies in each row, in order.
+
+    '''
+    codes = [str(c) for c in fcodes]
+    def families(codes, n):
+        # Runs of consecutive codes sharing their first n letters
+        runs = []
+        for c in codes:
+            if runs and (runs[-1][-1][:n] == c[:n]):
+                runs[-1].append(c)
+            else:
+                runs.append([c])
+        return runs
+
+    rows = []
+    for fam in families(codes, 1):
+        if(len(fam) <= max_per_row):
+            rows.append(len(fam))
+            continue
+        for sub in families(fam, 2):
+            # Anything still too long is cut into even rows
+            parts = int(np.ceil(len(sub)/max_per_row))
+            rows.extend(len(p) for p in np.array_split(np.arange(len(sub)), parts))
+    merged = []
+    singles = False  # Whether the last row is made of one-facies families
+    for r in rows:
+        if((r == 1) and singles and (merged[-1] < max_per_row)):
+            merged[-1] += 1
+        else:
+            merged.append(r)
+            singles = r == 1
+    return merged
+
+def _keyEntries(fcodes, fcolors, custom_rows = None, present = None):
+    '''
+    Returns the codes, colours and row layout of a key, as described for
+    drawKey().
+
+    '''
+    fcodes = np.asarray(fcodes, dtype=object)
+    # Colour of the first entry for each code
+    fcolors = np.asarray(fcolors, dtype=object)[codeIndex(fcodes, fcodes)]
     if custom_rows == 'default':
         custom_rows = [2,5,5,7,2,5]
-    if custom_rows is None:
-        cw = box_size * 2 + padding * 2
-        ch = box_size * len(fcodes) + padding * (len(fcodes)+1)
-    else:
+        # The default rows only fit the default facies list
+        if(sum(custom_rows) != len(fcodes)):
+            custom_rows = 'auto'
+    if custom_rows is not None and not isinstance(custom_rows, str):
         # Check that custom rows matches length of fcodes
         if(len(fcodes) != sum(custom_rows)):
             raise Exception(f'Custom rows must sum to length of fcodes. len(fcodes) = {len(fcodes)}, sum(custom_rows) = {sum(custom_rows)}')
-        cw = max(custom_rows) * box_size + max(custom_rows) * padding + box_size*2
-        ch = len(custom_rows) * box_size + (len(custom_rows)+1) * padding
-        
-    d = draw.Drawing(cw, ch, origin = (0,0), displayInline = False)
-    
+    if present is not None:
+        if((isinstance(present, list) is False) or (len(present) == 0) or np.ndim(present[0]) == 0):
+            present = [present]
+        keep = presentFacies(fcodes, *present)
+        if custom_rows is not None and not isinstance(custom_rows, str):
+            # Keep each facies in its row, dropping rows left empty
+            row_of = np.repeat(np.arange(len(custom_rows)), custom_rows)
+            custom_rows = [int(r) for r in np.bincount(row_of[keep], minlength = len(custom_rows)) if r > 0]
+        fcodes = fcodes[keep]
+        fcolors = fcolors[keep]
+    if custom_rows == 'auto':
+        custom_rows = keyRows(fcodes)
+    elif isinstance(custom_rows, str):
+        raise ValueError(f'custom_rows must be a list of row lengths, "default", "auto" or None. Got "{custom_rows}".')
+    return fcodes, fcolors, custom_rows
+
+def _keySize(n, custom_rows, box_size = 40, padding = 5):
+    '''
+    Returns the width and height (in pt) of a key of n facies.
+
+    '''
+    if custom_rows is None:
+        return box_size * 2 + padding * 2, box_size * n + padding * (n+1)
+    widest = max(custom_rows, default = 0)
+    return (widest * box_size + widest * padding + box_size*2,
+            len(custom_rows) * box_size + (len(custom_rows)+1) * padding)
+
+def _drawKeyBoxes(d, fcodes, fcolors, custom_rows, box_size, padding, left, top):
+    '''
+    Draws the boxes and labels of a key with its top left corner at (left,
+    top).
+
+    '''
     if custom_rows is None:
         for i in range(0,len(fcodes)):
-            d.append(draw.Rectangle(padding, ch-padding*(i+1)-box_size*(i+1),
-                                    box_size, box_size,
-                                    fill=fcolors[fcodes[fcodes == fcodes[i]].index[0]],
-                                    stroke_width = 1, stroke='black'))
-            d.append(draw.Text(fcodes[i], 10,
-                               x = 2*padding + box_size,
-                               y = ch-padding*(i+1)-box_size*(i+1) + box_size/2))
+            d.rect(left + padding, top-padding*(i+1)-box_size*(i+1),
+                   box_size, box_size,
+                   fill = fcolors[i],
+                   stroke_width = 1)
+            d.text(fcodes[i], 10,
+                   x = left + 2*padding + box_size,
+                   y = top-padding*(i+1)-box_size*(i+1) + box_size/2)
     else:
         box = 0
         for j in range(0,len(custom_rows)):
             for i in range(0,custom_rows[j]):
-                d.append(draw.Rectangle(padding*(i+1) + box_size*(i),
-                                        ch-padding*(j+1)-box_size*(j+1),
-                                        box_size, box_size,
-                                        fill=fcolors[fcodes[fcodes == fcodes[box]].index[0]],
-                                        stroke_width = 1, stroke='black'))
+                d.rect(left + padding*(i+1) + box_size*(i),
+                       top-padding*(j+1)-box_size*(j+1),
+                       box_size, box_size,
+                       fill = fcolors[box],
+                       stroke_width = 1)
                 box += 1
             row_label = ', '.join(fcodes[sum(custom_rows[0:j]):sum(custom_rows[0:j])+custom_rows[j]])
-            d.append(draw.Text(row_label, 10,
-                               x = padding*(i+1) + box_size*(i+1) + padding,
-                               y = ch-padding*(j+1)-box_size*(j+1) + box_size/2))
-    return d
+            d.text(row_label, 10,
+                   x = left + padding*(i+1) + box_size*(i+1) + padding,
+                   y = top-padding*(j+1)-box_size*(j+1) + box_size/2)
+
+# Rendered keys, by everything that goes into them
+_key_fragments = {}
+
+def drawKey(fcodes, fcolors,
+            box_size = 40, custom_rows = None,
+            padding = 5, out = None, present = None):
+    '''
+    Draws a key showing the color of each facies.
+
+    Parameters
+    ----------
+    fcodes : pd.Series
+        Series containing facies codes. Can be created with the faciesList() function.
+    fcolors : pd.Series
+        Series containing colors corresponding to the facies codes provided.
+    box_size : float, optional
+        Size (in pt) of the colored boxes. The default is 40.
+    custom_rows : list or str, optional
+        Number of facies to put in each row of the key, 'default' for the
+        layout used with the default facies list (or 'auto' for facies lists
+        it does not fit), or 'auto' to work out rows from the codes (see
+        keyRows()). If None, each facies gets its own row. The default is
+        None.
+    padding : float, optional
+        Padding (in pt) between boxes. The default is 5.
+    out : str or file-like, optional
+        If given, the key is written straight to this path or stream instead
+        of being returned as a drawSvg object. Keys written this way are
+        remembered, so drawing the same key again only copies it. The default
+        is None.
+    present : array-like or list, optional
+        Facies column of a log, or a list of them for a batch of logs. Only
+        facies used in them are shown in the key, with custom_rows shrunk to
+        match. See presentFacies(). The default is None, which shows every
+        facies.
+
+    Returns
+    -------
+    d : drawSvg object or backends.SvgStream
+        Completed key.
+
+    '''
+    fcodes, fcolors, custom_rows = _keyEntries(fcodes, fcolors, custom_rows, present)
+    cw, ch = _keySize(len(fcodes), custom_rows, box_size, padding)
+        
+    if out is not None:
+        memo = (tuple(fcodes), tuple(fcolors), None if custom_rows is None else tuple(custom_rows),
+                box_size, padding)
+        d = backends.SvgStream(out, cw, ch)
+        if memo in _key_fragments:
+            d.writeFragment(_key_fragments[memo])
+            d.close()
+            return d.result()
+        d.beginFragment('key')
+    else:
+        d = backends.DrawSvgBackend(draw.Drawing(cw, ch, origin = (0,0), displayInline = False))
     
+    _drawKeyBoxes(d, fcodes, fcolors, custom_rows, box_size, padding, 0, ch)
+    if out is not None:
+        if len(_key_fragments) >= 64:
+            del _key_fragments[next(iter(_key_fragments))]
+        _key_fragments[memo] = d.endFragment()
+        d.close()
+    return d.result()
+    
+
+def _checkLabels(labels, n):
+    '''
+    Checks labels are something that makes sense for a log of n units,
+    returning None (with a warning) if they are not.
+
+    '''
+    laberr = 'labels accepts either an array-like, "numbers" or "facies". None of these were detected so no labels are being printed.'
+    if isinstance(labels, (str, type(None))) is False:
+        if(hasattr(labels, '__len__')):
+            if(len(labels) != n):
+                warnings.warn('labels must be of same length as facies. Setting labels to None.')
+                labels = None
+            else:
+                if(isinstance(labels, np.ndarray) is False):
+                    labels = np.asarray(labels)
+        else:
+            warnings.warn(laberr)
+            labels = None
+    elif(isinstance(labels, str)) and (labels not in ['facies', 'numbers']):
+        warnings.warn(laberr)
+        labels = None
+    return labels
+
+def _columnHeight(vscale, height, orig = 40, pad = 5, man_colheight = None):
+    '''
+    Returns the height (in pt) of each column on a page of a given height
+    (in pt), either filling the page or set manually in m of section.
+
+    '''
+    # Figure out page spacing
+    if man_colheight is None:
+        colheight = height-(orig + pad)
+    elif(isinstance(man_colheight, (int, float))):
+        colheight = scales.asScale(vscale).toPoints(man_colheight)
+        if(colheight > height-(orig + pad)):
+            err = '\n'.join(('Column height exceeds page height. Produced log will hang off page.',
+                             f'Current page height (pt) = {height-(orig + pad)}',
+                             f'Current column height (pt) = {colheight}',
+                             f'Current excess height (pt) = {colheight - (height-(orig + pad))}'))
+            warnings.warn(err)
+    else:
+        mancoltype = type(man_colheight)
+        err = '\n'.join(['Manual column height must be provided as "int" or "float" dtype.',
+                        f'You provided man_colheight as {mancoltype} type.'])
+        raise TypeError(err)
+    return colheight
+
+def _fitColumns(top, vscale, height, orig = 40, pad = 5,
+                man_colheight = None, columns = None, debug = False):
+    '''
+    Works out the height of each column and how many columns are needed to
+    fit a log of a given height (in m) onto a page of a given height (in pt).
+
+    Returns
+    -------
+    colheight : float
+        Height of each column in pt.
+    cols : int
+        Number of columns needed.
+
+    '''
+    colheight = _columnHeight(vscale, height, orig, pad, man_colheight)
+    
+    vscale = scales.asScale(vscale)
+    t_len = vscale.toPoints(top)
+    if(columns is None):
+        # Calculate the minimum number of columns needed to fit log if no value is passed
+        columns = int(np.ceil(t_len/colheight))
+    # Fewest columns with more room than the log, found directly rather than
+    # by trying every number up to columns
+    cols = int(np.floor(t_len/colheight)) + 1
+    while((cols > 1) and ((cols - 1) * colheight > t_len)):
+        cols -= 1
+    while(cols * colheight <= t_len):
+        cols += 1
+    if(cols > columns):
+        error = '\n'.join((f'Not sufficient vertical space with {columns} columns and vertical scale of {vscale.vscale}:1.',
+                        'Choose a smaller vscale or increase max columns.',
+                        f'Available length (pt) = {columns * colheight}',
+                        f'Total length of log (pt) = {t_len}',
+                        f'Individual column height (pt) = {colheight}',
+                        f'Excess height (pt) = {t_len - columns * colheight}',
+                        f'Minimum columns needed = {int(np.ceil(t_len/colheight))}'))
+        raise ValueError(error)
+    
+    if debug is True:
+        print(f't_len: {t_len}',
+              f'avail_len: {columns * colheight}',
+              f'cols: {cols}',
+              f'colheight: {colheight}',
+              sep = '\n')
+    return colheight, cols
+
+def _drawUnits(d, elevations, base_w, top_w, fac_idx, texts,
+               vscale, colheight, colspc, orig, colwidth,
+               lnwgt = 0.5, label_strat = 'polite', cache = None, debug = False,
+               first = 0, col0 = 0, col1 = None, left = None, profiler = None,
+               placed = None):
+    '''
+    Draws and labels a run of units onto a render backend. elevations holds
+    the base and top of each unit (n+1 values, in m) and first is the number
+    of units of the log drawn before this run. If col1 is given, only the
+    parts of units falling in columns col0 to col1-1 are drawn. left is the
+    column drawn at the left of the page, col0 by default. placed is a
+    (units, parts, texts) layout worked out earlier, with labels already
+    placed, to draw instead of laying the units out again.
+
+    '''
+    if left is None:
+        left = col0
+    # Single objects are only timed for a profiler that was asked for
+    timed = profiler is not None
+    if profiler is None:
+        profiler = profiling.Profiler()
+    if placed is not None:
+        units, parts, texts = placed
+    else:
+        with profiler.phase('layout', len(elevations) - 1):
+            units, parts = layout.computeLayout(elevations, base_w, top_w, vscale,
+                                                colheight, colspc, orig, colwidth, left)
+        if(label_strat == 'polite'):
+            # Move overlapping labels apart, dropping those that will not fit
+            with profiler.phase('label placement') as rec:
+                keep, units['ly'] = layout.placeLabels(units, [t is not None for t in texts], colheight, orig)
+                texts = [t if k else None for t, k in zip(texts, keep)]
+                rec['count'] = keep.sum()
+    if col1 is not None:
+        parts = parts[(parts['col'] >= col0) & (parts['col'] < col1)]
+        texts = [t if col0 <= lcol < col1 else None for t, lcol in zip(texts, units['lcol'])]
+    starts = np.searchsorted(parts['unit'], np.arange(len(units) + 1))
+    
+    # Split units are clipped to their columns, with one clip path per column
+    clips = {}
+    with profiler.phase('clip paths') as rec:
+        for c in np.unique(parts['col'][parts['clipped']]):
+            x = ((c - left) * colspc) + orig + ((c - left) * colwidth)
+            clips[c] = d.clipRect(x, orig, x + colwidth, colheight + orig, name = f'c{c}')
+        rec['count'] = len(clips)
+    
+    # Look up units drawn by earlier runs that have not changed since
+    if((cache is not None) and (hasattr(d, 'beginFragment') is False)):
+        warnings.warn('cache only works with streaming canvases (see canvas()). Drawing without cache.')
+        cache = None
+    if cache is not None:
+        with profiler.phase('cache') as rec:
+            keys = [cache.key(d.prefix, d.precision, lnwgt, colheight, colwidth, first + i, fac_idx[i], texts[i],
+                              parts[starts[i]:starts[i+1]], units[i:i+1])
+                    for i in range(0,len(units))]
+            cached = cache.getMany(keys)
+            rec['count'] = len(cached)
+        drawn = {}
+    
+    def drawPart(i, p):
+        x1, x2, x3, y1, y2 = p['x1'], p['x2'], p['x3'], p['y1'], p['y2']
+        
+        if p['clipped']:
+            if debug is True: print('Split unit.')
+            clip = clips[p['col']]
+        else:
+            clip = None
+        d.polygon((x1, y1,
+                   x2, y1,
+                   x3, y2,
+                   x1, y2),
+                  fac_idx[i], clip = clip)
+        
+        if debug is True:
+            print(f'{p["col"]},{first + i},({x1:.3f},{y1:.3f}), ({x2:.3f},{y1:.3f}), ({x3:.3f},{y2:.3f}), ({x1:.3f},{y2:.3f}), {((colheight+orig) - y2):.3f}')
+    
+    def drawLabel(i):
+        lx, ly = units['lx'][i], units['ly'][i]
+        d.pathText(texts[i], 9, lx, ly, lx+95, ly)
+    
+    def drawUnit(i):
+        for p in parts[starts[i]:starts[i+1]]:
+            drawPart(i, p)
+        if texts[i] is not None:
+            drawLabel(i)
+    
+    # Time spent on each kind of object, summed over units
+    clock = time.perf_counter
+    spent = {'units': 0.0, 'split units': 0.0, 'labels': 0.0}
+    drawn_count = {'units': 0, 'split units': 0, 'labels': 0}
+    
+    def drawUnitTimed(i):
+        for p in parts[starts[i]:starts[i+1]]:
+            kind = 'split units' if p['clipped'] else 'units'
+            t = clock()
+            drawPart(i, p)
+            spent[kind] += clock() - t
+            drawn_count[kind] += 1
+        if texts[i] is not None:
+            t = clock()
+            drawLabel(i)
+            spent['labels'] += clock() - t
+            drawn_count['labels'] += 1
+    
+    drawOne = drawUnitTimed if timed else drawUnit
+    for i in range(0,len(units)):
+        if cache is not None:
+            if keys[i] in cached:
+                d.writeFragment(cached[keys[i]])
+                continue
+            d.beginFragment(keys[i])
+        
+        drawOne(i)
+        
+        if cache is not None:
+            drawn[keys[i]] = d.endFragment()
+    
+    if timed:
+        for kind in spent:
+            profiler.add(kind, spent[kind], drawn_count[kind])
+    
+    if cache is not None:
+        with profiler.phase('cache', len(drawn)):
+            cache.putMany(drawn)
+        if debug is True:
+            print(f'cache: {cache.stats()}')
+
+def _drawScale(d, cols, colheight, vscale, ticks, orig, colspc, gs_codes, gs_widths, col0 = 0,
+               left = None, profiler = None):
+    '''
+    Draws the elevation ticks and the grain size bar under columns col0 to
+    col0+cols-1. left is the column drawn at the left of the page, col0 by
+    default.
+
+    '''
+    if left is None:
+        left = col0
+    if profiler is None:
+        profiler = profiling.Profiler()
+    with profiler.phase('ticks') as rec:
+        rec['count'] = _drawTicks(d, cols, colheight, vscale, ticks, orig, colspc, gs_widths, col0, left)
+    with profiler.phase('grain bars', cols):
+        _drawGrainBars(d, cols, colheight, orig, colspc, gs_codes, gs_widths, col0, left)
+
+def _drawTicks(d, cols, colheight, vscale, ticks, orig, colspc, gs_widths, col0 = 0, left = 0):
+    # Draw scale
+    tick_pt = scales.asScale(vscale).toPoints(ticks)
+    nticks = int(np.floor(((col0 + cols) * colheight)/tick_pt + 1))
+    # Skip ticks below col0 (with one spare to be safe from rounding)
+    first_tick = max(int(np.floor((col0 * colheight)/tick_pt)) - 1, 0)
+    t_idx = np.arange(first_tick, nticks)
+    t_heights = t_idx * tick_pt
+    t_cols = np.searchsorted(np.arange(1, col0 + cols + 1) * colheight, t_heights, side='right')
+    
+    drawn = np.flatnonzero((t_cols >= col0) & (t_cols < col0 + cols))
+    for i in drawn:
+        j = t_cols[i] - left
+        x = (j * colspc) + orig + (j * gs_widths[len(gs_widths)-1])
+        y = orig + t_heights[i] - (t_cols[i]*colheight)
+        d.lines((x, y,
+                 x - 5, y),
+                stroke_width = 0.5)
+        d.text(f'{t_idx[i] * ticks}', 9,
+               x - 6, y,
+               text_anchor = 'end')
+    return len(drawn)
+
+def _drawGrainBars(d, cols, colheight, orig, colspc, gs_codes, gs_widths, col0 = 0, left = 0):
+    # Write grain size bars and label with codes at bottom of scale
+    for j in range(col0 - left, col0 - left + cols):
+        x = (j * colspc) + orig + (j * gs_widths[len(gs_widths)-1])
+        _drawGrainBar(d, x, orig, colheight + orig, gs_codes, gs_widths)
+
+def _drawGrainBar(d, x, base, top, gs_codes, gs_widths):
+    '''
+    Draws the grain size bar of a column whose left edge is at x and runs
+    from base to top (in pt), with the left edge of the column.
+
+    '''
+    for i in range(0,len(gs_codes)):
+        gx = x + gs_widths[i]
+        if(i % 2 == 1):
+            d.lines((gx, base,
+                     gx, base - 15),
+                    stroke_width = 0.5)
+            # Run text on a vertical path
+            d.pathText(f'{gs_codes[i]}', 9, gx+0.5, base-16.5, gx+1, base-100)
+        else:
+            d.lines((gx, base,
+                     gx, base - 5),
+                    stroke_width = 0.5)
+            d.pathText(f'{gs_codes[i]}', 9, gx+0.5, base-6.5, gx+1, base-100)
+    
+    gx = x + gs_widths[len(gs_widths)-1]
+    d.lines((gx,base,
+             gx-gs_widths[len(gs_widths)-1],base,
+             gx-gs_widths[len(gs_widths)-1],top),
+            stroke_width = 0.5)
+
+#%% Log objects
+
+class Log:
+    '''
+    Reusable log renderer. Holds the grain size and facies lookups, page
+    settings and a log's data, and keeps each stage of drawing (checking and
+    looking up codes, label texts, unit layout, label placement) so that
+    drawing the same log again at another scale, tick spacing or labelling
+    only redoes the stages that changed. For example:
+
+        lg = Log(standard = 'a4')
+        lg.setData(elevs(src.thickness), src.gs_base, src.gs_top, src.code)
+        for vscale in (100, 250, 500):
+            lg.draw(vscale = vscale).saveSvg(f'log_{vscale}.svg')
+
+    Parameters
+    ----------
+    gs_codes, gs_widths : pd.Series, optional
+        Grain size lookup, as created with grainsize(). The default is None,
+        which uses grainsize().
+    fcodes, fcolors : pd.Series, optional
+        Facies lookup, as created with faciesList(). The default is None,
+        which uses faciesList().
+    width, height, standard : optional
+        Page for drawCanvas(), as for canvas(). The default is a letter page.
+    orig, pad, colspc, lnwgt, nachar : optional
+        As for drawLog.
+    '''
+    # Most layouts kept at once
+    keep_layouts = 8
+
+    def __init__(self, gs_codes = None, gs_widths = None, fcodes = None, fcolors = None,
+                 width = None, height = None, standard = 'letter',
+                 orig = 40, pad = 5, colspc = 40, lnwgt = 0.5, nachar = 'NaN'):
+        if standard is not None:
+            standard = standard.lower()
+        self.page = (width, height, standard)
+        pageSize(*self.page)  # Fail early on a bad page
+        self.orig = orig
+        self.pad = pad
+        self.colspc = colspc
+        self.lnwgt = lnwgt
+        self.nachar = nachar
+        self._data = None
+        self._clear()
+        if gs_codes is None:
+            gs_codes, gs_widths = grainsize()
+        if fcodes is None:
+            fcodes, fcolors = faciesList()
+        self.gs_codes, self.gs_widths = gs_codes, gs_widths
+        self.fcodes, self.fcolors = fcodes, fcolors
+
+    def __str__(self):
+        width, height = pageSize(*self.page)
+        lines = [f'Log page size:\nHeight: {convert(height, "pt", "mm"):.0f} mm\nWidth: {convert(width, "pt", "mm"):.0f} mm']
+        if self._data is not None:
+            lines.append(f'{len(self.fac_idx)} units, {self.elevations[-1]:.2f} m thick')
+        return '\n'.join(lines)
+
+    def _clear(self):
+        self._texts = {}
+        self._merged = {}
+        self._layouts = {}
+        self._placements = {}
+
+    def assignGrainSizes(self, sizes = None, width = None, wunit = 'mm'):
+        '''
+        Sets the grain size lookup, with the same arguments as grainsize().
+
+        '''
+        self.gs_codes, self.gs_widths = grainsize(sizes, width, wunit)
+        if self._data is not None:
+            self.setData(*self._data)
+
+    def assignFacies(self, codes = None, colors = None):
+        '''
+        Sets the facies lookup, with the same arguments as faciesList().
+
+        '''
+        self.fcodes, self.fcolors = faciesList(codes, colors)
+        if self._data is not None:
+            self.setData(*self._data)
+
+    def drawCanvas(self, out = None, precision = None):
+        '''
+        Returns a blank canvas for the page this log was set up with. Takes
+        the same out and precision arguments as canvas().
+
+        '''
+        return canvas(*self.page, out = out, precision = precision)
+
+    def setData(self, elevations, grain_base, grain_top, facies, validated = None, profiler = None):
+        '''
+        Checks a log's grain sizes and facies against the lookups and resolves
+        the width and colour of every unit, ready for drawing. Replaces any
+        log set before.
+
+        Parameters
+        ----------
+        elevations, grain_base, grain_top, facies, validated
+            As for drawLog.
+        profiler : profiling.Profiler, optional
+            Records the time taken. The default is None.
+
+        Returns
+        -------
+        self : Log
+            So that calls can be chained.
+
+        '''
+        if profiler is None:
+            profiler = profiling.Profiler()
+        # Check grain sizes and facies are all present
+        with profiler.phase('validate', len(facies)):
+            if validated is None:
+                validated = validateUnits(grain_base, grain_top, facies, self.gs_codes, self.fcodes,
+                                          nachar = self.nachar)
+            elif(validated.matches(self.gs_codes, self.fcodes) is False):
+                raise ValueError('validated was checked against different grain size or facies codes to those provided.')
+            validated.raiseErrors()
+        with profiler.phase('lookup', len(facies)):
+            self.base_w, self.top_w, _, self.fac_idx = validated.lookup(self.gs_widths, self.fcolors)
+        self._data = (elevations, grain_base, grain_top, facies)
+        self._validated = validated
+        self.elevations = elevations
+        self.facies = validated.facies
+        self._clear()
+        return self
+
+    def _labelTexts(self, labels):
+        # Label modes are worked out once; arrays of labels every time
+        if isinstance(labels, (str, type(None))) is False:
+            return _labelTexts(labels, self.facies, len(self.fac_idx), self.nachar)
+        if labels not in self._texts:
+            self._texts[labels] = _labelTexts(labels, self.facies, len(self.fac_idx), self.nachar)
+        return self._texts[labels]
+
+    def mergedUnits(self, vscale, min_height = None, widths = 'weighted'):
+        '''
+        Returns the units drawn at a given scale once units thinner than
+        min_height (in pt) are merged, as worked out by layout.mergeUnits().
+        Results are kept for later draws.
+
+        Returns
+        -------
+        elevations, base_w, top_w, fac_idx : np.ndarray
+            Units drawn.
+        starts : np.ndarray or None
+            Position of the first unit of the log in each unit drawn, with
+            the number of units at the end. None if min_height is None.
+
+        '''
+        if min_height is None:
+            return self.elevations, self.base_w, self.top_w, self.fac_idx, None
+        key = (scales.asScale(vscale).vscale, min_height, widths)
+        if key not in self._merged:
+            self._merged[key] = layout.mergeUnits(self.elevations, self.base_w, self.top_w, self.fac_idx,
+                                                  vscale, min_height, widths)
+        return self._merged[key]
+
+    def _placed(self, vscale, colheight, labels, texts, label_strat, profiler,
+                min_height = None, lod_widths = 'weighted'):
+        '''
+        Returns the (units, parts, texts) layout of the log, reusing the unit
+        layout and label placement from earlier draws where nothing they
+        depend on has changed.
+
+        '''
+        colwidth = self.gs_widths[len(self.gs_widths)-1]
+        key = (vscale.vscale, colheight, self.colspc, self.orig, colwidth, min_height, lod_widths)
+        if key not in self._layouts:
+            elevations, base_w, top_w, fac_idx, _ = self.mergedUnits(vscale, min_height, lod_widths)
+            with profiler.phase('layout', len(fac_idx)):
+                self._layouts[key] = layout.computeLayout(elevations, base_w, top_w, vscale,
+                                                          colheight, self.colspc, self.orig, colwidth)
+            if len(self._layouts) > self.keep_layouts:
+                old = next(iter(self._layouts))
+                del self._layouts[old]
+                self._placements = {k: v for k, v in self._placements.items() if k[0] != old}
+        units, parts = self._layouts[key]
+        if(label_strat != 'polite'):
+            return units, parts, texts
+
+        # Move overlapping labels apart, dropping those that will not fit.
+        # Placements are only kept for label modes, not arrays of labels
+        p_key = (key, labels) if isinstance(labels, (str, type(None))) else None
+        if((p_key is None) or (p_key not in self._placements)):
+            with profiler.phase('label placement') as rec:
+                keep, ly = layout.placeLabels(units, [t is not None for t in texts], colheight, self.orig)
+                rec['count'] = keep.sum()
+            if p_key is not None:
+                self._placements[p_key] = (keep, ly)
+        else:
+            keep, ly = self._placements[p_key]
+        units = units.copy()
+        units['ly'] = ly
+        return units, parts, [t if k else None for t, k in zip(texts, keep)]
+
+    def sweep(self, vscales, ticks = 20, paper = None, out = 'log_{vscale}.svg',
+              labels = None, label_strat = 'polite', man_colheight = None, columns = None,
+              jobs = None, precision = None, min_height = None, lod_widths = 'weighted'):
+        '''
+        Draws the log at each of several vertical scales, each to its own SVG
+        file, drawing the variants at the same time in separate processes.
+        Only the layout is worked out again for each scale. Arguments are as
+        for drawLogSweep(); paper defaults to this log's page.
+
+        Returns
+        -------
+        results : pd.DataFrame
+            One row per variant, saying whether it fit its page and where it
+            was written. See drawLogSweep().
+
+        '''
+        return _sweep(self, vscales, ticks, paper, out, labels, label_strat,
+                      man_colheight, columns, jobs, precision, min_height, lod_widths)
+
+    def draw(self, canv = None, vscale = 250, ticks = 20, labels = None, label_strat = 'polite',
+             man_colheight = None, columns = None, debug = False, cache = None,
+             profiler = None, jobs = 1, min_height = None, lod_widths = 'weighted'):
+        '''
+        Draws the log set with setData(). Arguments are as for drawLog. If
+        canv is None, a canvas is made with drawCanvas().
+
+        Returns
+        -------
+        d : drawSvg object or render backend
+            Completed log, ready for exporting.
+
+        '''
+        if self._data is None:
+            raise ValueError('No log to draw. Call setData() first.')
+        if canv is None:
+            canv = self.drawCanvas()
+        if profiler is None:
+            profiler = profiling.Profiler()
+        # One metres to points transform shared by every stage
+        vscale = scales.asScale(vscale)
+        gs_codes, gs_widths = self.gs_codes, self.gs_widths
+        orig, colspc, lnwgt = self.orig, self.colspc, self.lnwgt
+
+        with profiler.phase('fit columns') as rec:
+            labels = _checkLabels(labels, len(self.fac_idx))
+            colheight, cols = _fitColumns(self.elevations[len(self.elevations)-1], vscale, canv.height,
+                                          orig, self.pad, man_colheight, columns, debug)
+            rec['count'] = cols
+
+        d = backends.asBackend(canv)
+
+        with profiler.phase('label texts', len(self.fac_idx)):
+            d.defineStyles(self.fcolors, stroke = 'black', stroke_width = lnwgt)
+            texts = self._labelTexts(labels)
+        with profiler.phase('merge units') as rec:
+            elevations, base_w, top_w, fac_idx, starts = self.mergedUnits(vscale, min_height, lod_widths)
+            if starts is not None:
+                texts = _mergedTexts(texts, starts)
+            rec['count'] = len(fac_idx)
+
+        if((jobs != 1) and (hasattr(d, 'writeFragment') is False)):
+            warnings.warn('jobs only works with streaming canvases (see canvas()). Drawing in one process.')
+            jobs = 1
+        if((jobs != 1) and (cache is not None)):
+            warnings.warn('jobs cannot be used with a cache. Drawing in one process.')
+            jobs = 1
+
+        # Draw log
+        if jobs == 1:
+            placed = self._placed(vscale, colheight, labels, texts, label_strat, profiler,
+                                  min_height, lod_widths)
+            _drawUnits(d, elevations, base_w, top_w, fac_idx, texts,
+                       vscale, colheight, colspc, orig, gs_widths[len(gs_widths)-1],
+                       lnwgt, label_strat, cache = cache, debug = debug, profiler = profiler,
+                       placed = placed)
+            _drawScale(d, cols, colheight, vscale, ticks, orig, colspc, gs_codes, gs_widths,
+                       profiler = profiler)
+        else:
+            with profiler.phase('columns', cols):
+                _drawColumns(d, jobs, cols, elevations, base_w, top_w, fac_idx, texts,
+                             gs_codes, gs_widths, vscale, colheight, colspc, orig,
+                             lnwgt, label_strat, ticks)
+
+        if debug is True:
+            print(f'gs_codes: {gs_codes}',
+                  f'gs_widths: {gs_widths}',
+                  sep = '\n')
+        return d.result()
 
 def drawLog(elevations, vscale,
             grain_base, grain_top, facies,
@@ -319,7 +1468,8 @@ def drawLog(elevations, vscale,
             orig = 40, pad = 5, colspc = 40, lnwgt = 0.5,
             man_colheight = None, columns = None, ticks = 20,
             labels = None, label_strat = 'polite',
-            nachar = 'NaN', debug = False):
+            nachar = 'NaN', debug = False, cache = None, validated = None,
+            profiler = None, jobs = 1, min_height = None, lod_widths = 'weighted'):
     '''
     Draws sedimentary logs. Accepts a dizzying array of arguments and should
     therefore be used in conjuction with supporting functions.
@@ -329,7 +1479,7 @@ def drawLog(elevations, vscale,
     elevations : pd.Series
         Elevations of the base and top of each unit. Can be created from thickness
         data using the elevs() function.
-    vscale : int
+    vscale : int or scales.Scale
         Scale at which to draw log in form X:1.
     grain_base : pd.Series
         Series containing the grain size at the base of the units.
@@ -350,8 +1500,8 @@ def drawLog(elevations, vscale,
     fcolors : pd.Series
         Series containing colors corresponding to the facies codes provided.
         Can be created with the faciesList() function.
-    canv : drawSvg object
-        drawSvg.Drawing created with drawSvg.
+    canv : drawSvg object or render backend
+        drawSvg.Drawing created with drawSvg, or a streaming canvas.
         Can be created with the canvas() function.
     orig : int, optional
         Coordinates (in pt) to start drawing from in form (x,x). The default is 40.
@@ -377,306 +1527,445 @@ def drawLog(elevations, vscale,
             - 'number': labels each unit with its number, starting from 1 at the base
         The default is None.
     label_strat : str, optional
-        Chooses whether to skip drawing labels that would write over
-        units in the log ('polite') or whether to just label everything,
-        consequences be damned. The default is 'polite'.
+        Chooses whether to move apart labels that would write over each
+        other, skipping those that cannot be fitted in ('polite'), or whether
+        to just label everything where it is, consequences be damned. Labels
+        of thicker units are kept over those of thinner ones. The default is
+        'polite'.
     nachar : str, optional
         String specifying what blank cells contain. The default is 'NaN'.
     debug : bool, optional
         Provides addtional information during log construction. The default is False.
+    cache : cache.FragmentCache, optional
+        Cache of previously drawn units. Units whose data, position and styling
+        are unchanged since they were cached are copied from the cache rather
+        than redrawn. Only used with streaming canvases. The default is None.
+    validated : ValidatedLog, optional
+        Result of validateLog() or validateUnits() for this log. If given, the
+        grain sizes and facies are not checked again. The default is None.
+    profiler : profiling.Profiler, optional
+        Records the time taken by each phase of drawing and how many objects
+        each drew. The default is None.
+    jobs : int, optional
+        Number of processes to draw columns in at once, or None for one per
+        core. Each column is drawn separately and the columns are added to the
+        canvas in order. Only used with streaming canvases and without a
+        cache. Worth it for logs of many thousands of units. The default is 1.
+    min_height : float, optional
+        Level of detail: runs of units that would be drawn less than this
+        many pt tall are merged into units about this tall, each drawn in the
+        facies making up most of its thickness, so that small scales are not
+        smeared black by thousands of outlines. Labels go to the first
+        labelled unit of each merge. See layout.mergeUnits() and
+        Log.mergedUnits() for which units were merged. The default is None,
+        which draws every unit.
+    lod_widths : str, optional
+        Width of merged units: 'weighted' for their thickness-weighted mean
+        width or 'dominant' for the widths of their thickest unit. The
+        default is 'weighted'.
 
     Returns
     -------
-    d : drawSvg object
+    d : drawSvg object or render backend
+        Completed log, ready for exporting. Streaming canvases are returned
+        still open so more can be drawn on them.
+
+    '''
+    lg = Log(gs_codes, gs_widths, fcodes, fcolors,
+             orig = orig, pad = pad, colspc = colspc, lnwgt = lnwgt, nachar = nachar)
+    lg.setData(elevations, grain_base, grain_top, facies, validated = validated, profiler = profiler)
+    return lg.draw(canv, vscale, ticks = ticks, labels = labels, label_strat = label_strat,
+                   man_colheight = man_colheight, columns = columns, debug = debug,
+                   cache = cache, profiler = profiler, jobs = jobs,
+                   min_height = min_height, lod_widths = lod_widths)
+
+def _unitsInColumns(e_pt, colheight, col0, col1):
+    '''
+    Returns the slice (lo, hi) of units with any part in columns col0 to
+    col1-1, given the elevations (in pt) of their bases and tops.
+
+    '''
+    lo = np.searchsorted(e_pt[1:], col0 * colheight, side='left')
+    hi = np.searchsorted(e_pt[:-1], col1 * colheight, side='right')
+    return lo, hi
+
+def _drawColumnBlock(col0, col1, elevations, base_w, top_w, fac_idx, texts, first,
+                     width, height, prefix, precision, gs_codes, gs_widths,
+                     vscale, colheight, colspc, orig, lnwgt, label_strat, ticks):
+    '''
+    Draws columns col0 to col1-1 of a log, with their scale, to an SVG string.
+
+    '''
+    d = backends.SvgStream.detached(width, height, prefix, f'{prefix}k{col0}-', precision)
+    _drawUnits(d, elevations, base_w, top_w, fac_idx, texts,
+               vscale, colheight, colspc, orig, gs_widths[len(gs_widths)-1],
+               lnwgt, label_strat, first = first, col0 = col0, col1 = col1, left = 0)
+    _drawScale(d, col1 - col0, colheight, vscale, ticks, orig, colspc, gs_codes, gs_widths,
+               col0 = col0, left = 0)
+    return d.getvalue()
+
+def _drawColumns(d, jobs, cols, elevations, base_w, top_w, fac_idx, texts,
+                 gs_codes, gs_widths, vscale, colheight, colspc, orig,
+                 lnwgt, label_strat, ticks):
+    '''
+    Draws the columns of a log in a pool of processes, then writes them to a
+    streaming canvas in order. Columns are handed out in a few contiguous
+    blocks per process, as drawing a single column is too quick to be worth
+    sending to another process.
+
+    '''
+    elevations = np.asarray(elevations, dtype=float)
+    e_pt = scales.asScale(vscale).toPoints(elevations)
+    workers = os.cpu_count() if jobs is None else jobs
+    edges = np.unique(np.linspace(0, cols, min(cols, workers * 4) + 1).astype(int))
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers = jobs) as pool:
+        futures = []
+        for c0, c1 in zip(edges[:-1], edges[1:]):
+            lo, hi = _unitsInColumns(e_pt, colheight, c0, c1)
+            futures.append(pool.submit(_drawColumnBlock, c0, c1, elevations[lo:hi+1], base_w[lo:hi],
+                                       top_w[lo:hi], fac_idx[lo:hi], texts[lo:hi], lo,
+                                       d.width, d.height, d.prefix, d.precision, gs_codes, gs_widths,
+                                       vscale, colheight, colspc, orig, lnwgt, label_strat, ticks))
+        for f in futures:
+            d.writeFragment(f.result())
+
+def drawLogCsv(path, vscale,
+               gs_codes, gs_widths, fcodes, fcolors, canv,
+               orig = 40, pad = 5, colspc = 40, lnwgt = 0.5,
+               man_colheight = None, columns = None, ticks = 20,
+               labels = None, label_strat = 'polite',
+               nachar = 'NaN', debug = False, cache = None,
+               chunksize = 100000, names = None, profiler = None):
+    '''
+    Draws a log straight from a CSV (in the format of the example files),
+    reading and drawing chunksize units at a time so that memory use depends
+    on the chunk size rather than the length of the log. Use with a streaming
+    canvas (see canvas()) to keep the output out of memory too.
+
+    Arguments are as for drawLog, except:
+
+    Parameters
+    ----------
+    path : str
+        Path to log CSV.
+    labels : str, optional
+        'facies', 'numbers', or the name of a column holding unit labels.
+        The default is None.
+    chunksize : int, optional
+        Number of units read and drawn at once. The default is 100000.
+    names : dict, optional
+        Names of the thickness, gs_base, gs_top and facies columns if they
+        differ from those in ingest.DEFAULT_COLUMNS. The default is None.
+
+    Each chunk is validated before it is drawn, so errors are reported one
+    chunk at a time (with row numbers from the whole file). Run validateLog()
+    on the file first if every error is needed at once.
+
+    Labels are placed one chunk at a time too: with label_strat = 'polite',
+    labels are only moved apart from others in the same chunk, so labels of
+    units either side of a chunk boundary can overlap, or be kept or dropped
+    differently to drawLog on the same data. Use a chunksize larger than the
+    log, or drawLog, where labels must match exactly.
+
+    Returns
+    -------
+    d : drawSvg object or render backend
         Completed log, ready for exporting.
 
     '''
-    # Check if grain sizes are all present
-    if any(grain_base.isin(gs_codes) == False) is True:
-        idx = (grain_base.isin(gs_codes) == False)[grain_base.isin(gs_codes) == False].index
-        err = '\n'.join(['Grain sizes in log not present in list of codes prescribed. Incorrect sizes:',
-                        ', '.join(grain_base[idx]),
-                        'at indexes:',
-                        str([*idx])])
-        raise ValueError(err)
-    if any(grain_top.isin(gs_codes) == False) is True:
-        idx = (grain_top.isin(gs_codes) == False)[grain_top.isin(gs_codes) == False].index
-        err = '\n'.join(['Grain sizes in log not present in list of codes prescribed. Incorrect sizes:',
-                        ', '.join(grain_top[idx]),
-                        'at indexes:',
-                        str([*idx])])
-        raise ValueError(err)
-    
-    # Check facies are all present
-    if any(facies.isin(fcodes) == False) is True:
-        idx = (facies.isin(fcodes) == False)[facies.isin(fcodes) == False].index
-        err = '\n'.join(['Facies in log not present in list of codes facies codes. Incorrect codes:',
-                        ', '.join(facies[idx]),
-                        'at indexes:',
-                        str([*idx])])
-        raise ValueError(err)
-    
-    # Check labels are something that makes sense
-    laberr = 'labels accepts either an array-like, "numbers" or "facies". None of these were detected so no labels are being printed.'
-    if isinstance(labels, (str, type(None))) is False:
-        if(hasattr(labels, '__len__')):
-            if(len(labels) != len(facies)):
-                warnings.warn('labels must be of same length as facies. Setting labels to None.')
-            else:
-                if(isinstance(labels, np.ndarray) is False):
-                    labels = np.asarray(labels)
-        else:
-            warnings.warn(laberr)
-            labels = None
-    elif(isinstance(labels, str)) and (labels not in ['facies', 'numbers']):
-        warnings.warn(laberr)
-        labels = None
-    # else:
-    #     warnings.warn(laberr)
-    #     labels = None
+    if profiler is None:
+        profiler = profiling.Profiler()
+    vscale = scales.asScale(vscale)
+    label_col = labels if labels not in (None, 'facies', 'numbers') else None
+    with profiler.phase('fit columns') as rec:
+        colheight, cols = _fitColumns(ingest.logHeight(path, names), vscale, canv.height,
+                                      orig, pad, man_colheight, columns, debug)
+        rec['count'] = cols
     
-    # Figure out page spacing
-    if man_colheight is None:
-        colheight = canv.height-(orig + pad)
-    elif(isinstance(man_colheight, (int, float))):
-        colheight = (man_colheight * 1000 * 2.8346456692913)/vscale
-        if(colheight > canv.height-(orig + pad)):
-            err = '\n'.join(('Column height exceeds page height. Produced log will hang off page.',
-                             f'Current page height (pt) = {canv.height-(orig + pad)}',
-                             f'Current column height (pt) = {(man_colheight * 1000 * 2.8346456692913)/vscale}',
-                             f'Current excess height (pt) = {((man_colheight * 1000 * 2.8346456692913)/vscale) - (canv.height-(orig + pad))}'))
-            warnings.warn(err)
-    else:
-        mancoltype = type(man_colheight)
-        err = '\n'.join(['Manual column height must be provided as "int" or "float" dtype.',
-                        f'You provided man_colheight as {mancoltype} type.'])
-        raise TypeError(err)
+    d = backends.asBackend(canv)
+    d.defineStyles(fcolors, stroke = 'black', stroke_width = lnwgt)
+    names = ingest._names(names)
     
-    t_len = (elevations[len(elevations)-1] * 1000 * 2.8346456692913)/vscale #vscale * 2.8346456692913 * elevations[len(elevations)-1]
-    if(columns is None):
-        # Calculate the minimum number of columns needed to fit log if no value is passed
-        columns = int(np.ceil(t_len/colheight))
-    avail_len = pd.Series(np.array(list(range(1,columns + 1))) * colheight)
-    if(pd.isna(avail_len[avail_len>t_len].index.min()) is True):
-        error = '\n'.join((f'Not sufficient vertical space with {columns} columns and vertical scale of {vscale}:1.',
-                        'Choose a smaller vscale or increase max columns.',
-                        f'Available length (pt) = {max(avail_len)}',
-                        f'Total length of log (pt) = {t_len}',
-                        f'Individual column height (pt) = {colheight}',
-                        f'Excess height (pt) = {t_len - max(avail_len)}',
-                        f'Minimum columns needed = {int(np.ceil(t_len/colheight))}'))
-        raise ValueError(error)
-    else:
-        # Reduce provided number of columns to minimum needed
-        cols = avail_len[avail_len>t_len].index.min() + 1
+    first = 0
+    chunks = ingest.readChunks(path, chunksize, names, label_col)
+    while True:
+        with profiler.phase('read') as rec:
+            chunk = next(chunks, None)
+            rec['count'] = 0 if chunk is None else len(chunk)
+        if chunk is None:
+            break
+        with profiler.phase('validate', len(chunk)):
+            validated = validateUnits(chunk[names['gs_base']], chunk[names['gs_top']], chunk[names['facies']],
+                                      gs_codes, fcodes, nachar = nachar, index = chunk.index)
+            validated.raiseErrors()
+        with profiler.phase('lookup', len(chunk)):
+            base_w, top_w, fill, fac_idx = validated.lookup(gs_widths, fcolors)
+            chunk_labels = labels if label_col is None else chunk[label_col]
+            texts = _labelTexts(chunk_labels, validated.facies, len(chunk), nachar, first = first)
+        
+        elevations = np.append(chunk['elev_base'].to_numpy(), chunk['elev_top'].iloc[-1])
+        _drawUnits(d, elevations, base_w, top_w, fac_idx, texts,
+                   vscale, colheight, colspc, orig, gs_widths[len(gs_widths)-1],
+                   lnwgt, label_strat, cache = cache, debug = debug, first = first,
+                   profiler = profiler)
+        first += len(chunk)
+    
+    _drawScale(d, cols, colheight, vscale, ticks, orig, colspc, gs_codes, gs_widths,
+               profiler = profiler)
+    return d.result()
+
+def _drawPage(path, width, height, col0, cols,
+              elevations, base_w, top_w, fac_idx, texts, first,
+              fcolors, gs_codes, gs_widths,
+              vscale, colheight, colspc, orig, lnwgt, label_strat, ticks, precision = None):
+    '''
+    Draws one page of drawLogPages() to its own file.
+
+    '''
+    with backends.SvgStream(path, width, height, precision = precision) as d:
+        d.defineStyles(fcolors, stroke = 'black', stroke_width = lnwgt)
+        _drawUnits(d, elevations, base_w, top_w, fac_idx, texts,
+                   vscale, colheight, colspc, orig, gs_widths[len(gs_widths)-1],
+                   lnwgt, label_strat, first = first, col0 = col0, col1 = col0 + cols)
+        _drawScale(d, cols, colheight, vscale, ticks, orig, colspc, gs_codes, gs_widths, col0 = col0)
+    return path
+
+def drawLogPages(elevations, vscale,
+                 grain_base, grain_top, facies,
+                 gs_codes, gs_widths, fcodes, fcolors,
+                 out = 'log_{page}.svg', width = None, height = None, standard = 'letter',
+                 orig = 40, pad = 5, colspc = 40, lnwgt = 0.5,
+                 man_colheight = None, ticks = 20,
+                 labels = None, label_strat = 'polite',
+                 nachar = 'NaN', validated = None, jobs = 1, precision = None):
+    '''
+    Draws a log over as many pages as it needs, rather than raising an error
+    when it does not fit on one. As many columns as fit across the page are
+    drawn on each page, and units running over the top of the last column on
+    a page carry on at the bottom of the next page. Each page is written to
+    its own SVG file as soon as it is drawn.
+
+    Arguments are as for drawLog, except:
+
+    Parameters
+    ----------
+    out : str, optional
+        Path to write pages to, containing {page} where the page number
+        (starting from 1) should go. The default is 'log_{page}.svg'.
+    width, height, standard : optional
+        Page size, as for canvas(). The default is US letter.
+    jobs : int, optional
+        Number of pages to draw at once in separate processes. The default is 1.
+    precision : int, optional
+        Rounds coordinates to this many decimal places and writes compact SVG
+        (see backends.SvgStream). The default is None.
+
+    Returns
+    -------
+    paths : list of str
+        Paths of the pages written, in order.
+
+    '''
+    vscale = scales.asScale(vscale)
+    if('{page' not in out):
+        stem, ext = os.path.splitext(out)
+        out = stem + '_{page}' + ext
     
-    d = canv
+    if validated is None:
+        validated = validateUnits(grain_base, grain_top, facies, gs_codes, fcodes, nachar = nachar)
+    elif(validated.matches(gs_codes, fcodes) is False):
+        raise ValueError('validated was checked against different grain size or facies codes to those provided.')
+    validated.raiseErrors()
+    labels = _checkLabels(labels, len(facies))
     
-    # Draw log
-    j = 0
-    elevations = (elevations * 1000 * 2.8346456692913)/vscale
-    for i in range(0,len(elevations)-1):
-        if(elevations[i] > (j+1)*colheight):
-            if debug is True: print('Split unit.')
-            j += 1
-        x1 = (j * colspc) + orig + (j * gs_widths[len(gs_widths)-1])
-        x2 = x1 + gs_widths[gs_codes[gs_codes == grain_base[i]].index[0]]
-        if(grain_top[i] != 'NaN'):
-            x3 = x1 + gs_widths[gs_codes[gs_codes == grain_top[i]].index[0]]
-        else:
-            x3 = x2
-        y1 = elevations[i] - (j * colheight) + orig
-        y2 = elevations[i+1] - (j * colheight) + orig
-        
-        # Draw boxes split across 2 columns
-        if(y2 > (colheight+orig)):
-            clip = draw.ClipPath()
-            clip.append(draw.Lines(x1, y1,
-                                   greater(x2,x3), y1,
-                                   greater(x2,x3), y2 + ((colheight+orig) - y2),
-                                   x1, y2 + ((colheight+orig) - y2)))
-            d.append(draw.Lines(x1, y1,
-                                x2, y1,
-                                x3, y2,
-                                x1, y2,
-                                close = True,
-                                fill = fcolors[fcodes[fcodes == facies[i]].index[0]],
-                                stroke = 'black',
-                                stroke_width = lnwgt,
-                                clip_path = clip))
-            
-            x1b = ((j+1) * colspc) + orig + ((j+1) * gs_widths[len(gs_widths)-1])
-            x2b = x1b + gs_widths[gs_codes[gs_codes == grain_base[i]].index[0]]
-            if(grain_top[i] != 'NaN'):
-                x3b = x1b + gs_widths[gs_codes[gs_codes == grain_top[i]].index[0]]
-            else:
-                x3b = x2b
-            y1b = elevations[i] - ((j+1) * colheight) + orig
-            y2b = elevations[i+1] - ((j+1) * colheight) + orig
-            
-            clip = draw.ClipPath()
-            clip.append(draw.Lines(x1b, orig,
-                                   greater(x2b,x3b), orig,
-                                   greater(x2b,x3b), y2b,
-                                   x1b, y2b))
-            d.append(draw.Lines(x1b, y1b,
-                                x2b, y1b,
-                                x3b, y2b,
-                                x1b, y2b,
-                                close = True,
-                                fill = fcolors[fcodes[fcodes == facies[i]].index[0]],
-                                stroke = 'black',
-                                stroke_width = lnwgt,
-                                clip_path = clip))
-            # Draw labels on whichever section of split boxes is biggest
-            if labels is not None:
-                if(((y2 + ((colheight+orig) - y2)) - y1) > y2b-orig):
-                    lx = greater(x2, x3) + 5
-                    ly = (y1 + (y2 + ((colheight+orig) - y2)))/2
-                    ldelta = (y2 + ((colheight+orig) - y2)) - y1
-                else:
-                    lx = greater(x2b, x3b) + 5
-                    ly = (y2b+(orig))/2
-                    ldelta = y2b - orig
-            # Draw labels on boxes that are big enough
-                if((label_strat == 'polite') and (ldelta >= 9)):
-                    p = draw.Line(lx, ly,
-                                  lx+100, ly,
-                                  stroke_width = 0, fill = 'none')
-                    if(isinstance(labels, str) and (labels == 'facies')):
-                        d.append(draw.Text(f'{facies[i]}', 9,
-                                           path = p, valign='middle', text_anchor = 'start'))
-                    elif(isinstance(labels, str) and (labels == 'numbers')):
-                        d.append(draw.Text(f'{i}', 9,
-                                           path = p, valign='middle', text_anchor = 'start'))
-                    elif(labels[i] is not nachar):
-                        d.append(draw.Text(f'{labels[i]}', 9,
-                                       path = p, valign='middle', text_anchor = 'start'))
-            # Just label everything
-                else:
-                    p = draw.Line(lx, ly,
-                                  lx+100, ly,
-                                  stroke_width = 0, fill = 'none')
-                    if(isinstance(labels, str) and (labels == 'facies')):
-                        d.append(draw.Text(f'{facies[i]}', 9,
-                                           path = p, valign='middle', text_anchor = 'start'))
-                    elif(isinstance(labels, str) and (labels == 'numbers')):
-                        d.append(draw.Text(f'{i}', 9,
-                                           path = p, valign='middle', text_anchor = 'start'))
-                    elif(labels[i] is not nachar):
-                        d.append(draw.Text(f'{labels[i]}', 9,
-                                           path = p, valign='middle', text_anchor = 'start'))
-            
-        # Draw boxes that aren't split
-        else:
-            d.append(draw.Lines(x1, y1,
-                                x2, y1,
-                                x3, y2,
-                                x1, y2,
-                                close = True,
-                                fill = fcolors[fcodes[fcodes == facies[i]].index[0]],
-                                stroke = 'black',
-                                stroke_width = lnwgt))
-            
-            # Label units
-            if labels is not None:
-            # Make labels appear only on units that are thick enough
-                if((label_strat == 'polite') and ((y2 - y1) >= 9)):
-                    if debug is True:
-                        print(f'Politely labelling unit {i}...')
-                    p = draw.Line(greater(x2,x3)+5, (y2+y1)/2,
-                                  greater(x2,x3)+100, (y2+y1)/2,
-                                  stroke_width = 0, fill = 'none')
-                    if(isinstance(labels, str) and (labels == 'facies')):
-                        d.append(draw.Text(f'{facies[i]}', 9,
-                                           path = p, valign='middle', text_anchor = 'start'))
-                    elif(isinstance(labels, str) and (labels == 'numbers')):
-                        d.append(draw.Text(f'{i}', 9,
-                                           path = p, valign='middle', text_anchor = 'start'))
-                    elif(labels[i] is not nachar):
-                        d.append(draw.Text(f'{labels[i]}', 9,
-                                           path = p, valign='middle', text_anchor = 'start'))
-                # Just label everything
-                else:
-                    p = draw.Line(greater(x2,x3)+5, (y2+y1)/2,
-                                  greater(x2,x3)+100, (y2+y1)/2,
-                                  stroke_width = 0, fill = 'none')
-                    if(isinstance(labels, str) and (labels == 'facies')):
-                        d.append(draw.Text(f'{facies[i]}', 9,
-                                           path = p, valign='middle', text_anchor = 'start'))
-                    elif(isinstance(labels, str) and (labels == 'numbers')):
-                        d.append(draw.Text(f'{i}', 9,
-                                           path = p, valign='middle', text_anchor = 'start'))
-                    elif(labels[i] is not nachar):
-                        d.append(draw.Text(f'{labels[i]}', 9,
-                                           path = p, valign='middle', text_anchor = 'start'))
-            
-        if debug is True:
-            print(f'{j},{i},({x1:.3f},{y1:.3f}), ({x2:.3f},{y1:.3f}), ({x3:.3f},{y2:.3f}), ({x1:.3f},{y2:.3f}), {((colheight+orig) - y2):.3f}')
-        
-    # Draw scale
-    nticks = int(np.floor((cols * colheight)/((ticks * 1000 * 2.8346456692913)/vscale) + 1))
-    t_heights = np.array(range(0,nticks)) * ((ticks * 1000 * 2.8346456692913)/vscale)
-    
-    j = 0
-    x = orig
-    for i in range(0,nticks):
-        if(t_heights[i] >= (j+1)*colheight):
-            j += 1
-            x = (j * colspc) + orig + (j * gs_widths[len(gs_widths)-1])
-        d.append(draw.Lines(x, orig + t_heights[i] - (j*colheight),
-                            x - 5, orig + t_heights[i] - (j*colheight),
-                            fill = 'none',
-                            stroke = 'black',
-                            stroke_width = 0.5))
-        d.append(draw.Text(f'{i * ticks}', 9,
-                           x - 6, orig + t_heights[i] - (j*colheight),
-                           text_anchor = 'end'))
+    # Fit columns to the page
+    cw, ch = pageSize(width, height, standard)
+    colwidth = gs_widths[len(gs_widths)-1]
+    colheight = _columnHeight(vscale, ch, orig, pad, man_colheight)
+    per_page = layout.columnsPerPage(cw, orig, pad, colspc, colwidth)
+    elevations = np.asarray(elevations, dtype=float)
+    e_pt = scales.asScale(vscale).toPoints(elevations)
+    ncols = max(int(np.ceil(e_pt[-1]/colheight)), 1)
+    npages = int(np.ceil(ncols/per_page))
     
-    # Write grain size bars and label with codes at bottom of scale
-    for j in range(0,cols):
-        for i in range(0,len(gs_codes)):
-            x = (j * colspc) + orig + (j * gs_widths[len(gs_widths)-1]) + gs_widths[i]
-            if(i % 2 == 1):
-                d.append(draw.Lines(x, orig,
-                                    x, orig - 15,
-                                    fill = 'none',
-                                    stroke = 'black',
-                                    stroke_width = 0.5))
-                # Create vertical path to run text on
-                p = draw.Line(x+0.5, orig-16.5, x+1, orig-100,
-                               stroke_width = 0, fill='none')
-                d.append(draw.Text(f'{gs_codes[i]}', 9,
-                                   path=p,
-                                   text_anchor = 'start',
-                                   valign = 'middle'))
-            else:
-               d.append(draw.Lines(x, orig,
-                                   x, orig - 5,
-                                   fill = 'none',
-                                   stroke = 'black',
-                                   stroke_width = 0.5))
-               p = draw.Line(x+0.5, orig-6.5, x+1, orig-100,
-                               stroke_width = 0, fill='none')
-               d.append(draw.Text(f'{gs_codes[i]}', 9,
-                                  path=p,
-                                  text_anchor = 'start',
-                                  valign = 'middle'))
-        
-        x = (j * colspc) + orig + (j * gs_widths[len(gs_widths)-1]) + gs_widths[len(gs_widths)-1]
-        d.append(draw.Lines(x,orig,
-                            x-gs_widths[len(gs_widths)-1],orig,
-                            x-gs_widths[len(gs_widths)-1],colheight + orig,
-                            fill = 'none',
-                            stroke = 'black',
-                            stroke_width = 0.5))
+    base_w, top_w, fill, fac_idx = validated.lookup(gs_widths, fcolors)
+    texts = _labelTexts(labels, facies, len(facies), nachar)
     
-    if debug is True:
-        print(f't_len: {t_len}',
-              f'avail_len: {max(avail_len)}',
-              f'cols: {cols}',
-              f'gs_codes: {gs_codes}',
-              f'gs_widths: {gs_widths}',
-              f'colheight: {colheight}',
-              sep = '\n')
-    return d
\ No newline at end of file
+    # Give each page only the units that reach into it
+    pages = []
+    for p in range(0,npages):
+        col0 = p * per_page
+        cols = min(per_page, ncols - col0)
+        lo, hi = _unitsInColumns(e_pt, colheight, col0, col0 + cols)
+        pages.append(dict(path = out.format(page = p + 1), width = cw, height = ch,
+                          col0 = col0, cols = cols,
+                          elevations = elevations[lo:hi+1], base_w = base_w[lo:hi],
+                          top_w = top_w[lo:hi], fac_idx = fac_idx[lo:hi],
+                          texts = texts[lo:hi], first = lo,
+                          fcolors = fcolors, gs_codes = gs_codes, gs_widths = gs_widths,
+                          vscale = vscale, colheight = colheight, colspc = colspc,
+                          orig = orig, lnwgt = lnwgt, label_strat = label_strat, ticks = ticks,
+                          precision = precision))
+    
+    if jobs == 1:
+        return [_drawPage(**page) for page in pages]
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers = jobs) as pool:
+        futures = [pool.submit(_drawPage, **page) for page in pages]
+        return [f.result() for f in futures]
+
+#%% Parameter sweeps
+
+# Log drawn by sweep workers, sent once per process rather than once per variant
+_sweep_log = None
+
+def _initSweep(lg):
+    global _sweep_log
+    _sweep_log = lg
+
+def _drawVariant(path, vscale, ticks, page, draw_args, precision = None, lg = None):
+    '''
+    Draws one variant of a sweep to its own file, returning the time taken.
+
+    '''
+    start = time.perf_counter()
+    if lg is None:
+        lg = _sweep_log
+    tmp = f'{path}.{os.getpid()}.part'
+    try:
+        with canvas(*page, out = tmp, precision = precision) as canv:
+            lg.draw(canv, vscale, ticks = ticks, **draw_args)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return time.perf_counter() - start
+
+def _perVariant(value, n, name):
+    # Lists give one value per variant, anything else is shared by all
+    if isinstance(value, list):
+        if(len(value) != n):
+            raise ValueError(f'{name} must be a single value or a list with one per vscale ({n}). Got {len(value)}.')
+        return value
+    return [value] * n
+
+def _sweep(lg, vscales, ticks = 20, paper = None, out = 'log_{vscale}.svg',
+           labels = None, label_strat = 'polite', man_colheight = None, columns = None,
+           jobs = None, precision = None, min_height = None, lod_widths = 'weighted'):
+    '''
+    Draws a Log at each of a list of scales. See Log.sweep().
+
+    '''
+    if lg._data is None:
+        raise ValueError('No log to draw. Call setData() first.')
+    n = len(vscales)
+    ticks = _perVariant(ticks, n, 'ticks')
+    paper = [lg.page if p is None else ((None, None, p) if isinstance(p, str) else tuple(p))
+             for p in _perVariant(paper, n, 'paper')]
+    if('{' not in out):
+        stem, ext = os.path.splitext(out)
+        out = stem + '_{vscale}' + ext
+    paths = [out.format(vscale = vs, ticks = t, variant = i + 1)
+             for i, (vs, t) in enumerate(zip(vscales, ticks))]
+    if(len(set(paths)) < n):
+        raise ValueError(f'out ({out}) gives the same path to more than one variant. Add {{ticks}} or {{variant}} to it.')
+
+    # Check which variants fit their page before drawing any
+    top = lg.elevations[len(lg.elevations)-1]
+    colwidth = lg.gs_widths[len(lg.gs_widths)-1]
+    rows = []
+    for vs, t, p, path in zip(vscales, ticks, paper, paths):
+        row = {'vscale': vs, 'ticks': t, 'paper': p, 'columns': None, 'fits': False,
+               'path': None, 'seconds': None, 'problem': None}
+        cw, ch = pageSize(*p)
+        try:
+            colheight, cols = _fitColumns(top, vs, ch, lg.orig, lg.pad, man_colheight, columns)
+        except ValueError as ex:
+            row['problem'] = str(ex).splitlines()[0]
+            rows.append(row)
+            continue
+        row['columns'] = cols
+        per_page = layout.columnsPerPage(cw, lg.orig, lg.pad, lg.colspc, colwidth)
+        if(cols > per_page):
+            row['problem'] = f'Needs {cols} columns but only {per_page} fit across the page.'
+        else:
+            row.update(fits = True, path = path)
+        rows.append(row)
+
+    draw_args = dict(labels = labels, label_strat = label_strat,
+                     man_colheight = man_colheight, columns = columns,
+                     min_height = min_height, lod_widths = lod_widths)
+    todo = [(r['path'], r['vscale'], r['ticks'], r['paper']) for r in rows if r['fits']]
+    # Label texts are shared by every variant, so work them out before
+    # copying the log to other processes
+    lg._labelTexts(_checkLabels(labels, len(lg.fac_idx)))
+    if((jobs == 1) or (len(todo) < 2)):
+        secs = [_drawVariant(*v, draw_args, precision, lg) for v in todo]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers = jobs, initializer = _initSweep, initargs = (lg,)) as pool:
+            futures = [pool.submit(_drawVariant, *v, draw_args, precision) for v in todo]
+            secs = [f.result() for f in futures]
+    for r in [r for r in rows if r['fits']]:
+        r['seconds'] = secs.pop(0)
+    results = pd.DataFrame(rows, columns = ['vscale', 'ticks', 'paper', 'columns', 'fits',
+                                            'path', 'seconds', 'problem'])
+    results['columns'] = results['columns'].astype('Int64')
+    return results
+
+def drawLogSweep(elevations, vscales,
+                 grain_base, grain_top, facies,
+                 gs_codes, gs_widths, fcodes, fcolors,
+                 out = 'log_{vscale}.svg', ticks = 20, paper = None,
+                 orig = 40, pad = 5, colspc = 40, lnwgt = 0.5,
+                 man_colheight = None, columns = None,
+                 labels = None, label_strat = 'polite',
+                 nachar = 'NaN', validated = None, jobs = None, precision = None,
+                 min_height = None, lod_widths = 'weighted'):
+    '''
+    Draws one log at several vertical scales, each to its own SVG file. The
+    log is checked and looked up once for all of them and the variants are
+    drawn at the same time in separate processes. Variants that do not fit on
+    their page are reported rather than raising an error.
+
+    Arguments are as for drawLog, except:
+
+    Parameters
+    ----------
+    vscales : list of int
+        Vertical scales to draw the log at.
+    out : str, optional
+        Path to write each variant to, containing any of {vscale}, {ticks}
+        and {variant} (the position of the variant, starting from 1). The
+        default is 'log_{vscale}.svg'.
+    ticks : float or list, optional
+        Tick interval (in m) for every variant, or a list with one per vscale.
+        The default is 20.
+    paper : str, tuple or list, optional
+        Page for every variant, either a standard size ('a4') or a (width,
+        height, standard) tuple as for canvas(), or a list with one per
+        vscale. The default is None, which gives a US letter page.
+    jobs : int, optional
+        Number of variants to draw at once, or None for one per core. The
+        default is None.
+    precision : int, optional
+        Rounds coordinates to this many decimal places and writes compact SVG
+        (see backends.SvgStream). The default is None.
+
+    Returns
+    -------
+    results : pd.DataFrame
+        One row per variant with its vscale, ticks, paper, number of columns,
+        whether it fits the page, the path written (None if it did not fit),
+        the time taken to draw it and what stopped it fitting.
+
+    '''
+    lg = Log(gs_codes, gs_widths, fcodes, fcolors,
+             orig = orig, pad = pad, colspc = colspc, lnwgt = lnwgt, nachar = nachar)
+    lg.setData(elevations, grain_base, grain_top, facies, validated = validated)
+    return lg.sweep(vscales, ticks = ticks, paper = paper, out = out,
+                    labels = labels, label_strat = label_strat,
+                    man_colheight = man_colheight, columns = columns,
+                    jobs = jobs, precision = precision,
+                    min_height = min_height, lod_widths = lod_widths)
@@ -3,129 +3,75 @@
 Created on Tue Jan 10 09:19:19 2023
 
 @author: rghs
+
+Object-oriented interface for sed log maker. The log class started here is
+now drawings.Log; log below keeps this module's original signatures for code
+written against it, and hands everything else to drawings.Log.
 """
 
 import numpy as np
-import pandas as pd
-import drawSvg as d
+from drawings import Log, greater, pageSize
+from scales import convert
 
-def greater(x,y):
+class log(Log):
     '''
-    Returns greater of two numbers entered. Accepts floats and ints.
+    drawings.Log with the original signatures of this module: page height
+    before width (in mm) with a standard size taking priority over both,
+    camelCase lookup arguments with 'default' for the built in lookups, grain
+    size widths as fractions of logWidth (mm) and a drawCanvas() that keeps
+    the canvas as log.canvas. Any other keyword arguments go to drawings.Log.
 
     '''
-    if(x>y):
-        return x
-    else:
-        return y
+    standardNames = ['letter', 'tabloid', 'legal', 'a3', 'a4', 'a5']
 
-class log:
-    def __init__(self, pageheight=None, pagewidth=None, standard=None):
+    def __init__(self, pageheight = None, pagewidth = None, standard = None, **kwargs):
         if standard is not None:
             standard = standard.lower()
-        
-        standardSizes = [(279,216), # Letter
-                         (432,279), # Tabloid
-                         (356,216), # Legal
-                         (420,297), # A3
-                         (297,210), # A4
-                         (210,148)] # A5
-        standardNames = ['letter','tabloid','legal',
-                        'a3','a4','a5']
-        
-        if standard in standardNames:
-            self.pageheight = standardSizes[standardNames.index(standard)][0]
-            self.pagewidth = standardSizes[standardNames.index(standard)][1]
-        elif(isinstance(pageheight,(float,int)) and isinstance(pagewidth,(float,int))):
-            self.pageheight = pageheight
-            self.pagewidth = pagewidth
-        elif((standard not in standardNames) and (pageheight is None) and (pagewidth is None)):
+        if standard in self.standardNames:
+            pageheight = pagewidth = None
+        elif((pageheight is None) and (pagewidth is None)):
             raise ValueError(f'{standard} is inappropriate value for standard page size.')
-        elif((isinstance(pageheight,(float,int)) is False) or (isinstance(pagewidth,(float,int))) is False):
+        elif((isinstance(pageheight,(float,int)) is False) or (isinstance(pagewidth,(float,int)) is False)):
             raise TypeError('Arguments for pageheight and pagewidth must be of type "int" or "float".')
-        else:
-            raise Exception('Unexpected input value.')
-        
-        
-    def __str__(self):
-        return f'Log page size:\nHeight: {self.pageheight} mm\nWidth: {self.pagewidth} mm'
-    
-    def drawCanvas(self):
-        self.canvas = d.Drawing(self.pagewidth,
-                                self.pageheight,
-                                origin=(0,0),
-                                displayInline=False)
-    
+        super().__init__(width = pagewidth, height = pageheight, standard = standard, **kwargs)
+        self.canvas = None
+
+    @property
+    def pageheight(self):
+        return convert(pageSize(*self.page)[1], 'pt', 'mm')
+
+    @property
+    def pagewidth(self):
+        return convert(pageSize(*self.page)[0], 'pt', 'mm')
+
+    def drawCanvas(self, out = None, precision = None):
+        self.canvas = super().drawCanvas(out = out, precision = precision)
+        return self.canvas
+
     def assignGrainSizes(self, grainSizeCodes = 'default', grainSizeWidths = 'default', logWidth = 75):
-        defaultGrainSizeCodes = pd.Series(['NaN',
-                                           'cl','si',
-                                           'vf','f','m','c','vc',
-                                           'gr','pebb','cobb','boul'])
-        defaultGrainSizeWidths = pd.Series([0.1,
-                                            0.2, 0.3,
-                                            0.4, 0.45, 0.5, 0.55, 0.6,
-                                            0.7, 0.8, 0.9, 1.0])
-        # Error handling clauses
-        if((grainSizeCodes == 'default') and (grainSizeWidths != 'default')):
-            if(len(defaultGrainSizeCodes) != len(grainSizeWidths)):
-                raise ValueError(f'Length of grainSizeWidths must equal length of default grainSizeCodes array ({len(defaultGrainSizeCodes)})')
-        
-        if((grainSizeCodes != 'default') and (grainSizeWidths == 'default')):
-            if(len(defaultGrainSizeWidths) != len(grainSizeCodes)):
-                raise ValueError(f'Length of grainSizeCodes must equal length of default grainSizeWidths array ({len(defaultGrainSizeWidths)})')
-        
-        if(len(grainSizeCodes) != len(grainSizeWidths)):
-            raise ValueError('grainSizeCodes and grainSizeWidths must be of identical length.')
-        
-        # Value assignment
-        if(grainSizeCodes == 'default'):
-            self.grainSizeCodes = defaultGrainSizeCodes
-        else:
-            self.grainSizeCodes = pd.Series(grainSizeCodes)
-        
-        if(grainSizeWidths == 'default'):
-            self.grainSizeWidths = defaultGrainSizeWidths * logWidth
-        else:
-            self.grainSizeWidths = grainSizeWidths * logWidth
-        
-        if((grainSizeCodes == 'default') and (grainSizeWidths == 'default')):
-            self.grainSizeCodes = pd.Series(['NaN',
-                                             'cl','si',
-                                             'vf','f','m','c','vc',
-                                             'gr','pebb','cobb','boul'])
-            self.grainSizeWidths = pd.Series([0.1,
-                                              0.2, 0.3,
-                                              0.4, 0.45, 0.5, 0.55, 0.6,
-                                              0.7, 0.8, 0.9, 1.0])*logWidth
-        if((grainSizeCodes == 'default') or (grainSizeWidths == 'default')):
+        codes_default = isinstance(grainSizeCodes, str) and grainSizeCodes == 'default'
+        widths_default = isinstance(grainSizeWidths, str) and grainSizeWidths == 'default'
+        if(codes_default and widths_default):
+            super().assignGrainSizes(None, logWidth, 'mm')
+        elif(codes_default or widths_default):
             raise TypeError('Either both or neither of grainSizeCodes and grainSizeWidths should be "default".')
-        elif(len(grainSizeCodes) != len(grainSizeWidths)):
-            raise ValueError('grainSizeCodes and grainSizeWidths must be of identical length.')
         else:
-            self.grainSizeCodes = pd.Series(grainSizeCodes)
-            self.grainSizeWidths = pd.Series(grainSizeWidths)
-            
+            super().assignGrainSizes(grainSizeCodes, np.asarray(grainSizeWidths) * logWidth, 'mm')
+
     def assignFacies(self, faciesCodes = 'default', faciesColors = 'default'):
-        if((faciesCodes == 'default') and (faciesColors == 'default')):
-            self.faciesCodes = pd.Series(['inaccessible','cov',
-                                           'fcm','fcl','fcr','fcrc','fcrw',
-                                           'fsm','fsl','fsr','fsrc','fsrw',
-                                           'sm','sh','sp','st','sr','src','srw',
-                                           'gmm','gmmi',
-                                           'gcm','gcmi','gcp','gct','gch'])
-            self.faciesColors = pd.Series(['#FFFFFF','#FFFFFF',
-                                            '#5A4854','#74576A','#8C627E','#A57093','#D998C1',
-                                            '#666154','#807969','#99917D','#B3A993','#CCC1A7',
-                                            '#E3AB4A','#DBB75C','#FDBB45','#FBB672','#FFCE6F','#EE9621','#F68C35',
-                                            '#99834F','#E5C376',
-                                            '#661714','#8D211D','#B22C26','#D93328','#EF4130'])
-        elif((faciesCodes == 'default') or (faciesColors == 'default')):
+        codes_default = isinstance(faciesCodes, str) and faciesCodes == 'default'
+        colors_default = isinstance(faciesColors, str) and faciesColors == 'default'
+        if(codes_default and colors_default):
+            super().assignFacies()
+        elif(codes_default or colors_default):
             raise TypeError('Either both or neither of faciesCodes and faciesColors should be "default".')
         elif(len(faciesCodes) != len(faciesColors)):
             raise ValueError('faciesCodes and faciesColors must be of identical length.')
         else:
-            self.faciesCodes = pd.Series(faciesCodes)
-            self.faciesColors = pd.Series(faciesColors)
-    
-x = log(standard='A4')
-print(x)
\ No newline at end of file
+            super().assignFacies(faciesCodes, faciesColors)
+
+    # Lookups under their original names
+    grainSizeCodes = property(lambda self: self.gs_codes)
+    grainSizeWidths = property(lambda self: self.gs_widths)
+    faciesCodes = property(lambda self: self.fcodes)
+    faciesColors = property(lambda self: self.fcolors)
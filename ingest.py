@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Chunked log reading for sed log maker
+
+Reads log CSVs (in the format of the example files) a chunk of rows at a time,
+so logs with millions of units can be drawn without holding them in memory.
+Elevations are carried over from one chunk to the next.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Column names used in the example files
+DEFAULT_COLUMNS = {'thickness': 'thickness',
+                   'gs_base': 'gs_base',
+                   'gs_top': 'gs_top',
+                   'facies': 'code'}
+
+def _names(columns = None):
+    names = dict(DEFAULT_COLUMNS)
+    if columns is not None:
+        names.update(columns)
+    return names
+
+def logHeight(path, columns = None, chunksize = 1000000):
+    '''
+    Returns the total thickness (in m) of a log CSV, reading only the
+    thickness column. Gives the same value as the top of elevs().
+
+    Parameters
+    ----------
+    path : str
+        Path to log CSV.
+    columns : dict, optional
+        Column names, if they differ from DEFAULT_COLUMNS. The default is None.
+    chunksize : int, optional
+        Number of rows read at once. The default is 1000000.
+
+    '''
+    thickness = _names(columns)['thickness']
+    top = 0.0
+    for chunk in pd.read_csv(path, usecols = [thickness], dtype = {thickness: 'float64'},
+                             chunksize = chunksize):
+        top = np.cumsum(np.append(top, chunk[thickness].to_numpy()))[-1]
+    return top
+
+def readChunks(path, chunksize = 100000, columns = None, labels = None):
+    '''
+    Reads a log CSV a chunk of rows at a time. Only the columns needed for
+    drawing are read; grain sizes and facies are read as categoricals and
+    thicknesses as floats.
+
+    Parameters
+    ----------
+    path : str
+        Path to log CSV.
+    chunksize : int, optional
+        Number of units per chunk. The default is 100000.
+    columns : dict, optional
+        Names of the thickness, gs_base, gs_top and facies columns if they
+        differ from DEFAULT_COLUMNS. The default is None.
+    labels : str, optional
+        Name of a column of unit labels to read as well. The default is None.
+
+    Yields
+    ------
+    chunk : pd.DataFrame
+        Units in the chunk, indexed by row number in the whole file, with two
+        extra columns, elev_base and elev_top, giving the elevation (in m) of
+        the base and top of each unit from the base of the log.
+
+    '''
+    names = _names(columns)
+    usecols = list(names.values())
+    dtypes = {names['thickness']: 'float64',
+              names['gs_base']: 'category',
+              names['gs_top']: 'category',
+              names['facies']: 'category'}
+    if labels is not None:
+        usecols.append(labels)
+        dtypes[labels] = 'str'
+
+    # Carry the elevation over chunk boundaries, summing in the same order as
+    # elevs() so the results are identical
+    top = 0.0
+    for chunk in pd.read_csv(path, usecols = usecols, dtype = dtypes, chunksize = chunksize):
+        elev = np.cumsum(np.append(top, chunk[names['thickness']].to_numpy()))
+        chunk['elev_base'] = elev[:-1]
+        chunk['elev_top'] = elev[1:]
+        top = elev[-1]
+        yield chunk
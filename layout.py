@@ -0,0 +1,427 @@
+# -*- coding: utf-8 -*-
+"""
+Geometry engine for sed log maker
+
+Works out where every unit of a log sits on the page as NumPy arrays, without
+drawing anything. Rendering functions in drawings.py consume the output.
+"""
+
+import numpy as np
+import scales
+
+#%% Record layouts
+
+# One record per unit in the log
+unit_dtype = np.dtype([('col', np.intp),     # Column holding the base of the unit
+                       ('x1', float),        # Left edge of unit
+                       ('x2', float),        # Right edge at base of unit
+                       ('x3', float),        # Right edge at top of unit
+                       ('y1', float),        # Base of unit relative to its column
+                       ('y2', float),        # Top of unit relative to its column
+                       ('split', bool),      # Unit runs over the top of its column
+                       ('lcol', np.intp),    # Column holding the label
+                       ('lx', float),        # Label anchor
+                       ('ly', float),
+                       ('ldelta', float)])   # Visible height of the labelled part
+
+# One record per polygon drawn; split units produce several
+part_dtype = np.dtype([('unit', np.intp),    # Index of the unit the part belongs to
+                       ('col', np.intp),
+                       ('x1', float),
+                       ('x2', float),
+                       ('x3', float),
+                       ('y1', float),
+                       ('y2', float),
+                       ('clipped', bool),    # Part must be clipped to its column
+                       ('cy1', float),       # Visible vertical extent of part
+                       ('cy2', float)])
+
+#%% Layout functions
+
+def columnBounds(top, colheight):
+    '''
+    Returns the elevations (in pt) of the tops of all columns needed to hold a
+    log of a given height.
+
+    Parameters
+    ----------
+    top : float
+        Height of the log in pt.
+    colheight : float
+        Height of each column in pt.
+
+    Returns
+    -------
+    bounds : np.ndarray
+        Tops of columns 0, 1, 2... in pt from base of log.
+
+    '''
+    ncols = int(np.ceil(top/colheight)) + 1
+    return np.arange(1, ncols + 1) * colheight
+
+def columnsPerPage(width, orig, pad, colspc, colwidth):
+    '''
+    Works out how many columns fit across a page.
+
+    Parameters
+    ----------
+    width : float
+        Width of the page in pt.
+    orig : float
+        Position (in pt) of the left edge of the first column.
+    pad : float
+        Padding (in pt) at the right edge of the page.
+    colspc : float
+        Spacing (in pt) between the columns.
+    colwidth : float
+        Width (in pt) of each column, normally the widest grain size.
+
+    Returns
+    -------
+    ncols : int
+        Number of columns that fit on the page.
+
+    '''
+    ncols = int(np.floor((width - pad - orig - colwidth)/(colspc + colwidth))) + 1
+    if ncols < 1:
+        raise ValueError('\n'.join(('Page is too narrow to fit a single column.',
+                                    f'Page width (pt) = {width}',
+                                    f'Space needed (pt) = {orig + colwidth + pad}')))
+    return ncols
+
+def computeLayout(elevations, base_w, top_w, vscale,
+                  colheight, colspc, orig, colwidth, col0 = 0):
+    '''
+    Computes the position of every unit in a log in one vectorized pass.
+
+    Parameters
+    ----------
+    elevations : array-like
+        Elevations (in m) of the base and top of each unit. Can be created from
+        thickness data using drawings.elevs().
+    base_w : array-like
+        Width (in pt) of each unit at its base.
+    top_w : array-like
+        Width (in pt) of each unit at its top.
+        base_w and top_w can be created with drawings.unitLookup().
+    vscale : int or scales.Scale
+        Scale at which to draw log in form X:1.
+    colheight : float
+        Height (in pt) of each column.
+    colspc : float
+        Spacing (in pt) between the columns.
+    orig : float
+        Coordinates (in pt) of the base of the first column in form (x,x).
+    colwidth : float
+        Width (in pt) of each column, normally the widest grain size.
+    col0 : int, optional
+        Column drawn at orig. Columns are still numbered from the base of the
+        log, but x positions are measured from column col0 so that later pages
+        of a log start at the left of the page. The default is 0.
+
+    Returns
+    -------
+    units : np.ndarray
+        Structured array (see unit_dtype) with one record per unit.
+    parts : np.ndarray
+        Structured array (see part_dtype) with one record per polygon to draw.
+
+    '''
+    elevations = scales.asScale(vscale).toPoints(np.asarray(elevations, dtype=float)).astype(float, copy=False)
+    base_w = np.asarray(base_w, dtype=float)
+    top_w = np.asarray(top_w, dtype=float)
+    base = elevations[:-1]
+    top = elevations[1:]
+    n = len(base)
+
+    # Column holding the base of each unit
+    bounds = columnBounds(elevations[-1] if n > 0 else 0, colheight)
+    col = np.searchsorted(bounds, base, side='left')
+
+    units = np.zeros(n, dtype=unit_dtype)
+    units['col'] = col
+    units['x1'] = ((col - col0) * colspc) + orig + ((col - col0) * colwidth)
+    units['x2'] = units['x1'] + base_w
+    units['x3'] = units['x1'] + top_w
+    units['y1'] = base - (col * colheight) + orig
+    units['y2'] = top - (col * colheight) + orig
+    units['split'] = units['y2'] > (colheight + orig)
+
+    # Unsplit units are drawn whole
+    whole = units[~units['split']]
+    whole_parts = np.zeros(len(whole), dtype=part_dtype)
+    whole_parts['unit'] = np.flatnonzero(~units['split'])
+    for f in ('col', 'x1', 'x2', 'x3', 'y1', 'y2'):
+        whole_parts[f] = whole[f]
+    whole_parts['cy1'] = whole['y1']
+    whole_parts['cy2'] = whole['y2']
+
+    # Split units are drawn once in every column they reach, each part
+    # clipped to the column it is drawn in
+    split_idx = np.flatnonzero(units['split'])
+    top_col = np.searchsorted(bounds, top[split_idx], side='left')
+    nspan = top_col - col[split_idx] + 1
+    owner = np.repeat(split_idx, nspan)
+    group = np.repeat(np.arange(len(split_idx)), nspan)
+    first = np.cumsum(nspan) - nspan
+    offset = np.arange(len(owner)) - first[group]
+    split_parts = np.zeros(len(owner), dtype=part_dtype)
+    split_parts['unit'] = owner
+    split_parts['col'] = col[owner] + offset
+    split_parts['x1'] = ((split_parts['col'] - col0) * colspc) + orig + ((split_parts['col'] - col0) * colwidth)
+    split_parts['x2'] = split_parts['x1'] + base_w[owner]
+    split_parts['x3'] = split_parts['x1'] + top_w[owner]
+    split_parts['y1'] = base[owner] - (split_parts['col'] * colheight) + orig
+    split_parts['y2'] = top[owner] - (split_parts['col'] * colheight) + orig
+    split_parts['cy1'] = np.maximum(split_parts['y1'], orig)
+    split_parts['cy2'] = np.minimum(split_parts['y2'], colheight + orig)
+    split_parts['clipped'] = True
+
+    parts = np.concatenate((whole_parts, split_parts))
+    parts = parts[np.argsort(parts['unit'], kind='stable')]
+
+    # Labels go beside the biggest visible part of each unit, the highest one
+    # if several are equally big
+    units['lcol'] = units['col']
+    units['lx'] = np.maximum(units['x2'], units['x3']) + 5
+    units['ly'] = (units['y1'] + units['y2'])/2
+    units['ldelta'] = units['y2'] - units['y1']
+    if len(split_idx) > 0:
+        visible = split_parts['cy2'] - split_parts['cy1']
+        biggest = np.maximum.reduceat(visible, first)[group]
+        pick = np.maximum.reduceat(np.where(visible == biggest, np.arange(len(owner)), -1), first)
+        label_part = split_parts[pick]
+        units['lcol'][split_idx] = label_part['col']
+        units['lx'][split_idx] = np.maximum(label_part['x2'], label_part['x3']) + 5
+        units['ly'][split_idx] = (label_part['cy1'] + label_part['cy2'])/2
+        units['ldelta'][split_idx] = label_part['cy2'] - label_part['cy1']
+
+    return units, parts
+
+def mergeUnits(elevations, base_w, top_w, fac_idx, vscale, min_height, widths = 'weighted'):
+    '''
+    Level of detail pass for small scales. Runs of units drawn thinner than
+    min_height are merged into units about min_height tall, so the number of
+    polygons drawn depends on the height of the log on the page rather than
+    on the number of units. Units at least min_height tall are left alone.
+    Thin units are merged with the thin units next to them that share a
+    min_height band up the log, and each merged unit takes the facies that
+    makes up most of its thickness.
+
+    Parameters
+    ----------
+    elevations : array-like
+        Elevations (in m) of the base and top of each unit.
+    base_w, top_w : array-like
+        Width (in pt) of each unit at its base and top.
+    fac_idx : array-like of int
+        Facies (as positions in the facies lookup) of each unit.
+    vscale : int or scales.Scale
+        Scale at which the log is drawn in form X:1.
+    min_height : float
+        Height (in pt) below which units are merged.
+    widths : str, optional
+        Width of merged units: 'weighted' for the mean width of the units
+        merged, weighted by thickness, or 'dominant' for the widths of the
+        thickest of them. The default is 'weighted'.
+
+    Returns
+    -------
+    elevations, base_w, top_w, fac_idx : np.ndarray
+        The units to draw, as given.
+    starts : np.ndarray
+        Position of the first original unit in each unit drawn, with the
+        number of original units at the end, so units starts[i] to
+        starts[i+1]-1 were merged into unit i.
+
+    '''
+    if widths not in ('weighted', 'dominant'):
+        raise ValueError(f'widths must be "weighted" or "dominant". Got "{widths}".')
+    elevations = np.asarray(elevations, dtype=float)
+    base_w = np.asarray(base_w, dtype=float)
+    top_w = np.asarray(top_w, dtype=float)
+    fac_idx = np.asarray(fac_idx, dtype=np.intp)
+    n = len(fac_idx)
+    e_pt = scales.asScale(vscale).toPoints(elevations).astype(float, copy=False)
+    thick = np.diff(elevations)
+    thin = np.diff(e_pt) < min_height
+    band = np.floor(e_pt[:-1]/min_height)
+
+    # A new unit starts at every unit that is not thin, after every unit that
+    # is not thin and wherever a run of thin units crosses into another band
+    new = np.ones(n, dtype=bool)
+    new[1:] = ~(thin[1:] & thin[:-1] & (band[1:] == band[:-1]))
+    starts = np.append(np.flatnonzero(new), n)
+    group = np.cumsum(new) - 1
+    if len(starts) - 1 == n:
+        return elevations, base_w, top_w, fac_idx, starts
+
+    # Thickness of each facies in each merged unit. Pairs are sorted by group
+    # then facies, so the first pair of each group holding its most thickness
+    # gives its dominant facies
+    nf = fac_idx.max() + 1 if n > 0 else 1
+    pairs, inverse = np.unique(group * nf + fac_idx, return_inverse = True)
+    totals = np.bincount(inverse, weights = thick)
+    pair_group = pairs // nf
+    first = np.searchsorted(pair_group, np.arange(len(starts) - 1))
+    most = np.maximum.reduceat(totals, first)
+    pick = np.flatnonzero(totals == most[pair_group])
+    pick = pick[np.concatenate(([True], pair_group[pick][1:] != pair_group[pick][:-1]))]
+    m_fac = (pairs[pick] % nf).astype(np.intp)
+
+    if widths == 'weighted':
+        # Units of no thickness count equally in merged units of no thickness
+        span = np.add.reduceat(thick, starts[:-1])
+        weight = np.where(span[group] > 0, thick, 1.0)
+        mean = np.add.reduceat(weight * (base_w + top_w)/2, starts[:-1])/np.add.reduceat(weight, starts[:-1])
+        # Units left on their own keep their widths
+        single = np.diff(starts) == 1
+        m_base = np.where(single, base_w[starts[:-1]], mean)
+        m_top = np.where(single, top_w[starts[:-1]], mean)
+    else:
+        order = np.lexsort((-thick, group))
+        thickest = order[np.searchsorted(group[order], np.arange(len(starts) - 1))]
+        m_base, m_top = base_w[thickest], top_w[thickest]
+    return elevations[starts], m_base, m_top, m_fac, starts
+
+def placeLabels(units, labelled, colheight, orig, size = 9, max_shift = None):
+    '''
+    Moves labels apart so that they do not overlap, dropping those that cannot
+    be fitted in. Labels are swept up each column in order of height and
+    pushed up clear of the label below. Labels that would have to move more
+    than max_shift, or be pushed off the top of their column, are dropped,
+    starting with the labels of the thinnest units in each crowded group.
+
+    Parameters
+    ----------
+    units : np.ndarray
+        Structured array (see unit_dtype) from computeLayout().
+    labelled : array-like of bool
+        Which units have a label to place.
+    colheight : float
+        Height (in pt) of each column.
+    orig : float
+        Position (in pt) of the base of the columns.
+    size : float, optional
+        Height (in pt) of a label. The default is 9.
+    max_shift : float, optional
+        Furthest (in pt) a label may be moved from beside its unit. The
+        default is one label height.
+
+    Returns
+    -------
+    keep : np.ndarray
+        Whether each unit's label is drawn.
+    ly : np.ndarray
+        Height of each label, moved where needed.
+
+    '''
+    if max_shift is None:
+        max_shift = size
+    keep = np.zeros(len(units), dtype=bool)
+    ly = units['ly'].copy()
+    idx = np.flatnonzero(labelled)
+    if len(idx) == 0:
+        return keep, ly
+
+    # Sort candidates by column then height
+    order = idx[np.lexsort((units['ly'][idx], units['lcol'][idx]))]
+    col = units['lcol'][order]
+    anchor = units['ly'][order]
+    priority = units['ldelta'][order]
+    top = colheight + orig - size/2
+    alive = np.ones(len(order), dtype=bool)
+
+    while True:
+        live = np.flatnonzero(alive)
+        c, a = col[live], anchor[live]
+        new_col = np.concatenate(([True], c[1:] != c[:-1]))
+        group = np.cumsum(new_col) - 1
+        k = np.arange(len(live)) - np.flatnonzero(new_col)[group]
+        # Pushing each label clear of the one below gives
+        # y[k] = max(a[j] + (k-j)*size for j <= k), a running maximum taken
+        # over each column on its own so that columns cannot affect each
+        # other's rounding. Labels that are not pushed keep y == a exactly
+        v = a - k * size
+        m = np.empty_like(v)
+        bounds = np.append(np.flatnonzero(new_col), len(live))
+        for s0, s1 in zip(bounds[:-1], bounds[1:]):
+            np.maximum.accumulate(v[s0:s1], out = m[s0:s1])
+        y = np.where(m == v, a, m + k * size)
+
+        bad = ((y - a) > max_shift) | ((y > a) & (y > top))
+        if not bad.any():
+            break
+
+        # Labels pushed together form a cluster. Drop the lowest priority
+        # labels from each cluster with bad ones, as many as it holds more than
+        # fit between its lowest and highest anchors (at least one)
+        touching = np.concatenate(([False], ~new_col[1:] & ((y[1:] - y[:-1]) < size * (1 + 1e-9))))
+        cluster = np.cumsum(~touching) - 1
+        firsts = np.flatnonzero(~touching)
+        lasts = np.concatenate((firsts[1:], [len(live)])) - 1
+        fit = np.floor((a[lasts] - a[firsts] + max_shift)/size).astype(int) + 1
+        excess = np.diff(np.concatenate((firsts, [len(live)]))) - fit
+        nbad = np.bincount(cluster, weights = bad).astype(int)
+        nbad = np.where(nbad > 0, np.clip(excess, 1, nbad), 0)
+        ranked = np.lexsort((priority[live], cluster))
+        starts = np.searchsorted(cluster[ranked], np.arange(cluster[-1] + 1))
+        rank = np.empty(len(live), dtype=np.intp)
+        rank[ranked] = np.arange(len(live)) - starts[cluster[ranked]]
+        alive[live[rank < nbad[cluster]]] = False
+
+    keep[order[live]] = True
+    ly[order[live]] = y
+    return keep, ly
+
+def panelLayout(base, top, base_w, top_w, log, vscale, shift, xs):
+    '''
+    Computes the position of every unit of several logs drawn side by side,
+    each log in a single column, in one vectorized pass.
+
+    Parameters
+    ----------
+    base, top : array-like
+        Elevations (in m) of the base and top of every unit of every log, one
+        log after another.
+    base_w, top_w : array-like
+        Width (in pt) of each unit at its base and top.
+    log : array-like of int
+        Which log each unit belongs to, counting from 0.
+    vscale : int or scales.Scale
+        Scale at which to draw the logs in form X:1.
+    shift : array-like
+        Height (in pt) on the page of 0 m in each log, lining the logs up.
+    xs : array-like
+        Left edge (in pt) of each log.
+
+    Returns
+    -------
+    units, parts : np.ndarray
+        As for computeLayout(), with the log number as the column. No unit
+        is split, so there is one part per unit.
+
+    '''
+    vscale = scales.asScale(vscale)
+    log = np.asarray(log, dtype=np.intp)
+    shift = np.asarray(shift, dtype=float)[log]
+    x1 = np.asarray(xs, dtype=float)[log]
+    units = np.zeros(len(log), dtype=unit_dtype)
+    units['col'] = log
+    units['x1'] = x1
+    units['x2'] = x1 + np.asarray(base_w, dtype=float)
+    units['x3'] = x1 + np.asarray(top_w, dtype=float)
+    units['y1'] = vscale.toPoints(np.asarray(base, dtype=float)) + shift
+    units['y2'] = vscale.toPoints(np.asarray(top, dtype=float)) + shift
+    units['lcol'] = log
+    units['lx'] = np.maximum(units['x2'], units['x3']) + 5
+    units['ly'] = (units['y1'] + units['y2'])/2
+    units['ldelta'] = units['y2'] - units['y1']
+
+    parts = np.zeros(len(log), dtype=part_dtype)
+    parts['unit'] = np.arange(len(log))
+    for f in ('col', 'x1', 'x2', 'x3', 'y1', 'y2'):
+        parts[f] = units[f]
+    parts['cy1'] = units['y1']
+    parts['cy2'] = units['y2']
+    return units, parts
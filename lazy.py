@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+Deferred imports for sed log maker
+
+pandas and drawSvg take far longer to import than the rest of the package put
+together, and many runs need neither of them: laying out, checking and
+streaming a log to SVG only needs NumPy. Modules that use them hold a
+LazyModule instead, which imports the real module the first time one of its
+attributes is used.
+"""
+
+import importlib
+import sys
+
+class LazyModule:
+    '''
+    Stand-in for a module that is imported on first use. If several names
+    are given, the first one that imports is used (e.g. 'drawSvg' then
+    'drawsvg').
+    '''
+    def __init__(self, *names):
+        self._lazy_names = names
+        self._lazy_module = None
+
+    def __repr__(self):
+        state = 'loaded' if self._lazy_module is not None else 'not loaded'
+        return f'LazyModule({", ".join(self._lazy_names)}: {state})'
+
+    def _lazyLoad(self):
+        if self._lazy_module is None:
+            err = None
+            for name in self._lazy_names:
+                try:
+                    self._lazy_module = importlib.import_module(name)
+                    break
+                except ImportError as ex:
+                    err = ex
+            else:
+                raise err
+        return self._lazy_module
+
+    def __getattr__(self, attr):
+        return getattr(self._lazyLoad(), attr)
+
+    @property
+    def loaded(self):
+        '''True if the module has been imported, here or anywhere else.'''
+        return any(name in sys.modules for name in self._lazy_names)
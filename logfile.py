@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+"""
+Binary log files for sed log maker
+
+Stores a log as typed columns in an uncompressed .npz file: thicknesses and
+elevations as floats, grain sizes, facies and labels as integer positions in
+lookup tables, and the grain size and facies lookups themselves along with any
+render settings. Nothing needs parsing when the file is read back, and loaded
+columns are memory-mapped straight from the file, so even logs of millions of
+units open in milliseconds. For example:
+
+    logfile.csvToLog('examples/test_long.csv', 'test_long.npz', labels = 'labels',
+                     params = {'vscale': 250})
+    log = logfile.loadLog('test_long.npz')
+    d = log.draw(dr.canvas())
+
+or from the command line:
+
+    python logfile.py "logs/*.csv" --out binary_logs
+"""
+
+import argparse
+import glob
+import json
+import os
+import struct
+import sys
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+import drawings as dr
+import ingest
+import scales
+
+FORMAT_VERSION = 1
+
+#%% Writing
+
+def _smallestInt(idx, count):
+    # Smallest signed type holding every position and -1
+    for dtype in (np.int8, np.int16, np.int32):
+        if count < np.iinfo(dtype).max:
+            return idx.astype(dtype)
+    return idx.astype(np.int64)
+
+def saveLog(path, thickness, grain_base, grain_top, facies,
+            gs_codes, gs_widths, fcodes, fcolors,
+            labels = None, params = None, nachar = 'NaN'):
+    '''
+    Validates a log and saves it as a binary log file.
+
+    Parameters
+    ----------
+    path : str
+        Path to write to. Should end in .npz.
+    thickness, grain_base, grain_top, facies : array-like
+        Thickness, grain size at base, grain size at top and facies code of
+        each unit, as in the example files.
+    gs_codes, gs_widths, fcodes, fcolors : pd.Series
+        Grain size and facies lookups, as created with grainsize() and
+        faciesList(). Stored with the log.
+    labels : array-like, optional
+        Label of each unit, blank for none. The default is None.
+    params : dict, optional
+        Keyword arguments for drawLog to store with the log, e.g.
+        {'vscale': 250, 'ticks': 10}. Must be JSON serializable. The default
+        is None.
+    nachar : str, optional
+        String specifying what blank cells contain. The default is 'NaN'.
+
+    Raises ValueError (as drawLog does) if the log does not validate.
+
+    '''
+    v = dr.validateUnits(grain_base, grain_top, facies, gs_codes, fcodes,
+                         thickness = thickness, labels = labels, nachar = nachar)
+    v.raiseErrors()
+    thickness = np.asarray(v.thickness, dtype = np.float64)
+    top_raw, top_blank, _ = dr._resolveCodes(grain_top, np.asarray(gs_codes), nachar)
+    arrays = {'thickness': thickness,
+              'elevations': scales.elevs(thickness),
+              'gs_base': _smallestInt(v.base_idx, len(gs_codes)),
+              'gs_top': _smallestInt(np.where(top_blank, -1, top_raw), len(gs_codes)),
+              'facies': _smallestInt(v.fac_idx, len(fcodes)),
+              'gs_codes': np.asarray(gs_codes, dtype = str),
+              'gs_widths': np.asarray(gs_widths, dtype = np.float64),
+              'fcodes': np.asarray(fcodes, dtype = str),
+              'fcolors': np.asarray(fcolors, dtype = str)}
+    if labels is not None:
+        values = np.asarray(v.labels, dtype = object)
+        blank = values == nachar
+        table, label_idx = np.unique(values[~blank].astype(str), return_inverse = True)
+        idx = np.full(len(values), -1, dtype = np.int64)
+        idx[~blank] = label_idx
+        arrays['labels'] = _smallestInt(idx, len(table))
+        arrays['label_table'] = table
+    meta = {'version': FORMAT_VERSION, 'nachar': nachar, 'params': params or {}}
+    arrays['meta'] = np.array(json.dumps(meta))
+
+    # Uncompressed so that columns can be memory-mapped when read back
+    tmp = f'{path}.{os.getpid()}.part'
+    with open(tmp, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp, path)
+
+def csvToLog(csv_path, path, gs_codes = None, gs_widths = None, fcodes = None, fcolors = None,
+             labels = None, params = None, nachar = 'NaN', columns = None):
+    '''
+    Converts a log CSV (in the format of the example files) to a binary log
+    file. Lookups default to those of grainsize() and faciesList().
+
+    Parameters
+    ----------
+    labels : str, optional
+        Name of the column holding unit labels, if any. The default is None.
+    columns : dict, optional
+        Names of the thickness, gs_base, gs_top and facies columns if they
+        differ from those in ingest.DEFAULT_COLUMNS. The default is None.
+
+    Other arguments are as for saveLog().
+
+    '''
+    if gs_codes is None:
+        gs_codes, gs_widths = dr.grainsize()
+    if fcodes is None:
+        fcodes, fcolors = dr.faciesList()
+    names = ingest._names(columns)
+    dtypes = {names['thickness']: 'float64',
+              names['gs_base']: 'category',
+              names['gs_top']: 'category',
+              names['facies']: 'category'}
+    usecols = list(names.values())
+    if labels is not None:
+        usecols.append(labels)
+        dtypes[labels] = 'str'
+    src = pd.read_csv(csv_path, usecols = usecols, dtype = dtypes)
+    saveLog(path, src[names['thickness']], src[names['gs_base']], src[names['gs_top']],
+            src[names['facies']], gs_codes, gs_widths, fcodes, fcolors,
+            labels = None if labels is None else src[labels], params = params, nachar = nachar)
+
+#%% Reading
+
+def _mapNpz(path):
+    '''
+    Memory-maps every array in an uncompressed .npz file. Returns None if the
+    file cannot be mapped (e.g. it is compressed).
+
+    '''
+    arrays = {}
+    with zipfile.ZipFile(path) as zf, open(path, 'rb') as f:
+        for info in zf.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                return None
+            # Data follows the 30 byte local file header, name and extra field
+            f.seek(info.header_offset)
+            name_len, extra_len = struct.unpack('<HH', f.read(30)[26:30])
+            f.seek(info.header_offset + 30 + name_len + extra_len)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+            elif version == (2, 0):
+                shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+            else:
+                return None
+            name = info.filename[:-4]
+            if dtype.hasobject:
+                return None
+            if((len(shape) == 0) or (np.prod(shape) == 0)):
+                arrays[name] = np.frombuffer(f.read(dtype.itemsize * int(np.prod(shape))),
+                                             dtype = dtype).reshape(shape)
+            else:
+                arrays[name] = np.memmap(path, dtype = dtype, mode = 'r', offset = f.tell(),
+                                         shape = shape, order = 'F' if fortran else 'C')
+    return arrays
+
+class StoredLog:
+    '''
+    Log read from a binary log file with loadLog().
+
+    Attributes
+    ----------
+    thickness, elevations : np.ndarray
+        Unit thicknesses, and elevations of the base of each unit and the top
+        of the log (n+1 values), in m.
+    base_idx, top_idx, fac_idx : np.ndarray
+        Position of each unit's grain sizes and facies in the lookups. top_idx
+        is -1 for units with a constant grain size.
+    gs_codes, gs_widths, fcodes, fcolors : pd.Series
+        Lookups stored with the log.
+    labels : np.ndarray or None
+        Label of each unit (nachar for none), if stored.
+    params : dict
+        drawLog keyword arguments stored with the log.
+    nachar : str
+        String used for blank cells.
+    '''
+    def __init__(self, arrays, path = None):
+        meta = json.loads(str(arrays['meta']))
+        if meta['version'] > FORMAT_VERSION:
+            raise ValueError(f'{path} was written by a newer version of sed log maker (format {meta["version"]}).')
+        self.path = path
+        self.nachar = meta['nachar']
+        self.params = meta['params']
+        self.thickness = arrays['thickness']
+        self.elevations = arrays['elevations']
+        self.base_idx = arrays['gs_base']
+        self.top_idx = arrays['gs_top']
+        self.fac_idx = arrays['facies']
+        self.gs_codes = pd.Series(np.asarray(arrays['gs_codes'], dtype = object))
+        self.gs_widths = pd.Series(np.asarray(arrays['gs_widths']))
+        self.fcodes = pd.Series(np.asarray(arrays['fcodes'], dtype = object))
+        self.fcolors = pd.Series(np.asarray(arrays['fcolors'], dtype = object))
+        self._label_idx = arrays.get('labels')
+        self._label_table = arrays.get('label_table')
+
+    def __len__(self):
+        return len(self.thickness)
+
+    def __repr__(self):
+        return f'StoredLog({self.path!r}, {len(self)} units, {self.elevations[-1]:.2f} m)'
+
+    def _codes(self, idx, codes):
+        # Blank (-1) cells pick nachar from the end of the table
+        return np.append(np.asarray(codes, dtype = object), self.nachar)[idx]
+
+    @property
+    def grain_base(self):
+        return self._codes(self.base_idx, self.gs_codes)
+
+    @property
+    def grain_top(self):
+        return self._codes(self.top_idx, self.gs_codes)
+
+    @property
+    def facies(self):
+        return self._codes(self.fac_idx, self.fcodes)
+
+    @property
+    def labels(self):
+        if self._label_idx is None:
+            return None
+        return self._codes(self._label_idx, self._label_table)
+
+    def validated(self):
+        '''
+        Returns a ValidatedLog for drawLog(validated = ...), built from the
+        stored positions without checking the log again (it was checked when
+        it was saved).
+
+        '''
+        fac_idx = np.asarray(self.fac_idx, dtype = np.intp)
+        base_idx = np.asarray(self.base_idx, dtype = np.intp)
+        top_idx = np.asarray(self.top_idx, dtype = np.intp)
+        return dr.ValidatedLog(self.grain_base, self.grain_top, self.facies,
+                               base_idx, np.where(top_idx < 0, base_idx, top_idx), fac_idx,
+                               self.thickness, self.labels,
+                               np.asarray(self.gs_codes), np.asarray(self.fcodes))
+
+    def draw(self, canv, **kwargs):
+        '''
+        Draws the log with drawLog, using the stored lookups and settings.
+        Keyword arguments override the stored settings. Labels stored with the
+        log are used unless labels is given.
+
+        '''
+        args = dict(self.params)
+        args.setdefault('labels', self.labels)
+        args.update(kwargs)
+        args.setdefault('nachar', self.nachar)
+        vscale = args.pop('vscale', 250)
+        v = self.validated()
+        return dr.drawLog(self.elevations, vscale, None, None, v.facies,
+                          self.gs_codes, self.gs_widths, self.fcodes, self.fcolors, canv,
+                          validated = v, **args)
+
+def loadLog(path, mmap = True):
+    '''
+    Reads a binary log file written by saveLog() or csvToLog().
+
+    Parameters
+    ----------
+    path : str
+        Path to the file.
+    mmap : bool, optional
+        Memory-map the columns rather than reading them into memory. The
+        default is True.
+
+    Returns
+    -------
+    log : StoredLog
+        The log, its lookups and settings.
+
+    '''
+    arrays = _mapNpz(path) if mmap is True else None
+    if arrays is None:
+        with np.load(path) as npz:
+            arrays = {k: npz[k] for k in npz.files}
+    return StoredLog(arrays, path)
+
+#%% Command line
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog = 'logfile',
+                                     description = 'Convert log CSVs to binary log files.')
+    parser.add_argument('inputs', nargs = '+', help = 'CSV files or glob patterns')
+    parser.add_argument('-o', '--out', default = '.', help = 'Output directory (default: current directory)')
+    parser.add_argument('-l', '--labels', help = 'Name of the label column, if any')
+    parser.add_argument('-c', '--config', help = 'JSON config file (as for sedlog.py) giving lookups and settings')
+    args = parser.parse_args(argv)
+
+    import sedlog
+    config = sedlog.loadConfig(args.config)
+    gs_codes, gs_widths, fcodes, fcolors = sedlog.lookups(config)
+    columns = {'thickness': config['thickness'], 'gs_base': config['gs_base'],
+               'gs_top': config['gs_top'], 'facies': config['facies_col']}
+    params = {k: config[k] for k in ('vscale', 'ticks', 'label_strat', 'orig', 'pad',
+                                     'colspc', 'lnwgt', 'man_colheight', 'columns')}
+    paths = sorted({p for pattern in args.inputs for p in glob.glob(pattern, recursive = True)})
+    if not paths:
+        parser.error('No input files matched.')
+    # Inputs of the same name in different folders get their own outputs
+    try:
+        names = sedlog.outputNames(paths, ext = '.npz')
+    except ValueError as ex:
+        parser.error(str(ex))
+    for path in paths:
+        out = os.path.join(args.out, names[path])
+        os.makedirs(os.path.dirname(out), exist_ok = True)
+        csvToLog(path, out, gs_codes, gs_widths, fcodes, fcolors, labels = args.labels,
+                 params = params, nachar = config['nachar'], columns = columns)
+        print(f'{path} -> {out}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""
+Correlation panels for sed log maker
+
+Draws several logs side by side on one canvas, lined up on a datum, with one
+elevation axis, one grain size scale per log and one key for the whole panel.
+Units of every log are laid out together in a single pass, e.g.
+
+    logs = [dr.Log().setData(dr.elevs(s.thickness), s.gs_base, s.gs_top, s.code)
+            for s in sections]
+    drawPanel(logs, 250, out = 'panel.svg', datum = 'MFS', labels = label_columns,
+              names = ['A', 'B', 'C'], ties = True).close()
+
+Logs must share the same grain size and facies lookups.
+"""
+
+import os
+import warnings
+import numpy as np
+import drawings as dr
+import backends
+import layout
+import profiling
+import scales
+
+#%% Panel layout
+
+def _panelLabels(logs, labels):
+    '''
+    Returns the label texts of each log, from a list with one entry per log
+    or anything else (a label mode, or one log's labels as a Series or array)
+    used for every log.
+
+    '''
+    if isinstance(labels, list) is False:
+        labels = [labels] * len(logs)
+    elif(len(labels) != len(logs)):
+        raise ValueError(f'A list of labels must have one entry per log. Got {len(labels)} entries for {len(logs)} logs.')
+    return [lg._labelTexts(dr._checkLabels(l, len(lg.fac_idx))) for lg, l in zip(logs, labels)]
+
+def datumElevations(logs, datum, texts = None):
+    '''
+    Works out the elevation (in m) of the datum in each log.
+
+    Parameters
+    ----------
+    logs : list of drawings.Log
+        Logs in the panel, with data set.
+    datum : str, float or list, optional
+        Label of the unit whose base is the datum (the first unit with that
+        label), an elevation in m, or a list of either with one per log. None
+        puts the datum at the base of each log.
+    texts : list, optional
+        Label texts of each log, as drawn. Needed for labelled datums.
+
+    Returns
+    -------
+    elevations : np.ndarray
+        Elevation of the datum in each log.
+
+    '''
+    if isinstance(datum, (list, tuple, np.ndarray)):
+        if(len(datum) != len(logs)):
+            raise ValueError(f'datum must be a single datum or have one per log. Got {len(datum)} for {len(logs)} logs.')
+    else:
+        datum = [datum] * len(logs)
+    found = np.zeros(len(logs))
+    for i, (lg, dt) in enumerate(zip(logs, datum)):
+        e = np.asarray(lg.elevations, dtype=float)
+        if dt is None:
+            found[i] = e[0]
+        elif isinstance(dt, str):
+            hits = [] if texts is None else [j for j, t in enumerate(texts[i]) if t == dt]
+            if len(hits) == 0:
+                raise ValueError(f'Datum "{dt}" is not the label of any unit in log {i}. Labelled datums need labels.')
+            found[i] = e[hits[0]]
+        else:
+            found[i] = float(dt)
+    return found
+
+def _tieIndices(texts_a, texts_b):
+    '''
+    Returns the positions of the first unit of each label found in both of
+    two neighbouring logs.
+
+    '''
+    a = np.array([t for t in texts_a if t is not None], dtype=object).astype(str)
+    b = np.array([t for t in texts_b if t is not None], dtype=object).astype(str)
+    pos_a = np.flatnonzero([t is not None for t in texts_a])
+    pos_b = np.flatnonzero([t is not None for t in texts_b])
+    _, ia, ib = np.intersect1d(a, b, return_indices = True)
+    order = np.argsort(ia, kind='stable')
+    return pos_a[ia[order]], pos_b[ib[order]]
+
+#%% Drawing
+
+def _drawPanelLogs(width, height, prefix, ids, precision, placed, lnwgt, orig):
+    '''
+    Draws the units of one or more logs of a panel to an SVG string.
+
+    '''
+    d = backends.SvgStream.detached(width, height, prefix, ids, precision)
+    for units, parts, texts, fac_idx, colwidth in placed:
+        dr._drawUnits(d, None, None, None, fac_idx, None,
+                      None, 0, 0, orig, colwidth, lnwgt, placed = (units, parts, texts))
+    return d.getvalue()
+
+def drawPanel(logs, vscale = 250, canv = None, out = None, precision = None,
+              datum = None, names = None, labels = None, label_strat = 'polite',
+              ticks = 20, ties = False, logspc = 100, key = True, key_rows = 'auto',
+              profiler = None, jobs = 1):
+    '''
+    Draws several logs side by side on one canvas as a correlation panel,
+    lined up on a datum.
+
+    Parameters
+    ----------
+    logs : list of drawings.Log
+        Logs to draw, from left to right, each with data set by setData().
+        Every log must use the same grain size and facies lookups. Page
+        settings (orig, pad, lnwgt) are taken from the first log.
+    vscale : int or scales.Scale, optional
+        Scale at which to draw the logs in form X:1. The default is 250.
+    canv : drawSvg object or render backend, optional
+        Canvas to draw on. The default is None, which makes a canvas just big
+        enough for the panel, streaming to out if it is given.
+    out : str or file-like, optional
+        Where to stream the panel, as for drawings.canvas(). Only used if canv
+        is None. The default is None.
+    precision : int, optional
+        As for drawings.canvas(). The default is None.
+    datum : str, float or list, optional
+        What to line the logs up on: the label of a unit (its base is used),
+        an elevation in m, or a list with one of these per log. See
+        datumElevations(). The default is None, which lines up the bases.
+    names : list of str, optional
+        Name to write above each log. The default is None.
+    labels : str, array-like or list, optional
+        Labels for the units, as for drawings.drawLog(). Only a list is read
+        as one entry per log; anything else (a label mode, or a Series or
+        array of labels for a one-log panel) is used for every log. The
+        default is None.
+    label_strat : str, optional
+        As for drawings.drawLog(). Labels are moved apart across the whole
+        panel at once. The default is 'polite'.
+    ticks : float, optional
+        How often (in m) to draw ticks on the elevation axis, which measures
+        elevation above the datum. The default is 20.
+    ties : bool, optional
+        Draw tie lines between the bases of units with the same label in
+        neighbouring logs. The default is False.
+    logspc : float, optional
+        Spacing (in pt) between the logs. The default is 100.
+    key : bool, optional
+        Draw a key of the facies used in the panel to the right of the logs.
+        The default is True.
+    key_rows : list or str, optional
+        Rows of the key, as custom_rows in drawings.drawKey(). The default is
+        'auto'.
+    profiler : profiling.Profiler, optional
+        Records the time taken by each phase. The default is None.
+    jobs : int, optional
+        Number of processes to draw logs in at once, or None for one per
+        core. Only used with streaming canvases. The default is 1.
+
+    Returns
+    -------
+    d : drawSvg object or render backend
+        Completed panel. Streaming canvases are returned still open.
+
+    '''
+    if len(logs) == 0:
+        raise ValueError('No logs to draw.')
+    first = logs[0]
+    for i, lg in enumerate(logs):
+        if lg._data is None:
+            raise ValueError(f'Log {i} has no data. Call setData() first.')
+        if((list(lg.gs_codes) != list(first.gs_codes)) or (list(lg.gs_widths) != list(first.gs_widths))
+           or (list(lg.fcodes) != list(first.fcodes)) or (list(lg.fcolors) != list(first.fcolors))):
+            raise ValueError(f'Log {i} uses different grain size or facies lookups to log 0. Logs in a panel must share them.')
+    if((names is not None) and (len(names) != len(logs))):
+        raise ValueError(f'names must have one entry per log. Got {len(names)} names for {len(logs)} logs.')
+    if profiler is None:
+        profiler = profiling.Profiler()
+    vscale = scales.asScale(vscale)
+    gs_codes, gs_widths = first.gs_codes, first.gs_widths
+    fcodes, fcolors = first.fcodes, first.fcolors
+    orig, pad, lnwgt = first.orig, first.pad, first.lnwgt
+    colwidth = gs_widths[len(gs_widths)-1]
+    n = len(logs)
+
+    with profiler.phase('layout', sum(len(lg.fac_idx) for lg in logs)):
+        texts = _panelLabels(logs, labels)
+        datums = datumElevations(logs, datum, texts)
+        elevs = [np.asarray(lg.elevations, dtype=float) for lg in logs]
+        # Everything is measured from the datum, with the lowest base at orig
+        bases = np.array([vscale.toPoints(e[0] - dt) for e, dt in zip(elevs, datums)])
+        tops = np.array([vscale.toPoints(e[-1] - dt) for e, dt in zip(elevs, datums)])
+        y_datum = orig - bases.min()
+        shift = y_datum - vscale.toPoints(datums)
+        # Elevation axis at orig, logs to its right
+        xs = orig + 10 + np.arange(n) * (colwidth + logspc)
+        sizes = np.array([len(lg.fac_idx) for lg in logs])
+        starts = np.concatenate(([0], np.cumsum(sizes)))
+        log_of = np.repeat(np.arange(n), sizes)
+        units, parts = layout.panelLayout(np.concatenate([e[:-1] for e in elevs]),
+                                          np.concatenate([e[1:] for e in elevs]),
+                                          np.concatenate([lg.base_w for lg in logs]),
+                                          np.concatenate([lg.top_w for lg in logs]),
+                                          log_of, vscale, shift, xs)
+        all_texts = [t for ts in texts for t in ts]
+        top = y_datum + tops.max()
+
+    if(label_strat == 'polite'):
+        with profiler.phase('label placement') as rec:
+            keep, units['ly'] = layout.placeLabels(units, [t is not None for t in all_texts],
+                                                   top - orig, orig)
+            all_texts = [t if k else None for t, k in zip(all_texts, keep)]
+            rec['count'] = keep.sum()
+
+    if key is True:
+        kcodes, kcolors, krows = dr._keyEntries(fcodes, fcolors, key_rows,
+                                                present = [lg.fac_idx for lg in logs])
+        kw, kh = dr._keySize(len(kcodes), krows)
+    else:
+        kw, kh = 0, 0
+    if canv is None:
+        # Room for names above the logs and the key beside them
+        width = xs[-1] + colwidth + 100 + (kw + pad if key is True else 0) + pad
+        height = max(top + (20 if names is not None else 0), orig + kh) + pad
+        canv = dr.canvas(dr.convert(width, 'pt', 'mm'), dr.convert(height, 'pt', 'mm'),
+                         out = out, precision = precision)
+    elif(top + pad > canv.height):
+        warnings.warn(f'Panel is taller ({top + pad:.0f} pt) than the canvas ({canv.height:.0f} pt) and will hang off the page.')
+    d = backends.asBackend(canv)
+    d.defineStyles(fcolors, stroke = 'black', stroke_width = lnwgt)
+
+    if((jobs != 1) and (hasattr(d, 'writeFragment') is False)):
+        warnings.warn('jobs only works with streaming canvases (see drawings.canvas()). Drawing in one process.')
+        jobs = 1
+
+    # Each log's own units, numbered from 0
+    def logPlaced(i):
+        lo, hi = starts[i], starts[i+1]
+        p = parts[lo:hi].copy()
+        p['unit'] -= lo
+        return units[lo:hi], p, all_texts[lo:hi], logs[i].fac_idx, colwidth
+
+    with profiler.phase('logs', n):
+        if jobs == 1:
+            for i in range(0,n):
+                u, p, t, f, _ = logPlaced(i)
+                dr._drawUnits(d, None, None, None, f, None,
+                              vscale, 0, 0, orig, colwidth, lnwgt, profiler = profiler,
+                              placed = (u, p, t))
+        else:
+            workers = os.cpu_count() if jobs is None else jobs
+            edges = np.unique(np.linspace(0, n, min(n, workers * 4) + 1).astype(int))
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers = jobs) as pool:
+                futures = [pool.submit(_drawPanelLogs, d.width, d.height, d.prefix, f'{d.prefix}p{a}-',
+                                       d.precision, [logPlaced(i) for i in range(a, b)], lnwgt, orig)
+                           for a, b in zip(edges[:-1], edges[1:])]
+                for f in futures:
+                    d.writeFragment(f.result())
+
+    with profiler.phase('grain bars', n):
+        for i in range(0,n):
+            dr._drawGrainBar(d, xs[i], y_datum + bases[i], y_datum + tops[i], gs_codes, gs_widths)
+            if names is not None:
+                d.text(f'{names[i]}', 10, xs[i], y_datum + tops[i] + 8)
+
+    with profiler.phase('ticks') as rec:
+        tick_pt = vscale.toPoints(ticks)
+        t_idx = np.arange(np.ceil(bases.min()/tick_pt), np.floor(tops.max()/tick_pt) + 1).astype(int)
+        d.lines((orig, y_datum + bases.min(),
+                 orig, top),
+                stroke_width = 0.5)
+        for t in t_idx:
+            y = y_datum + t * tick_pt
+            d.lines((orig, y,
+                     orig - 5, y),
+                    stroke_width = 0.5)
+            d.text(f'{t * ticks}', 9,
+                   orig - 6, y,
+                   text_anchor = 'end')
+        rec['count'] = len(t_idx)
+
+    if ties is True:
+        with profiler.phase('ties') as rec:
+            count = 0
+            for i in range(0,n-1):
+                ia, ib = _tieIndices(texts[i], texts[i+1])
+                for a, b in zip(ia + starts[i], ib + starts[i+1]):
+                    d.lines((xs[i] + colwidth, units['y1'][a],
+                             xs[i+1], units['y1'][b]),
+                            stroke_width = 0.5)
+                count += len(ia)
+            rec['count'] = count
+
+    if key is True:
+        with profiler.phase('key', len(kcodes)):
+            dr._drawKeyBoxes(d, kcodes, kcolors, krows, 40, 5,
+                             xs[-1] + colwidth + 100 + pad, max(top, orig + kh))
+    return d.result()
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""
+Raster previews of sed logs
+
+Draws the units of a log straight into a NumPy image, without going through
+SVG, so that very long logs can be checked at a glance. Only the units are
+drawn (no labels or scales). Images can be saved as PNG (written with zlib, no
+Cairo or imaging library needed) or cut into tiles at several zoom levels for
+a web viewer, e.g.
+
+    pv = LogPreview(elevations, 250, src.gs_base, src.gs_top, src.code,
+                    gs_codes, gs_widths, fcodes, fcolors, cache_dir = 'tiles')
+    pv                       # shows a thumbnail in Jupyter
+    pv.tile(3, 10, 0)        # PNG bytes of one tile, drawn on first request
+    pv.writeTiles('site/tiles', zooms = range(0, 5))
+
+Tiles are kept in cache_dir under a hash of everything that went into them,
+so they are only drawn once for a given log and settings.
+"""
+
+import os
+import struct
+import zlib
+
+import numpy as np
+
+import drawings as dr
+import layout
+import scales
+from cache import FragmentCache
+
+#%% PNG output
+
+def pngBytes(img):
+    '''
+    Encodes an RGB image (height x width x 3 array of uint8) as PNG.
+
+    '''
+    img = np.ascontiguousarray(img, dtype = np.uint8)
+    h, w = img.shape[:2]
+    raw = np.zeros((h, w * 3 + 1), dtype = np.uint8)  # Filter byte 0 on each row
+    raw[:, 1:] = img.reshape(h, w * 3)
+
+    def chunk(tag, data):
+        return (struct.pack('>I', len(data)) + tag + data
+                + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff))
+
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', w, h, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(raw.tobytes(), 6))
+            + chunk(b'IEND', b''))
+
+def savePng(path, img):
+    with open(path, 'wb') as f:
+        f.write(pngBytes(img))
+
+def hexColors(colors):
+    '''
+    Converts '#RRGGBB' or '#RGB' colours to an array of RGB values.
+
+    '''
+    rgb = np.zeros((len(colors), 3), dtype = np.uint8)
+    for i, c in enumerate(colors):
+        c = str(c).lstrip('#')
+        if len(c) == 3:
+            c = ''.join(ch * 2 for ch in c)
+        if len(c) != 6:
+            raise ValueError(f'Preview colours must be hex codes like "#E3AB4A". Got "{colors[i]}".')
+        rgb[i] = [int(c[j:j+2], 16) for j in (0, 2, 4)]
+    return rgb
+
+#%% Previews
+
+class LogPreview:
+    '''
+    Raster preview of a log. Takes the same data and lookups as drawLog and
+    lays the log out the same way, with as many columns side by side as the
+    log needs.
+
+    Parameters
+    ----------
+    elevations, vscale, grain_base, grain_top, facies, gs_codes, gs_widths, fcodes, fcolors
+        As for drawLog. fcolors must be hex codes.
+    height : float, optional
+        Height of the page (in pt) that columns are fitted to. The default is
+        None, which uses a US letter page.
+    orig, pad, colspc, man_colheight, nachar, validated : optional
+        As for drawLog.
+    cache_dir : str, optional
+        Folder to keep drawn tiles in. The default is None, which does not
+        keep tiles.
+    tile_size : int, optional
+        Width and height of tiles in pixels. The default is 256.
+
+    Attributes
+    ----------
+    width, height : float
+        Size of the whole log in pt.
+    key : str
+        Hash of the inputs, used to find cached tiles.
+    '''
+    def __init__(self, elevations, vscale,
+                 grain_base, grain_top, facies,
+                 gs_codes, gs_widths, fcodes, fcolors,
+                 height = None, orig = 40, pad = 5, colspc = 40,
+                 man_colheight = None, nachar = 'NaN', validated = None,
+                 cache_dir = None, tile_size = 256):
+        if validated is None:
+            validated = dr.validateUnits(grain_base, grain_top, facies, gs_codes, fcodes, nachar = nachar)
+        validated.raiseErrors()
+        if height is None:
+            height = dr.pageSize()[1]
+        base_w, top_w, fill, fac_idx = validated.lookup(gs_widths, fcolors)
+
+        vscale = scales.asScale(vscale)
+        elevations = np.asarray(elevations, dtype = float)
+        self.colwidth = float(gs_widths[len(gs_widths)-1])
+        self.colheight = dr._columnHeight(vscale, height, orig, pad, man_colheight)
+        self.colspc = colspc
+        self.orig = orig
+        self.colors = hexColors(list(fcolors))
+        top_pt = vscale.toPoints(elevations[-1])
+        self.ncols = max(int(np.ceil(top_pt/self.colheight)), 1)
+        self.width = orig + self.ncols * self.colwidth + (self.ncols - 1) * colspc + pad
+        self.height = self.colheight + orig + pad
+        self.tile_size = tile_size
+        self.cache_dir = cache_dir
+        self.key = FragmentCache.key(elevations, np.asarray(base_w), np.asarray(top_w),
+                                     np.asarray(fac_idx), self.colors, vscale.vscale, height, orig,
+                                     pad, colspc, man_colheight, self.colwidth, tile_size)
+
+        # Parts of units grouped by column, each column in height order
+        units, parts = layout.computeLayout(elevations, base_w, top_w, vscale,
+                                            self.colheight, colspc, orig, self.colwidth)
+        parts = parts[np.argsort(parts['col'], kind = 'stable')]
+        self._parts = parts
+        self._fac = np.asarray(fac_idx)[parts['unit']]
+        self._starts = np.searchsorted(parts['col'], np.arange(self.ncols + 1))
+
+    def _repr_png_(self):
+        return pngBytes(self.thumbnail())
+
+    def render(self, x0, y0, w, h, scale):
+        '''
+        Draws part of the log.
+
+        Parameters
+        ----------
+        x0, y0 : float
+            Top left corner (in pt) of the area to draw, with y measured down
+            from the top of the log.
+        w, h : int
+            Size of the image in pixels.
+        scale : float
+            Pixels per pt.
+
+        Returns
+        -------
+        img : np.ndarray
+            RGB image, h x w x 3.
+
+        '''
+        img = np.full((h, w, 3), 255, dtype = np.uint8)
+        xs = x0 + (np.arange(w) + 0.5)/scale
+        ys = (self.height - y0) - (np.arange(h) + 0.5)/scale  # Up from the base
+        pitch = self.colwidth + self.colspc
+        c_lo = max(int(np.floor((x0 - self.orig)/pitch)), 0)
+        c_hi = min(int(np.ceil((x0 + w/scale - self.orig)/pitch)) + 1, self.ncols)
+
+        for c in range(c_lo, c_hi):
+            left = self.orig + c * pitch
+            i0, i1 = np.searchsorted(xs, (left, left + self.colwidth))
+            p = self._parts[self._starts[c]:self._starts[c+1]]
+            if((i0 == i1) or (len(p) == 0)):
+                continue
+
+            # Part covering each row of pixels, and the right edge of its fill
+            k = np.clip(np.searchsorted(p['cy1'], ys, side='right') - 1, 0, len(p) - 1)
+            covered = (ys >= p['cy1'][k]) & (ys < p['cy2'][k])
+            rise = p['y2'][k] - p['y1'][k]
+            frac = np.divide(ys - p['y1'][k], rise, out = np.zeros_like(ys), where = rise > 0)
+            right = p['x2'][k] + (p['x3'][k] - p['x2'][k]) * frac
+            fill = covered[:, None] & (xs[None, i0:i1] < right[:, None])
+
+            rows = self.colors[self._fac[self._starts[c] + k]]
+            # Outline the base of units at least 3 px thick
+            edge = covered & np.concatenate(([True], k[1:] != k[:-1])) & (rise * scale >= 3)
+            rows[edge] = 0
+            block = img[:, i0:i1]
+            block[fill] = np.broadcast_to(rows[:, None, :], block.shape)[fill]
+            # Left edge of column
+            block[(ys >= self.orig) & (ys <= self.colheight + self.orig), 0] = 0
+        return img
+
+    def thumbnail(self, max_size = 512):
+        '''
+        Returns an image of the whole log no more than max_size pixels across.
+
+        '''
+        scale = max_size/max(self.width, self.height)
+        return self.render(0, 0, max(int(self.width * scale), 1), max(int(self.height * scale), 1), scale)
+
+    def zoomScale(self, zoom):
+        '''
+        Returns the pixels per pt at a zoom level. At zoom 0 the whole log fits
+        in one tile, and each level up doubles the scale.
+
+        '''
+        return (self.tile_size/max(self.width, self.height)) * 2**zoom
+
+    def maxZoom(self, scale = 2):
+        '''
+        Returns the first zoom level drawn at scale pixels per pt or more.
+
+        '''
+        return max(int(np.ceil(np.log2(scale/self.zoomScale(0)))), 0)
+
+    def tiles(self, zoom):
+        '''
+        Returns the number of tiles across and down at a zoom level.
+
+        '''
+        s = self.zoomScale(zoom)
+        return (int(np.ceil(self.width * s/self.tile_size)),
+                int(np.ceil(self.height * s/self.tile_size)))
+
+    def tile(self, zoom, x, y):
+        '''
+        Returns PNG bytes for tile (x, y) at a zoom level, counting from the top
+        left. Tiles are read from cache_dir if already drawn.
+
+        '''
+        nx, ny = self.tiles(zoom)
+        if(not (0 <= x < nx and 0 <= y < ny)):
+            raise ValueError(f'Tile ({x}, {y}) is outside zoom level {zoom}, which is {nx} x {ny} tiles.')
+        path = None
+        if self.cache_dir is not None:
+            path = os.path.join(self.cache_dir, self.key[:16], str(zoom), f'{x}_{y}.png')
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    return f.read()
+        s = self.zoomScale(zoom)
+        span = self.tile_size/s
+        png = pngBytes(self.render(x * span, y * span, self.tile_size, self.tile_size, s))
+        if path is not None:
+            os.makedirs(os.path.dirname(path), exist_ok = True)
+            tmp = f'{path}.{os.getpid()}.part'
+            with open(tmp, 'wb') as f:
+                f.write(png)
+            os.replace(tmp, path)
+        return png
+
+    def writeTiles(self, out_dir, zooms = None):
+        '''
+        Writes every tile at the given zoom levels to out_dir/zoom/x_y.png.
+        The default is every level up to maxZoom().
+
+        Returns
+        -------
+        count : int
+            Number of tiles written.
+
+        '''
+        if zooms is None:
+            zooms = range(0, self.maxZoom() + 1)
+        count = 0
+        for z in zooms:
+            nx, ny = self.tiles(z)
+            os.makedirs(os.path.join(out_dir, str(z)), exist_ok = True)
+            for x in range(0, nx):
+                for y in range(0, ny):
+                    with open(os.path.join(out_dir, str(z), f'{x}_{y}.png'), 'wb') as f:
+                        f.write(self.tile(z, x, y))
+                    count += 1
+        return count
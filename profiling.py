@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Per-phase timing for sed log maker
+
+Pass a Profiler as the profiler argument of drawLog (or drawLogCsv) to see how
+long each phase of drawing takes and how many objects it produced, e.g.
+
+    with Profiler() as prof:
+        dr.drawLog(..., profiler = prof)
+    print(prof)
+    prof.trace('drawlog-trace.json')
+
+The trace opens in chrome://tracing or https://ui.perfetto.dev.
+"""
+
+import json
+import time
+from contextlib import contextmanager
+
+class Profiler:
+    '''
+    Collects the time taken by, and number of objects drawn in, each phase of
+    drawing a log.
+
+    Parameters
+    ----------
+    callback : callable, optional
+        Called as callback(phase, seconds, count) each time a phase finishes,
+        e.g. to log progress on long runs. The default is None.
+
+    Phases recorded by drawLog are validate, fit columns, lookup, layout,
+    clip paths, cache, units, split units, labels, ticks and grain bars, plus
+    read for each chunk in drawLogCsv. Used as a context manager, the time
+    spent inside the with block is also recorded as total.
+    '''
+    def __init__(self, callback = None):
+        self.callback = callback
+        self.phases = {}
+        self.events = []
+        self._origin = time.perf_counter()
+        self._entered = None
+
+    def __enter__(self):
+        self._entered = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.add('total', time.perf_counter() - self._entered, start = self._entered)
+
+    @contextmanager
+    def phase(self, name, count = 0):
+        '''
+        Times the body of a with block as one run of a phase. Set 'count' on
+        the dict it yields to record how many objects the phase produced.
+
+        '''
+        record = {'count': count}
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            self.add(name, time.perf_counter() - start, record['count'], start)
+
+    def add(self, name, seconds, count = 0, start = None):
+        '''
+        Records a run of a phase timed elsewhere. Phases recorded more than
+        once are summed.
+
+        '''
+        p = self.phases.setdefault(name, {'seconds': 0.0, 'calls': 0, 'count': 0})
+        p['seconds'] += seconds
+        p['calls'] += 1
+        p['count'] += int(count)
+        if start is None:
+            start = time.perf_counter() - seconds
+        self.events.append({'name': name, 'ph': 'X', 'pid': 0, 'tid': 0,
+                            'ts': (start - self._origin) * 1e6, 'dur': seconds * 1e6,
+                            'args': {'count': int(count)}})
+        if self.callback is not None:
+            self.callback(name, seconds, count)
+
+    def results(self):
+        '''
+        Returns a dict of phase: {'seconds', 'calls', 'count'}.
+
+        '''
+        return {name: dict(p) for name, p in self.phases.items()}
+
+    def trace(self, path = None):
+        '''
+        Returns the recorded phases in Chrome trace event format, also writing
+        them to path as JSON if given. Phases timed unit by unit (units, split
+        units, labels) appear as one event for their summed time.
+
+        '''
+        trace = {'traceEvents': list(self.events), 'displayTimeUnit': 'ms'}
+        if path is not None:
+            with open(path, 'w') as f:
+                json.dump(trace, f)
+        return trace
+
+    def __str__(self):
+        rows = [f'{"phase":12} {"seconds":>10} {"calls":>7} {"count":>9}']
+        for name, p in sorted(self.phases.items(), key = lambda kv: -kv[1]['seconds']):
+            rows.append(f'{name:12} {p["seconds"]:10.4f} {p["calls"]:7} {p["count"]:9}')
+        return '\n'.join(rows)
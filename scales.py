@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Units and scales for sed log maker
+
+Every conversion between metres of section, millimetres, inches and points on
+the page goes through here, working on whole NumPy arrays at once.
+"""
+
+import numpy as np
+
+# Points per unit of length
+PT_PER_MM = 2.8346456692913
+UNITS = {'pt': 1.0,
+         'mm': PT_PER_MM,
+         'in': 72.0}
+
+def convert(measurement, in_unit:str, out_unit:str):
+    '''
+    Converts a measurement (a number or an array of them) between pt, mm and
+    in.
+
+    '''
+    try:
+        factor = UNITS[in_unit]/UNITS[out_unit]
+    except KeyError:
+        bad = in_unit if in_unit not in UNITS else out_unit
+        raise ValueError(f'Given unit ({bad}) not supported! Please choose one of: {", ".join(UNITS)}.') from None
+    if isinstance(measurement, (list, tuple)):
+        measurement = np.asarray(measurement, dtype = float)
+    return measurement * factor
+
+def elevs(thicknesses, dtype = np.float64):
+    '''
+    Converts unit thicknesses into elevations of the base of each unit and the
+    top of the log, in one cumulative sum.
+
+    Parameters
+    ----------
+    thicknesses : array-like
+        Thicknesses of units in log.
+    dtype : np.dtype, optional
+        Type to store elevations as. Elevations are always summed in float64,
+        so float32 saves memory without accumulating rounding error. The
+        default is np.float64.
+
+    Returns
+    -------
+    elevations : np.ndarray
+        n+1 elevations, starting from 0.
+
+    '''
+    thicknesses = np.asarray(thicknesses, dtype = np.float64)
+    elevations = np.empty(len(thicknesses) + 1, dtype = np.float64)
+    elevations[0] = 0.0
+    np.cumsum(thicknesses, out = elevations[1:])
+    return elevations.astype(dtype, copy = False)
+
+class Scale:
+    '''
+    Transform between metres of section and points on the page for a log
+    drawn at vscale:1.
+
+    Parameters
+    ----------
+    vscale : int
+        Vertical scale in form X:1.
+    dtype : np.dtype, optional
+        Type of arrays returned by toPoints. Positions on the page are always
+        worked out in float64 first. The default is np.float64.
+
+    Attributes
+    ----------
+    pt_per_m : float
+        Points on the page per metre of section.
+    '''
+    def __init__(self, vscale, dtype = np.float64):
+        self.vscale = vscale
+        self.dtype = dtype
+        self.pt_per_m = (1000 * PT_PER_MM)/vscale
+
+    def __repr__(self):
+        return f'Scale({self.vscale})'
+
+    def toPoints(self, metres):
+        '''
+        Converts metres of section (a number or array) to pt on the page.
+
+        '''
+        if np.ndim(metres) == 0:
+            return (float(metres) * 1000 * PT_PER_MM)/self.vscale
+        pt = (np.asarray(metres, dtype = np.float64) * 1000 * PT_PER_MM)/self.vscale
+        return pt.astype(self.dtype, copy = False)
+
+    def toMetres(self, points):
+        '''
+        Converts pt on the page (a number or array) to metres of section.
+
+        '''
+        if np.ndim(points) == 0:
+            return (float(points) * self.vscale)/(1000 * PT_PER_MM)
+        return (np.asarray(points, dtype = np.float64) * self.vscale)/(1000 * PT_PER_MM)
+
+def asScale(vscale):
+    '''
+    Returns vscale unchanged if it is already a Scale, otherwise a Scale for
+    it.
+
+    '''
+    return vscale if isinstance(vscale, Scale) else Scale(vscale)
@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+"""
+Command line batch renderer for sed log maker
+
+Renders every log CSV matching one or more glob patterns to SVG, spreading the
+files across processes. Input files use the same layout as the files in
+examples/ (or are binary logs written by logfile.py, which bring their own
+lookups) and all logs share one config file. For example:
+
+    python sedlog.py "logs/*.csv" --config campaign.json --out rendered --key
+
+The config file is JSON and may set any of the keys in DEFAULTS, e.g.
+
+    {"vscale": 100, "ticks": 10, "paper": [null, null, "a3"],
+     "facies": {"codes": ["sm", "sh"], "colors": ["#E3AB4A", "#DBB75C"]}}
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import drawings as dr
+import lazy
+# Workers only load what the files they render need
+pd = lazy.LazyModule('pandas')
+logfile = lazy.LazyModule('logfile')
+
+# Mirrors the settings in sed-log.ipynb
+DEFAULTS = {'vscale': 250,                    # Vertical scale of log in form X:1
+            'ticks': 20,                      # Tick interval (m)
+            'labels': 'facies',               # 'facies', 'numbers', a column name or None
+            'label_strat': 'polite',          # 'polite' or '' to label everything
+            'paper': [None, None, 'letter'],  # Width (mm), height (mm), standard size
+            'orig': 40,                       # Position of log on page (pt)
+            'pad': 5,                         # Page padding (pt)
+            'colspc': 40,                     # Space between columns (pt)
+            'lnwgt': 0.5,                     # Line weight (pt)
+            'man_colheight': None,            # Column height (m of section)
+            'columns': None,                  # Number of columns
+            'nachar': 'NaN',                  # Contents of blank cells
+            'thickness': 'thickness',         # Column names in the input files
+            'gs_base': 'gs_base',
+            'gs_top': 'gs_top',
+            'facies_col': 'code',
+            'grainsize': None,                # {"sizes": [...], "widths": [...], "wunit": "mm"}
+            'facies': None,                   # {"codes": [...], "colors": [...]}
+            'key_rows': 'default',            # custom_rows passed to drawKey ('auto' to fit the facies shown)
+            'key_present': False,             # Only show facies used in the batch in the key
+            'chunksize': None,                # Read and draw logs this many units at a time
+            'precision': None}                # Decimal places kept in compact output
+
+def loadConfig(path = None):
+    '''
+    Reads a JSON config file over the top of the default settings.
+
+    Parameters
+    ----------
+    path : str, optional
+        Path to JSON config file. The default is None, which gives the defaults.
+
+    Returns
+    -------
+    config : dict
+        Settings for rendering.
+
+    '''
+    config = dict(DEFAULTS)
+    if path is not None:
+        with open(path) as f:
+            config = updateConfig(config, json.load(f), path)
+    return config
+
+def updateConfig(config, user, source = 'config'):
+    '''
+    Returns a copy of config with the settings in user laid over it,
+    rejecting keys that are not settings. source names where user came from
+    in the error.
+
+    '''
+    unknown = set(user) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f'Unknown config keys in {source}: {", ".join(sorted(unknown))}. Accepted keys are: {", ".join(DEFAULTS)}.')
+    config = dict(config)
+    config.update(user)
+    return config
+
+def lookups(config):
+    '''
+    Builds the grain size and facies lookups described by a config.
+
+    '''
+    if config['grainsize'] is None:
+        gs_codes, gs_widths = dr.grainsize()
+    else:
+        gs = config['grainsize']
+        gs_codes, gs_widths = dr.grainsize(gs['sizes'], gs['widths'], wunit = gs.get('wunit', 'mm'))
+    if config['facies'] is None:
+        fcodes, fcolors = dr.faciesList()
+    else:
+        fcodes, fcolors = dr.faciesList(config['facies']['codes'], config['facies']['colors'])
+    return gs_codes, gs_widths, fcodes, fcolors
+
+def outputNames(paths, reserved = (), ext = '.svg'):
+    '''
+    Chooses the file (an SVG, or with extension ext) each input is written
+    to, so that no two inputs (and none of the reserved names, e.g.
+    'key.svg') share an output. Inputs are
+    named after their file; files of the same name in different folders keep
+    their folder relative to the folder holding all inputs, and files that
+    differ only in extension (x.csv and x.npz) have it added (x_csv.svg).
+
+    Returns
+    -------
+    names : dict
+        Output path relative to the output folder for each input path.
+
+    '''
+    reserved = [os.path.splitext(r)[0] for r in reserved]
+    stems = [os.path.splitext(os.path.basename(p))[0] for p in paths]
+    base = os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in paths])
+    counts = Counter(stems + reserved)
+    names = [os.path.splitext(os.path.relpath(os.path.abspath(p), base))[0]
+             if counts[stem] > 1 else stem for p, stem in zip(paths, stems)]
+    counts = Counter(names + reserved)
+    names = [f'{name}_{os.path.splitext(p)[1][1:]}' if counts[name] > 1 else name
+             for p, name in zip(paths, names)]
+    clashes = [name + ext for name, n in Counter(names + reserved).items() if n > 1]
+    if clashes:
+        raise ValueError(f'Inputs would overwrite each other\'s output: {", ".join(clashes)}')
+    return {p: name + ext for p, name in zip(paths, names)}
+
+def renderFile(path, config, out_dir, name = None):
+    '''
+    Renders one log CSV to an SVG in out_dir, named name (see outputNames) or
+    after the input file. Errors are caught and returned so that one bad file
+    does not stop a batch.
+
+    Returns
+    -------
+    result : tuple
+        (input path, output path or None, seconds taken, error message or None)
+
+    '''
+    start = time.perf_counter()
+    if name is None:
+        name = os.path.splitext(os.path.basename(path))[0] + '.svg'
+    out = os.path.join(out_dir, name)
+    # Unique to this process, so that nothing else can write to it
+    tmp = f'{out}.{os.getpid()}.part'
+    try:
+        os.makedirs(os.path.dirname(out) or '.', exist_ok = True)
+        gs_codes, gs_widths, fcodes, fcolors = lookups(config)
+        paper = config['paper']
+        if config['chunksize'] is not None:
+            names = {'thickness': config['thickness'], 'gs_base': config['gs_base'],
+                     'gs_top': config['gs_top'], 'facies': config['facies_col']}
+            with dr.canvas(paper[0], paper[1], paper[2], out = tmp,
+                           precision = config['precision']) as canv:
+                dr.drawLogCsv(path, config['vscale'],
+                              gs_codes, gs_widths, fcodes, fcolors, canv,
+                              orig = config['orig'], pad = config['pad'], colspc = config['colspc'],
+                              lnwgt = config['lnwgt'], man_colheight = config['man_colheight'],
+                              columns = config['columns'], ticks = config['ticks'],
+                              labels = config['labels'], label_strat = config['label_strat'],
+                              nachar = config['nachar'], chunksize = config['chunksize'], names = names)
+            os.replace(tmp, out)
+            return path, out, time.perf_counter() - start, None
+
+        if path.endswith('.npz'):
+            # Binary logs carry their own lookups; other settings come from the config
+            log = logfile.loadLog(path)
+            labels = config['labels']
+            if(labels not in (None, 'facies', 'numbers')):
+                labels = log.labels
+            with dr.canvas(paper[0], paper[1], paper[2], out = tmp,
+                           precision = config['precision']) as canv:
+                log.draw(canv, vscale = config['vscale'],
+                         orig = config['orig'], pad = config['pad'], colspc = config['colspc'],
+                         lnwgt = config['lnwgt'], man_colheight = config['man_colheight'],
+                         columns = config['columns'], ticks = config['ticks'],
+                         labels = labels, label_strat = config['label_strat'])
+            os.replace(tmp, out)
+            return path, out, time.perf_counter() - start, None
+
+        renderFrame(pd.read_csv(path), config, tmp)
+        os.replace(tmp, out)
+        return path, out, time.perf_counter() - start, None
+    except Exception as ex:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        err = ' '.join(str(ex).split())
+        return path, None, time.perf_counter() - start, f'{type(ex).__name__}: {err}'
+
+def renderFrame(src, config, out):
+    '''
+    Renders a log held in a DataFrame (with the columns of the example files)
+    to SVG.
+
+    Parameters
+    ----------
+    src : pd.DataFrame
+        Log with one row per unit.
+    config : dict
+        Settings for rendering, as from loadConfig().
+    out : str or file-like
+        Path or text stream to write the SVG to.
+
+    '''
+    gs_codes, gs_widths, fcodes, fcolors = lookups(config)
+    paper = config['paper']
+    src = src.fillna(config['nachar'])
+    labels = config['labels']
+    if(labels not in (None, 'facies', 'numbers')):
+        labels = src[labels]
+    with dr.canvas(paper[0], paper[1], paper[2], out = out,
+                   precision = config['precision']) as canv:
+        dr.drawLog(dr.elevs(src[config['thickness']]), config['vscale'],
+                   src[config['gs_base']], src[config['gs_top']], src[config['facies_col']],
+                   gs_codes, gs_widths, fcodes, fcolors, canv,
+                   orig = config['orig'], pad = config['pad'], colspc = config['colspc'],
+                   lnwgt = config['lnwgt'], man_colheight = config['man_colheight'],
+                   columns = config['columns'], ticks = config['ticks'],
+                   labels = labels, label_strat = config['label_strat'],
+                   nachar = config['nachar'])
+
+def batchFacies(paths, config):
+    '''
+    Reads just the facies column of every log in a batch, for drawKey's
+    present argument. Files that cannot be read are skipped, so that one bad
+    file does not stop the key.
+
+    Returns
+    -------
+    facies : list
+        Facies column of each file read.
+    errors : list of tuple
+        (input path, error message) for each file skipped.
+
+    '''
+    facies = []
+    errors = []
+    for path in paths:
+        try:
+            if path.endswith('.npz'):
+                facies.append(logfile.loadLog(path).facies)
+            else:
+                col = config['facies_col']
+                facies.append(pd.read_csv(path, usecols = [col], dtype = {col: 'category'})[col])
+        except Exception as ex:
+            err = ' '.join(str(ex).split())
+            errors.append((path, f'{type(ex).__name__}: {err}'))
+    return facies, errors
+
+def renderBatch(paths, config, out_dir = '.', jobs = None, names = None):
+    '''
+    Renders many log CSVs in parallel, yielding the result of each file (see
+    renderFile) as it finishes. names maps each path to its output, as from
+    outputNames(paths), which is used if it is not given.
+
+    '''
+    if names is None:
+        names = outputNames(paths)
+    if jobs == 1:
+        for path in paths:
+            yield renderFile(path, config, out_dir, names[path])
+        return
+    with ProcessPoolExecutor(max_workers = jobs) as pool:
+        futures = [pool.submit(renderFile, path, config, out_dir, names[path]) for path in paths]
+        for f in futures:
+            yield f.result()
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog = 'sedlog',
+                                     description = 'Render sedimentary log CSVs to SVG.')
+    parser.add_argument('inputs', nargs = '+', help = 'CSV files or glob patterns, e.g. "logs/*.csv"')
+    parser.add_argument('-c', '--config', help = 'JSON config file shared by all logs')
+    parser.add_argument('-o', '--out', default = '.', help = 'Output directory (default: current directory)')
+    parser.add_argument('-j', '--jobs', type = int, default = None, help = 'Number of worker processes (default: one per core)')
+    parser.add_argument('-k', '--key', action = 'store_true', help = 'Also write key.svg to the output directory')
+    args = parser.parse_args(argv)
+
+    config = loadConfig(args.config)
+    paths = sorted({p for pattern in args.inputs for p in glob.glob(pattern, recursive = True)})
+    if not paths:
+        parser.error('No input files matched.')
+    try:
+        names = outputNames(paths, reserved = ['key.svg'] if args.key else [])
+    except ValueError as ex:
+        parser.error(str(ex))
+    os.makedirs(args.out, exist_ok = True)
+
+    start = time.perf_counter()
+    if args.key:
+        _, _, fcodes, fcolors = lookups(config)
+        present = None
+        if config['key_present']:
+            present, errors = batchFacies(paths, config)
+            for path, err in errors:
+                print(f'FAIL  key       {path}: {err}')
+            # With nothing read, show every facies
+            present = present or None
+        dr.drawKey(fcodes, fcolors, custom_rows = config['key_rows'],
+                   out = os.path.join(args.out, 'key.svg'), present = present)
+
+    failed = 0
+    busy = 0.0
+    for path, out, secs, err in renderBatch(paths, config, args.out, args.jobs, names):
+        busy += secs
+        if err is None:
+            print(f'ok    {secs:8.3f} s  {path} -> {out}')
+        else:
+            failed += 1
+            print(f'FAIL  {secs:8.3f} s  {path}: {err}')
+    wall = time.perf_counter() - start
+
+    print(f'\n{len(paths) - failed} rendered, {failed} failed in {wall:.3f} s '
+          f'({busy:.3f} s rendering, {busy/len(paths):.3f} s per file)')
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,487 @@
+# -*- coding: utf-8 -*-
+"""
+Local HTTP render service for sed log maker
+
+Renders logs sent over HTTP to SVG, so web forms and other tools can share one
+renderer instead of each keeping a copy of the notebook. Only the standard
+library is used: renders run in a fixed pool of worker processes behind a
+bounded queue (requests beyond it are turned away with 503 Busy), finished
+SVGs are kept in an in-memory LRU cache under a hash of the log and settings,
+and /metrics reports latency, throughput, queue and cache use. For example:
+
+    python server.py --config campaign.json --port 8150 --jobs 4
+
+    curl --data-binary @examples/test_long.csv -H "Content-Type: text/csv" \\
+         "http://localhost:8150/render?vscale=500&labels=facies" > log.svg
+
+Endpoints:
+
+    POST /render    Log as CSV (in the format of the example files), or JSON
+                    {"units": ..., "params": {...}} with units as a list of
+                    rows or a dict of columns. Returns the log as SVG.
+    GET/POST /key   Facies key as SVG. A JSON body may list the facies codes
+                    to show as "present".
+    GET /metrics    Counts, latency percentiles, throughput, queue and cache
+                    use as JSON.
+    GET /health     Returns ok.
+
+Settings are the keys of sedlog.py config files, read from the server's config
+file and overridden for each request by the query string (values are read as
+JSON where they parse, e.g. ?vscale=500&paper=[null,null,"a3"]) or by
+"params" in a JSON body.
+
+Run with --load to load test a running server instead of starting one:
+
+    python server.py --load examples/test_long.csv --requests 200 --concurrency 8
+"""
+
+import argparse
+import collections
+import http.server
+import io
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+import drawings as dr
+import lazy
+import sedlog
+from cache import FragmentCache
+# Only workers need pandas
+pd = lazy.LazyModule('pandas')
+
+#%% Rendering
+
+def _renderLog(body, kind, config):
+    '''
+    Renders a log sent as CSV bytes or as JSON units to an SVG string. Runs
+    in a worker process.
+
+    '''
+    src = pd.read_csv(io.BytesIO(body)) if kind == 'csv' else pd.DataFrame(body)
+    out = io.StringIO()
+    sedlog.renderFrame(src, config, out)
+    return out.getvalue()
+
+def _renderKey(config, present):
+    '''
+    Renders the facies key of a config to an SVG string.
+
+    '''
+    _, _, fcodes, fcolors = sedlog.lookups(config)
+    out = io.StringIO()
+    dr.drawKey(fcodes, fcolors, custom_rows = config['key_rows'], out = out, present = present)
+    return out.getvalue()
+
+# Errors from bad logs and settings, sent back as 400. json.JSONDecodeError and
+# pandas' parser errors are ValueErrors; the checks in drawings raise plain
+# Exceptions. Anything else is a fault in the server (500)
+CLIENT_ERRORS = (ValueError, KeyError)
+
+def _isClientError(ex):
+    return isinstance(ex, CLIENT_ERRORS) or type(ex) is Exception
+
+class RequestError(Exception):
+    '''
+    Raised for requests that cannot be served, with the HTTP status to reply
+    with (e.g. 503 when the render queue is full).
+    '''
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class RenderCache:
+    '''
+    In-memory, size-bounded, least recently used store of rendered SVGs.
+
+    Parameters
+    ----------
+    max_bytes : int, optional
+        Maximum total size of SVGs kept. The default is 256 MB.
+
+    Attributes
+    ----------
+    hits, misses, evictions : int
+        Counts since the cache was made.
+    '''
+    def __init__(self, max_bytes = 256 * 2**20):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._items = collections.OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            svg = self._items.get(key)
+            if svg is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return svg
+
+    def put(self, key, svg):
+        with self._lock:
+            if key in self._items:
+                return
+            self._items[key] = svg
+            self._bytes += len(svg)
+            while((self._bytes > self.max_bytes) and (len(self._items) > 1)):
+                _, old = self._items.popitem(last = False)
+                self._bytes -= len(old)
+                self.evictions += 1
+
+    def stats(self):
+        '''
+        Returns hit, miss and eviction counts along with the current size of
+        the cache.
+
+        '''
+        with self._lock:
+            looked = self.hits + self.misses
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'hit_rate': self.hits/looked if looked else None,
+                    'evictions': self.evictions,
+                    'entries': len(self._items),
+                    'bytes': self._bytes}
+
+class Metrics:
+    '''
+    Request counts and timings for /metrics. Latency percentiles cover the
+    last `window` requests and throughput the last `span` seconds.
+    '''
+    def __init__(self, window = 1000, span = 60):
+        self.started = time.time()
+        self.span = span
+        self.counts = collections.Counter()
+        self._recent = collections.deque(maxlen = window)  # (finished, seconds)
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, status, seconds):
+        with self._lock:
+            self.counts[f'{endpoint} {status}'] += 1
+            self._recent.append((time.time(), seconds))
+
+    def snapshot(self):
+        with self._lock:
+            recent = np.array(self._recent, dtype=float).reshape(-1, 2)
+            counts = dict(self.counts)
+        now = time.time()
+        latency = None
+        if len(recent) > 0:
+            ms = recent[:, 1] * 1000
+            latency = {'mean': float(ms.mean()),
+                       'p50': float(np.percentile(ms, 50)),
+                       'p95': float(np.percentile(ms, 95)),
+                       'p99': float(np.percentile(ms, 99)),
+                       'max': float(ms.max())}
+        span = min(self.span, now - self.started)
+        return {'uptime_s': now - self.started,
+                'requests': counts,
+                'latency_ms': latency,
+                'throughput_rps': float((recent[:, 0] >= now - self.span).sum()/span) if span > 0 else 0.0}
+
+class RenderService:
+    '''
+    Renders logs and keys in a pool of worker processes, caching the results.
+
+    Parameters
+    ----------
+    config : dict, optional
+        Default settings, as from sedlog.loadConfig(). The default is None,
+        which uses sedlog.DEFAULTS.
+    jobs : int, optional
+        Number of worker processes, or None for one per core. The default is
+        None.
+    queue : int, optional
+        Number of renders that may wait for a worker before new ones are
+        turned away. The default is 16.
+    cache_bytes : int, optional
+        Size of the result cache. The default is 256 MB.
+    '''
+    def __init__(self, config = None, jobs = None, queue = 16, cache_bytes = 256 * 2**20):
+        self.config = sedlog.loadConfig() if config is None else config
+        self.workers = os.cpu_count() if jobs is None else jobs
+        self.pool = ProcessPoolExecutor(max_workers = self.workers)
+        self.queue = queue
+        self.cache = RenderCache(cache_bytes)
+        self.metrics = Metrics()
+        self._slots = threading.BoundedSemaphore(self.workers + queue)
+        self._pending = {}  # Renders in progress, shared by identical requests
+        # Reentrant, as a render that finishes at once calls _done() straight
+        # away from inside _run()
+        self._lock = threading.RLock()
+
+    def close(self):
+        self.pool.shutdown()
+
+    def _run(self, key, fn, *args):
+        '''
+        Returns the cached result for key, or runs fn(*args) in the pool.
+        Requests for a render already in progress wait for it rather than
+        starting another.
+
+        '''
+        svg = self.cache.get(key)
+        if svg is not None:
+            return svg, True
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None:
+                if self._slots.acquire(blocking = False) is False:
+                    raise RequestError(503, f'Render queue is full ({self.workers} workers, {self.queue} queued).')
+                future = self.pool.submit(fn, *args)
+                self._pending[key] = future
+                future.add_done_callback(lambda f: self._done(key))
+        svg = future.result()
+        self.cache.put(key, svg)
+        return svg, False
+
+    def _done(self, key):
+        with self._lock:
+            self._pending.pop(key, None)
+        self._slots.release()
+
+    def settings(self, params):
+        '''
+        Returns the server's settings with params laid over them.
+
+        '''
+        return sedlog.updateConfig(self.config, params, 'request')
+
+    def renderLog(self, body, kind, params = None):
+        '''
+        Renders a log given as CSV bytes (kind 'csv') or JSON units (kind
+        'json'). Returns the SVG and whether it came from the cache.
+
+        '''
+        config = self.settings(params or {})
+        units = body if kind == 'csv' else json.dumps(body, sort_keys = True)
+        key = FragmentCache.key('log', kind, json.dumps(config, sort_keys = True), units)
+        return self._run(key, _renderLog, body, kind, config)
+
+    def renderKey(self, params = None, present = None):
+        '''
+        Renders the facies key, optionally of only the codes in present.
+
+        '''
+        config = self.settings(params or {})
+        key = FragmentCache.key('key', json.dumps(config, sort_keys = True), json.dumps(present))
+        return self._run(key, _renderKey, config, present)
+
+    def status(self):
+        with self._lock:
+            in_progress = len(self._pending)
+        stats = self.metrics.snapshot()
+        stats.update(workers = self.workers,
+                     queue_limit = self.queue,
+                     in_progress = in_progress,
+                     cache = self.cache.stats())
+        return stats
+
+#%% HTTP
+
+def _parseQuery(query):
+    # Values are JSON where they parse and strings otherwise
+    params = {}
+    for k, v in urllib.parse.parse_qsl(query, keep_blank_values = True):
+        try:
+            params[k] = json.loads(v)
+        except ValueError:
+            params[k] = v
+    return params
+
+class RenderHandler(http.server.BaseHTTPRequestHandler):
+    '''
+    Request handler for a RenderService, which must be set as the service
+    attribute of the server.
+    '''
+    server_version = 'sedlog'
+    max_body = 256 * 2**20
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status, body, content_type, extra = None):
+        body = body.encode('utf-8') if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for k, v in (extra or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, message, extra = None):
+        self._send(status, json.dumps({'error': message}), 'application/json', extra)
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > self.max_body:
+            raise RequestError(413, f'Request body is too large ({length} bytes, limit {self.max_body}).')
+        return self.rfile.read(length) if length else b''
+
+    def _handle(self):
+        url = urllib.parse.urlsplit(self.path)
+        service = self.server.service
+        params = _parseQuery(url.query)
+        if url.path == '/health':
+            return 'ok', 'text/plain', None
+        if url.path == '/metrics':
+            return json.dumps(service.status(), indent = 1), 'application/json', None
+        if url.path not in ('/render', '/key'):
+            raise RequestError(404, f'No such endpoint: {url.path}')
+        if((url.path == '/render') and (self.command != 'POST')):
+            raise RequestError(405, 'Send logs to /render with POST.')
+
+        body = self._body() if self.command == 'POST' else b''
+        is_json = 'json' in (self.headers.get('Content-Type') or '')
+        data = json.loads(body) if (is_json and body) else {}
+        if is_json:
+            params.update(data.get('params', {}))
+        if url.path == '/key':
+            svg, hit = service.renderKey(params, data.get('present'))
+        elif is_json:
+            svg, hit = service.renderLog(data.get('units', {}), 'json', params)
+        else:
+            svg, hit = service.renderLog(body, 'csv', params)
+        return svg, 'image/svg+xml', {'X-Cache': 'hit' if hit else 'miss'}
+
+    def _respond(self):
+        start = time.perf_counter()
+        endpoint = urllib.parse.urlsplit(self.path).path
+        try:
+            body, content_type, extra = self._handle()
+            status = 200
+            self._send(status, body, content_type, extra)
+        except RequestError as ex:
+            status = ex.status
+            self._error(status, str(ex), {'Retry-After': '1'} if status == 503 else None)
+        except Exception as ex:
+            # Bad logs and settings come back from the workers as exceptions
+            status = 400 if _isClientError(ex) else 500
+            self._error(status, f'{type(ex).__name__}: {" ".join(str(ex).split())}')
+        self.server.service.metrics.record(endpoint, status, time.perf_counter() - start)
+
+    do_GET = _respond
+    do_POST = _respond
+
+def serve(service, host = '127.0.0.1', port = 8150, verbose = False):
+    '''
+    Serves a RenderService over HTTP until interrupted. Each request is
+    handled in its own thread; renders are limited by the service's pool.
+
+    '''
+    server = http.server.ThreadingHTTPServer((host, port), RenderHandler)
+    server.daemon_threads = True
+    server.service = service
+    server.verbose = verbose
+    print(f'Serving on http://{host}:{server.server_address[1]} with {service.workers} workers')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+#%% Load testing
+
+def loadTest(url, body, requests = 100, concurrency = 8, content_type = 'text/csv', vary = False):
+    '''
+    Sends the same render request many times at once and times the replies.
+
+    Parameters
+    ----------
+    url : str
+        Full URL to send to, e.g. 'http://127.0.0.1:8150/render'.
+    body : bytes
+        Request body.
+    requests : int, optional
+        Number of requests to send. The default is 100.
+    concurrency : int, optional
+        Number of requests in flight at once. The default is 8.
+    content_type : str, optional
+        Content type of the body. The default is 'text/csv'.
+    vary : bool, optional
+        Give each request a different vscale so none come from the cache.
+        The default is False.
+
+    Returns
+    -------
+    results : dict
+        Counts of each status, latency percentiles (ms) and throughput.
+
+    '''
+    def send(i):
+        target = f'{url}{"&" if "?" in url else "?"}vscale={250 + i}' if vary else url
+        req = urllib.request.Request(target, data = body, headers = {'Content-Type': content_type})
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req) as reply:
+                reply.read()
+                status = reply.status
+        except urllib.error.HTTPError as ex:
+            status = ex.code
+        return status, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers = concurrency) as pool:
+        replies = list(pool.map(send, range(requests)))
+    wall = time.perf_counter() - start
+    ms = np.array([s for _, s in replies]) * 1000
+    return {'requests': requests,
+            'status': dict(collections.Counter(status for status, _ in replies)),
+            'seconds': wall,
+            'throughput_rps': requests/wall,
+            'latency_ms': {'mean': float(ms.mean()),
+                           'p50': float(np.percentile(ms, 50)),
+                           'p95': float(np.percentile(ms, 95)),
+                           'max': float(ms.max())}}
+
+#%% Command line
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog = 'server',
+                                     description = 'Serve log rendering over HTTP on this machine.')
+    parser.add_argument('-c', '--config', help = 'JSON config file (as for sedlog.py) giving default settings')
+    parser.add_argument('--host', default = '127.0.0.1', help = 'Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('-p', '--port', type = int, default = 8150, help = 'Port to listen on (default: 8150)')
+    parser.add_argument('-j', '--jobs', type = int, default = None, help = 'Worker processes (default: one per core)')
+    parser.add_argument('-q', '--queue', type = int, default = 16, help = 'Renders allowed to wait for a worker (default: 16)')
+    parser.add_argument('--cache-mb', type = float, default = 256, help = 'Size of the result cache in MB (default: 256)')
+    parser.add_argument('-v', '--verbose', action = 'store_true', help = 'Log every request')
+    parser.add_argument('--load', metavar = 'CSV', help = 'Load test a running server with this log instead of serving')
+    parser.add_argument('--requests', type = int, default = 100, help = 'Requests to send when load testing (default: 100)')
+    parser.add_argument('--concurrency', type = int, default = 8, help = 'Requests in flight when load testing (default: 8)')
+    parser.add_argument('--vary', action = 'store_true', help = 'Avoid the cache when load testing')
+    args = parser.parse_args(argv)
+
+    if args.load is not None:
+        with open(args.load, 'rb') as f:
+            body = f.read()
+        results = loadTest(f'http://{args.host}:{args.port}/render', body,
+                           args.requests, args.concurrency, vary = args.vary)
+        print(json.dumps(results, indent = 1))
+        return 0 if set(results['status']) == {200} else 1
+
+    service = RenderService(sedlog.loadConfig(args.config), args.jobs, args.queue,
+                            int(args.cache_mb * 2**20))
+    serve(service, args.host, args.port, args.verbose)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
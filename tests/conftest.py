@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""
+Shared setup for the sed log maker tests. The modules live at the top of the
+repo, so it is put on the path, and the example logs are offered as fixtures.
+"""
+
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import drawings as dr
+
+@pytest.fixture(scope = 'session')
+def long_src():
+    '''
+    examples/test_long.csv, with blanks filled as the notebook does.
+
+    '''
+    return pd.read_csv(os.path.join(ROOT, 'examples', 'test_long.csv')).fillna('NaN')
+
+@pytest.fixture(scope = 'session')
+def long_log(long_src):
+    '''
+    examples/test_long.csv as a drawings.Log.
+
+    '''
+    return dr.Log().setData(dr.elevs(long_src['thickness']), long_src['gs_base'],
+                            long_src['gs_top'], long_src['code'])
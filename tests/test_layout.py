@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of label placement (layout.placeLabels).
+"""
+
+import numpy as np
+import pytest
+
+import drawings as dr
+import layout
+import scales
+
+COLHEIGHT = 747
+ORIG = 40
+SIZE = 9
+
+def randomUnits(n, cols, seed = 0):
+    rng = np.random.default_rng(seed)
+    units = np.zeros(n, dtype = layout.unit_dtype)
+    units['lcol'] = rng.integers(0, cols, n)
+    units['ly'] = rng.uniform(ORIG, COLHEIGHT + ORIG, n)
+    units['ldelta'] = rng.uniform(0, 20, n)
+    return units
+
+def assertPlaced(units, keep, ly, size = SIZE, max_shift = SIZE):
+    # Kept labels are at least a label height apart in each column, moved no
+    # further than max_shift and not pushed off the top of their column
+    a = units['ly'][keep]
+    y = ly[keep]
+    cols = units['lcol'][keep]
+    order = np.lexsort((y, cols))
+    same_col = cols[order][1:] == cols[order][:-1]
+    gaps = np.diff(y[order])[same_col]
+    assert np.all(gaps >= size * (1 - 1e-9))
+    assert np.all(y - a >= 0)
+    assert np.all(y - a <= max_shift)
+    top = COLHEIGHT + ORIG - size/2
+    assert np.all((y == a) | (y <= top))
+    # Labels not drawn are left where they were
+    assert np.array_equal(ly[~keep], units['ly'][~keep])
+
+def test_no_overlaps_million_labels():
+    units = randomUnits(10**6, 50)
+    keep, ly = layout.placeLabels(units, np.ones(len(units), dtype = bool), COLHEIGHT, ORIG)
+    assert keep.sum() > 0
+    assertPlaced(units, keep, ly)
+
+def test_unmoved_labels_stay_exactly_beside_units():
+    units = randomUnits(10**5, 20, seed = 1)
+    keep, ly = layout.placeLabels(units, np.ones(len(units), dtype = bool), COLHEIGHT, ORIG)
+    moved = keep & (ly != units['ly'])
+    # Any movement is a real push, not rounding
+    assert np.all(ly[moved] - units['ly'][moved] > 1e-6)
+
+def test_columns_placed_independently():
+    units = randomUnits(10**5, 30, seed = 2)
+    keep, ly = layout.placeLabels(units, np.ones(len(units), dtype = bool), COLHEIGHT, ORIG)
+    for c in range(30):
+        mine = units['lcol'] == c
+        k, y = layout.placeLabels(units, mine, COLHEIGHT, ORIG)
+        assert np.array_equal(keep[mine], k[mine])
+        assert np.array_equal(ly[mine], y[mine])
+
+def test_example_log_columns_placed_independently(long_log):
+    vscale = scales.asScale(100)
+    _, height = dr.pageSize(2000, 210)
+    colwidth = long_log.gs_widths[len(long_log.gs_widths)-1]
+    colheight, _ = dr._fitColumns(long_log.elevations[len(long_log.elevations)-1], vscale, height)
+    units, _ = layout.computeLayout(long_log.elevations, long_log.base_w, long_log.top_w, vscale,
+                                    colheight, long_log.colspc, long_log.orig, colwidth)
+    keep, ly = layout.placeLabels(units, np.ones(len(units), dtype = bool), colheight, long_log.orig)
+    for c in np.unique(units['lcol']):
+        mine = units['lcol'] == c
+        k, y = layout.placeLabels(units, mine, colheight, long_log.orig)
+        assert np.array_equal(keep[mine], k[mine])
+        assert np.array_equal(ly[mine], y[mine])
+
+@pytest.mark.parametrize('n', [2, 3, 8])
+def test_labels_at_same_position(n):
+    # Only as many labels as fit within max_shift of the shared anchor are
+    # kept, those of the thickest units, stacked a label height apart
+    units = np.zeros(n, dtype = layout.unit_dtype)
+    units['ly'] = 100.0
+    units['ldelta'] = np.arange(n)[::-1] + 1.0
+    keep, ly = layout.placeLabels(units, np.ones(n, dtype = bool), COLHEIGHT, ORIG)
+    assert np.array_equal(np.flatnonzero(keep), [0, 1])
+    assert sorted(ly[keep]) == [100.0, 100.0 + SIZE]
+    assertPlaced(units, keep, ly)
+
+def test_labels_at_same_position_in_different_columns():
+    units = np.zeros(4, dtype = layout.unit_dtype)
+    units['ly'] = 100.0
+    units['lcol'] = [0, 1, 2, 3]
+    keep, ly = layout.placeLabels(units, np.ones(4, dtype = bool), COLHEIGHT, ORIG)
+    assert keep.all()
+    assert np.array_equal(ly, units['ly'])
+
+def test_labels_at_top_of_column():
+    units = np.zeros(3, dtype = layout.unit_dtype)
+    units['ly'] = COLHEIGHT + ORIG - SIZE/2
+    units['ldelta'] = [1.0, 3.0, 2.0]
+    keep, ly = layout.placeLabels(units, np.ones(3, dtype = bool), COLHEIGHT, ORIG)
+    # Nothing can be pushed up, so only the thickest unit keeps its label
+    assert np.array_equal(np.flatnonzero(keep), [1])
+    assertPlaced(units, keep, ly)
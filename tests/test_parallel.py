@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+Tests that drawing in several processes gives the same SVG as drawing in one.
+"""
+
+import io
+import re
+
+import pytest
+
+import drawings as dr
+
+def elements(svg):
+    # Element ids depend on which process drew an element, so are left out
+    return sorted(re.sub(r'(id="|#)[^"]*"', r'\1"', line) for line in svg.splitlines())
+
+def drawn(lg, jobs, vscale, page, labels, precision = None):
+    out = io.StringIO()
+    with dr.canvas(*page, out = out, precision = precision) as canv:
+        lg.draw(canv, vscale, labels = labels, jobs = jobs)
+    return out.getvalue()
+
+@pytest.mark.parametrize('vscale, page, labels', [(100, (2000, 210), 'facies'),
+                                                  (250, (600, 210), 'numbers'),
+                                                  (100, (2000, 210), None)])
+def test_columns_parallel_matches_serial(long_log, vscale, page, labels):
+    serial = drawn(long_log, 1, vscale, page, labels)
+    parallel = drawn(long_log, 4, vscale, page, labels)
+    assert serial.count('<text') > 0 or labels is None
+    assert elements(parallel) == elements(serial)
+
+def test_columns_parallel_matches_serial_compact(long_log):
+    serial = drawn(long_log, 1, 100, (2000, 210), 'facies', precision = 2)
+    parallel = drawn(long_log, 4, 100, (2000, 210), 'facies', precision = 2)
+    assert elements(parallel) == elements(serial)
+
+def test_pages_parallel_matches_serial(long_src, tmp_path):
+    gs_codes, gs_widths = dr.grainsize()
+    fcodes, fcolors = dr.faciesList()
+    pages = {}
+    for jobs in (1, 2):
+        paths = dr.drawLogPages(dr.elevs(long_src['thickness']), 100,
+                                long_src['gs_base'], long_src['gs_top'], long_src['code'],
+                                gs_codes, gs_widths, fcodes, fcolors,
+                                out = str(tmp_path / f'j{jobs}_{{page}}.svg'),
+                                labels = 'facies', jobs = jobs)
+        pages[jobs] = [open(p).read() for p in paths]
+    assert len(pages[1]) > 1
+    assert [elements(p) for p in pages[2]] == [elements(p) for p in pages[1]]